@@ -0,0 +1,150 @@
+"""
+Runtime configuration read from environment variables.
+Values can be overridden through backend/.env (see docker-compose.yml).
+"""
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    """Read a boolean flag from the environment ("1", "true", "yes", "on")."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# LLM request coalescing
+# Share one upstream call between identical concurrent requests in other workers too
+LLM_COALESCE_CROSS_WORKER = _env_bool("LLM_COALESCE_CROSS_WORKER", False)
+# How long a follower waits for another worker's call before calling upstream itself
+LLM_COALESCE_WAIT_SECONDS = float(os.getenv("LLM_COALESCE_WAIT_SECONDS", "90"))
+# How long a finished call's result stays available to late followers in other workers
+LLM_COALESCE_RESULT_TTL_SECONDS = float(os.getenv("LLM_COALESCE_RESULT_TTL_SECONDS", "5"))
+
+# Password hashing
+# bcrypt cost factor; stored hashes with a different cost are rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Processes dedicated to bcrypt in each uvicorn worker (0 hashes on the request thread)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "1"))
+# Hashing jobs allowed to wait for a free process before requests get a 503
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "8"))
+
+# Authentication caches
+# Entries kept in each of the verified-token and known-user LRU caches
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+# How long a user id is trusted to exist before it is checked against the database again
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+
+# Anonymous user garbage collection
+ANON_REAPER_ENABLED = _env_bool("ANON_REAPER_ENABLED", True)
+# Anonymous users with no activity for this many days are deleted with all their data
+ANON_USER_RETENTION_DAYS = int(os.getenv("ANON_USER_RETENTION_DAYS", "30"))
+# Seconds between reaper runs
+ANON_REAPER_INTERVAL_SECONDS = float(os.getenv("ANON_REAPER_INTERVAL_SECONDS", "3600"))
+# Users deleted per transaction, and the pause between transactions
+ANON_REAPER_BATCH_SIZE = int(os.getenv("ANON_REAPER_BATCH_SIZE", "200"))
+ANON_REAPER_BATCH_PAUSE_SECONDS = float(os.getenv("ANON_REAPER_BATCH_PAUSE_SECONDS", "0.5"))
+# Free pages returned to the filesystem after each run (PRAGMA incremental_vacuum)
+ANON_REAPER_VACUUM_PAGES = int(os.getenv("ANON_REAPER_VACUUM_PAGES", "2000"))
+
+# Response compression
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+# Admission control for LLM-backed routes
+# Token buckets shared by all workers: sustained requests per minute and burst size
+LLM_USER_RATE_PER_MINUTE = float(os.getenv("LLM_USER_RATE_PER_MINUTE", "10"))
+LLM_USER_BURST = float(os.getenv("LLM_USER_BURST", "5"))
+LLM_GLOBAL_RATE_PER_MINUTE = float(os.getenv("LLM_GLOBAL_RATE_PER_MINUTE", "300"))
+LLM_GLOBAL_BURST = float(os.getenv("LLM_GLOBAL_BURST", "50"))
+# LLM requests a worker serves at once before shedding load with 503
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+
+# Sampling profiler (see app/utils/profiling.py)
+PROFILER_ENABLED = _env_bool("PROFILER_ENABLED", False)
+# Requests carrying this value in X-Profile-Token are always profiled
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+# Fraction of all other requests that are profiled (0 disables random sampling)
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+# Seconds between stack samples
+PROFILER_INTERVAL_SECONDS = float(os.getenv("PROFILER_INTERVAL_SECONDS", "0.005"))
+# Most recent profiles kept on disk
+PROFILER_MAX_PROFILES = int(os.getenv("PROFILER_MAX_PROFILES", "50"))
+PROFILER_DIR = os.getenv("PROFILER_DIR", os.path.join(os.getenv("DATA_DIR", "/app/data"), "profiles"))
+
+# Statements slower than this are logged with their query plan (see app/utils/query_stats.py)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# Fake LLM for load tests and trace replay: schema-shaped placeholder answers, no OpenAI calls
+LLM_FAKE = _env_bool("LLM_FAKE", False)
+# Simulated upstream latency of each fake call
+LLM_FAKE_LATENCY_SECONDS = float(os.getenv("LLM_FAKE_LATENCY_SECONDS", "0"))
+
+# Request trace capture for replay (see app/utils/traces.py and benchmarks/replay.py)
+TRACE_CAPTURE_ENABLED = _env_bool("TRACE_CAPTURE_ENABLED", False)
+# Fraction of requests recorded
+TRACE_CAPTURE_SAMPLE_RATE = float(os.getenv("TRACE_CAPTURE_SAMPLE_RATE", "1"))
+TRACE_CAPTURE_DIR = os.getenv("TRACE_CAPTURE_DIR", os.path.join(os.getenv("DATA_DIR", "/app/data"), "traces"))
+# Each worker's trace file rotates at this size, keeping this many old files
+TRACE_CAPTURE_MAX_BYTES = int(os.getenv("TRACE_CAPTURE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_CAPTURE_BACKUPS = int(os.getenv("TRACE_CAPTURE_BACKUPS", "5"))
+
+# Users whose wearable features each worker keeps cached (see app/utils/wearable_features.py)
+WEARABLE_FEATURE_CACHE_SIZE = int(os.getenv("WEARABLE_FEATURE_CACHE_SIZE", "4096"))
+
+# Text columns compressed at rest (see app/utils/text_compression.py)
+# Values shorter than this (in UTF-8 bytes) are stored as plain text
+TEXT_COMPRESSION_MIN_BYTES = int(os.getenv("TEXT_COMPRESSION_MIN_BYTES", "64"))
+# zstd level, and the zlib level used when zstandard is not installed
+TEXT_COMPRESSION_LEVEL = int(os.getenv("TEXT_COMPRESSION_LEVEL", "3"))
+TEXT_COMPRESSION_ZLIB_LEVEL = int(os.getenv("TEXT_COMPRESSION_ZLIB_LEVEL", "6"))
+
+# Raw wearable retention (see app/utils/wearable_rollups.py); runs with the anonymous user reaper
+# Raw uploads for days older than this are trimmed once rolled up (0 keeps everything)
+WEARABLE_RAW_RETENTION_DAYS = int(os.getenv("WEARABLE_RAW_RETENTION_DAYS", "90"))
+# "downsample" keeps the one upload per day the daily rollup came from, "drop" deletes them all
+WEARABLE_RAW_RETENTION_MODE = os.getenv("WEARABLE_RAW_RETENTION_MODE", "downsample")
+
+# Bulk health export imports (see app/utils/health_import.py)
+WEARABLE_IMPORT_DIR = os.getenv("WEARABLE_IMPORT_DIR", os.path.join(os.getenv("DATA_DIR", "/app/data"), "imports"))
+# Largest accepted export file
+WEARABLE_IMPORT_MAX_BYTES = int(os.getenv("WEARABLE_IMPORT_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Imports each worker runs at once; further uploads wait in the queue
+WEARABLE_IMPORT_WORKERS = int(os.getenv("WEARABLE_IMPORT_WORKERS", "1"))
+
+# Condensed journal entries for counseling context (see app/utils/journal_summaries.py)
+# Entries up to this many tokens are sent in full and never summarized
+JOURNAL_SUMMARY_MIN_TOKENS = int(os.getenv("JOURNAL_SUMMARY_MIN_TOKENS", "150"))
+# Length asked of each summary
+JOURNAL_SUMMARY_MAX_WORDS = int(os.getenv("JOURNAL_SUMMARY_MAX_WORDS", "60"))
+# Summaries each worker requests at once; further entries wait in the queue
+JOURNAL_SUMMARY_WORKERS = int(os.getenv("JOURNAL_SUMMARY_WORKERS", "2"))
+# Tokens of journal context a counseling conversation starts with
+COUNSELING_JOURNAL_TOKEN_BUDGET = int(os.getenv("COUNSELING_JOURNAL_TOKEN_BUDGET", "1200"))
+
+# Check-in analysis with the local recommender (see app/utils/fast_recommender.py)
+# Seconds /check-in/analyze waits for the LLM before answering from the local recommender
+CHECK_IN_LLM_TIMEOUT_SECONDS = float(os.getenv("CHECK_IN_LLM_TIMEOUT_SECONDS", "8"))
+# Refine mode=fast check-ins with the LLM in the background
+CHECK_IN_FAST_REFINE = _env_bool("CHECK_IN_FAST_REFINE", True)
+# Check-in LLM calls each worker runs at once, in requests and background refinements together
+CHECK_IN_LLM_WORKERS = int(os.getenv("CHECK_IN_LLM_WORKERS", "16"))
+
+# Personalized intervention ranking (see app/utils/intervention_affinity.py)
+# Days for a completion's weight in a user's intervention affinity to halve
+INTERVENTION_AFFINITY_HALF_LIFE_DAYS = float(os.getenv("INTERVENTION_AFFINITY_HALF_LIFE_DAYS", "14"))
+# Users whose affinity rows each worker keeps cached
+INTERVENTION_AFFINITY_CACHE_SIZE = int(os.getenv("INTERVENTION_AFFINITY_CACHE_SIZE", "4096"))
+# Seconds between recomputations of item-item co-completion similarity in each worker
+INTERVENTION_SIMILARITY_REFRESH_SECONDS = float(os.getenv("INTERVENTION_SIMILARITY_REFRESH_SECONDS", "3600"))
+# Weight of personal scores against recommendation rank when re-ranking check-in recommendations (0 disables)
+INTERVENTION_AFFINITY_RERANK_WEIGHT = float(os.getenv("INTERVENTION_AFFINITY_RERANK_WEIGHT", "0.5"))
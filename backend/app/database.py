@@ -1,22 +1,46 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from app.utils.query_stats import instrument_engine
+
 # Use /app/data directory for persistent storage in Docker
-DATA_DIR = "/app/data"
-os.makedirs(DATA_DIR, exist_ok=True)
+# (created by the migration step, see app/migrations.py)
+DATA_DIR = os.getenv("DATA_DIR", "/app/data")
 
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DATA_DIR}/app.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # New databases free pages incrementally (see PRAGMA incremental_vacuum);
+    # existing ones switch over after a one-time VACUUM in app/migrations.py
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    cursor.close()
+
+
+# Per-request statement counts and the slow-query log
+instrument_engine(engine)
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
+def create_missing_indexes():
+    """Create indexes declared on models that predate them (create_all skips existing tables)."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -1,18 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.datastructures import Default
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine
-from app.models import Base  # Import Base from models to ensure all models are registered
-from app.routers import auth, llm, wearable, journaling, counseling, library
+from app import config
+from app.routers import auth, llm, wearable, journaling, counseling, library, admin
+from app.utils.reaper import start_reaper, stop_reaper
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.utils.profiling import PROFILE_ID_HEADER, ProfilingMiddleware
+from app.utils.query_stats import QueryStatsMiddleware
+from app.utils.responses import FastJSONResponse, CompressionMiddleware
+from app.utils.traces import TraceCaptureMiddleware
+
+# Database tables are created by the one-time migration step
+# (python -m app.migrations), not in every worker at import time
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background jobs run in every worker for the lifetime of the app
+    start_reaper()
+    yield
+    stop_reaper()
 
-# Create database tables (checkfirst=True is default, but explicit for clarity)
-# This safely handles the case where tables already exist
-Base.metadata.create_all(bind=engine, checkfirst=True)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Dora Project API",
     description="Backend API for the Dora mental health intervention app",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # Wrapped in Default() so routes with a response_model keep FastAPI's
+    # Pydantic-to-bytes fast path; other routes render with FastJSONResponse
+    default_response_class=Default(FastJSONResponse)
 )
 
 # Configure CORS
@@ -29,8 +48,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, PROFILE_ID_HEADER],
 )
 
+app.add_middleware(QueryStatsMiddleware)
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=config.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=config.GZIP_LEVEL,
+    brotli_quality=config.BROTLI_QUALITY,
+)
+
+# Outside compression, so traces record the bytes actually sent
+if config.TRACE_CAPTURE_ENABLED:
+    app.add_middleware(TraceCaptureMiddleware, sample_rate=config.TRACE_CAPTURE_SAMPLE_RATE)
+
+# Outermost, so profiles cover the other middleware too
+if config.PROFILER_ENABLED:
+    app.add_middleware(
+        ProfilingMiddleware,
+        token=config.PROFILER_TOKEN,
+        sample_rate=config.PROFILER_SAMPLE_RATE,
+        interval=config.PROFILER_INTERVAL_SECONDS,
+    )
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(llm.router)
@@ -38,6 +80,7 @@ app.include_router(wearable.router)
 app.include_router(journaling.router)
 app.include_router(counseling.router)
 app.include_router(library.router)
+app.include_router(admin.router)
 
 
 @app.get("/")
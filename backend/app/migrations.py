@@ -0,0 +1,85 @@
+"""
+One-time schema setup, run once before the app workers start:
+
+    python -m app.migrations
+
+Creates the data directory, missing tables, columns and indexes (including
+the journal full-text index), rolls up wearable uploads that predate rollups
+or their payload format, normalizes the recommendations of older check-ins, and switches existing
+databases to incremental auto_vacuum. Running it again is a no-op.
+"""
+import os
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from app.database import DATA_DIR, SessionLocal, engine, create_missing_indexes
+from app.models import Base  # Import Base from models to ensure all models are registered
+from app.utils.health_import import fail_interrupted_jobs
+from app.utils.journal_search import create_search_index
+from app.utils.recommendations import backfill_recommendations
+from app.utils.wearable_dedup import compact_wearable_duplicates
+from app.utils.wearable_rollups import reparse_empty_rollups, rollup_pending_uploads
+
+
+def _add_missing_columns() -> None:
+    """Add columns declared on models after their table was created (create_all skips existing tables)."""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    # New columns must be nullable or carry a server default
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def _index_exists(table: str, name: str) -> bool:
+    return any(index["name"] == name for index in inspect(engine).get_indexes(table))
+
+
+def run_migrations() -> None:
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    # Create database tables (checkfirst=True is default, but explicit for clarity)
+    Base.metadata.create_all(bind=engine, checkfirst=True)
+    _add_missing_columns()
+
+    # Uploads stored before content hashing must be hashed and deduplicated
+    # before the unique (user_id, content_hash) index can be built
+    if not _index_exists("wearable_data", "ux_wearable_data_user_hash"):
+        db = SessionLocal()
+        try:
+            compact_wearable_duplicates(db)
+        finally:
+            db.close()
+
+    create_missing_indexes()
+    with engine.begin() as connection:
+        create_search_index(connection)
+
+    # Uploads stored before rollups existed (a no-op once every upload has its day),
+    # days rolled up before their payload format was recognized, and check-ins
+    # stored before their recommendations were normalized
+    db = SessionLocal()
+    try:
+        rollup_pending_uploads(db)
+        reparse_empty_rollups(db)
+        backfill_recommendations(db)
+    finally:
+        db.close()
+
+    # Runs before any worker starts, so unfinished imports were cut off by the restart
+    fail_interrupted_jobs()
+
+    # Databases created before incremental auto_vacuum need one full VACUUM to switch modes
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if connection.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+            connection.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+            connection.execute(text("VACUUM"))
+
+
+if __name__ == "__main__":
+    print("Running database migrations...")
+    run_migrations()
+    print("✓ Database schema is up to date")
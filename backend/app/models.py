@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Text, ForeignKey, Float, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
+from app.utils.text_compression import CompressedText
 
 
 class User(Base):
@@ -13,6 +14,7 @@ class User(Base):
     hashed_password = Column(String, nullable=True)
     is_anonymous = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime, nullable=True)  # Last authenticated request, hourly resolution
     
     # Relationships
     check_ins = relationship("CheckIn", back_populates="user", cascade="all, delete-orphan")
@@ -24,10 +26,14 @@ class User(Base):
 
 class CheckIn(Base):
     __tablename__ = "check_ins"
+    __table_args__ = (
+        # Keyset pagination of a user's history, newest first
+        Index("ix_check_ins_user_created", "user_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    check_in_data = Column(Text, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    check_in_data = Column(CompressedText("check_ins.check_in_data"), nullable=True)
     sanitized_text = Column(Text, nullable=True)
     recommended_intervention_ids = Column(String, nullable=True)
     ai_reasoning = Column(Text, nullable=True)
@@ -37,24 +43,103 @@ class CheckIn(Base):
     user = relationship("User", back_populates="check_ins")
 
 
+class CheckInRecommendation(Base):
+    __tablename__ = "check_in_recommendations"
+    __table_args__ = (
+        # Per-user deletes and the per-user conversion query; covers the first-recommendation lookup
+        Index("ix_check_in_recommendations_user_intervention", "user_id", "intervention_id", "created_at"),
+        # Global counts per intervention
+        Index("ix_check_in_recommendations_intervention", "intervention_id"),
+    )
+
+    check_in_id = Column(Integer, ForeignKey("check_ins.id"), primary_key=True)
+    rank = Column(Integer, primary_key=True)  # 1 is the first recommended
+    intervention_id = Column(String, nullable=False)  # ID references JSON file, not FK
+    # Copied from the check-in so analytics never join check_ins
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+
 class WearableData(Base):
     __tablename__ = "wearable_data"
+    __table_args__ = (
+        # Latest upload of a user, newest first
+        Index("ix_wearable_data_user_created", "user_id", "created_at", "id"),
+        # Re-posting an identical payload is a no-op
+        Index("ux_wearable_data_user_hash", "user_id", "content_hash", unique=True),
+        # Raw-data retention sweeps by day
+        Index("ix_wearable_data_day", "day"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    wearable_data = Column(Text, nullable=False)  # Store as JSON string
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    wearable_data = Column(CompressedText("wearable_data.wearable_data"), nullable=False)  # Store as JSON string
+    content_hash = Column(String, nullable=True)  # sha256 of the canonical JSON (see app/utils/wearable_dedup.py)
+    day = Column(Date, nullable=True)  # Day the payload describes, set once rolled up (see app/utils/wearable_rollups.py)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="wearable_data")
 
 
+class WearableDailyRollup(Base):
+    __tablename__ = "wearable_daily_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    source_id = Column(Integer, nullable=False)  # wearable_data row the values come from (newest upload of the day)
+    hr_min = Column(Float, nullable=True)
+    hr_mean = Column(Float, nullable=True)
+    hr_max = Column(Float, nullable=True)
+    steps = Column(Float, nullable=True)
+    sleep_hours = Column(Float, nullable=True)
+    active_minutes = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class WearableWeeklyRollup(Base):
+    __tablename__ = "wearable_weekly_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    week_start = Column(Date, primary_key=True)  # Monday
+    days = Column(Integer, nullable=False)  # Days of the week with data
+    hr_min = Column(Float, nullable=True)
+    hr_mean = Column(Float, nullable=True)
+    hr_max = Column(Float, nullable=True)
+    steps_total = Column(Float, nullable=True)
+    sleep_hours_total = Column(Float, nullable=True)
+    active_minutes_total = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class WearableImportJob(Base):
+    __tablename__ = "wearable_import_jobs"
+
+    id = Column(String, primary_key=True)  # Random hex, also names the uploaded file
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    format = Column(String, nullable=False)  # "apple_health" or "csv"
+    status = Column(String, nullable=False, default="queued")  # "queued", "running", "done", "failed"
+    bytes_total = Column(Integer, nullable=False, default=0)
+    bytes_read = Column(Integer, nullable=False, default=0)
+    records_read = Column(Integer, nullable=False, default=0)
+    days_imported = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
 class JournalEntry(Base):
     __tablename__ = "journal_entries"
+    __table_args__ = (
+        # Keyset pagination of a user's history, newest first
+        Index("ix_journal_entries_user_created", "user_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    journal_description = Column(Text, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    journal_description = Column(CompressedText("journal_entries.journal_description"), nullable=False)
+    # Condensed form for counseling context, written in the background (see app/utils/journal_summaries.py)
+    summary = Column(Text, nullable=True)
     expiration_type = Column(String, nullable=False)  # "7_days", "30_days", "delete_manually"
     created_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime, nullable=True)
@@ -65,12 +150,18 @@ class JournalEntry(Base):
 
 class UserIntervention(Base):
     __tablename__ = "user_interventions"
+    __table_args__ = (
+        # Completion lookups by (user, intervention), e.g. recommendation conversion
+        Index("ix_user_interventions_user_intervention", "user_id", "intervention_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     intervention_id = Column(String, nullable=False)  # ID references JSON file, not FK
     times_completed = Column(Integer, default=0)
     last_completed_at = Column(DateTime, nullable=True)
+    # Completions with recency decay as of last_completed_at (see app/utils/intervention_affinity.py)
+    affinity = Column(Float, nullable=True)
     
     # Relationships
     user = relationship("User", back_populates="user_interventions")
@@ -78,12 +169,51 @@ class UserIntervention(Base):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Keyset pagination of a user's history, newest first
+        Index("ix_conversations_user_created", "user_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    messages = Column(Text, nullable=False)  # JSON array of messages
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    messages = Column(CompressedText("conversations.messages"), nullable=False)  # JSON array of messages
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="conversations")
+
+
+class LLMCallLock(Base):
+    __tablename__ = "llm_call_locks"
+
+    key = Column(String, primary_key=True)  # sha256 of (model, schema_name, messages)
+    result = Column(Text, nullable=True)  # JSON result, set once the leader's call finishes
+    owner = Column(String, nullable=True)  # Random token of the leader call holding the row
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    resource = Column(String, primary_key=True)  # "journal", "wearable", "interventions"
+    version = Column(Integer, nullable=False, default=0)  # Bumped by every write to the resource
+
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String, primary_key=True)  # "global" or "user:<id>"
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # Unix time of the last refill
+
+
+class CompressionDictionary(Base):
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(Integer, primary_key=True)  # zstd dictionary id is this plus 32768
+    column_key = Column(String, nullable=False)  # "<table>.<column>" the dictionary was trained on
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,55 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.schemas import InterventionConversion
+
+from app.utils.admission import get_admission_stats
+from app.utils.auth import require_admin
+from app.utils.llm_utils import get_coalesce_stats
+from app.utils.profiling import FORMATS, profile_store
+from app.utils.recommendations import conversion_report
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/stats")
+def get_stats():
+    """
+    Operational counters for the worker that serves this request.
+    Each uvicorn worker keeps its own counters.
+    """
+    return {
+        "llm_coalescing": get_coalesce_stats(),
+        "llm_admission": get_admission_stats()
+    }
+
+
+@router.get("/recommendations", response_model=List[InterventionConversion])
+def get_recommendation_conversion(db: Session = Depends(get_db)):
+    """
+    Recommendation-to-completion conversion per intervention across all users,
+    most recommended first.
+    """
+    return conversion_report(db)
+
+
+@router.get("/profiles")
+def list_profiles():
+    """Recent request profiles from all workers, newest first."""
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}/{fmt}")
+def download_profile(profile_id: str, fmt: str):
+    """
+    Download a profile as speedscope JSON (open at https://www.speedscope.app)
+    or as a pstats file (load with pstats.Stats or snakeviz).
+    """
+    path = profile_store.path(profile_id, fmt)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=profile_id + FORMATS[fmt])
@@ -3,7 +3,11 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User
 from app.schemas import LoginRequest, LoginResponse, RegisterRequest, RegisterResponse, AccountWipeRequest, AccountWipeResponse
-from app.utils.auth import verify_password, get_password_hash, create_access_token
+from app.utils.accounts import delete_users
+from app.utils.auth import (
+    verify_password_and_update, get_password_hash, create_access_token, account_stamp,
+    get_current_user_id, ensure_same_user, invalidate_user
+)
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -26,7 +30,9 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
         db.commit()
         db.refresh(new_user)
         
-        token = create_access_token(data={"sub": str(new_user.id), "device_id": request.device_id})
+        token = create_access_token(
+            data={"sub": str(new_user.id), "acct": account_stamp(new_user.created_at), "device_id": request.device_id}
+        )
         return LoginResponse(
             token=token,
             user_id=new_user.id,
@@ -44,11 +50,19 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not verify_password(request.password, user.hashed_password):
+    valid, new_hash = verify_password_and_update(request.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Transparently rehash when the configured bcrypt cost has changed
+    if new_hash:
+        user.hashed_password = new_hash
+        db.commit()
+    
     # Create token
-    token = create_access_token(data={"sub": str(user.id), "device_id": request.device_id})
+    token = create_access_token(
+        data={"sub": str(user.id), "acct": account_stamp(user.created_at), "device_id": request.device_id}
+    )
     
     return LoginResponse(
         token=token,
@@ -87,7 +101,9 @@ def register(request: RegisterRequest, db: Session = Depends(get_db)):
     db.refresh(new_user)
     
     # Create token
-    token = create_access_token(data={"sub": str(new_user.id), "device_id": request.device_id})
+    token = create_access_token(
+        data={"sub": str(new_user.id), "acct": account_stamp(new_user.created_at), "device_id": request.device_id}
+    )
     
     return RegisterResponse(
         token=token,
@@ -97,20 +113,32 @@ def register(request: RegisterRequest, db: Session = Depends(get_db)):
 
 
 @router.delete("/account/wipe", response_model=AccountWipeResponse)
-def wipe_account(request: AccountWipeRequest, db: Session = Depends(get_db)):
+def wipe_account(
+    request: AccountWipeRequest,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
     """
     The "Panic Button." Permanently deletes the account and all associated records 
     from the database immediately.
     """
-    # Find the user
-    user = db.query(User).filter(User.id == request.user_id).first()
+    # Token subject must match the account being wiped
+    ensure_same_user(request.user_id, current_user_id)
+    
+    # Delete the user and all related records with set-based DELETEs in one transaction
+    # (the ORM cascade would load every child row into memory first)
+    try:
+        deleted = delete_users(db, [current_user_id])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     
-    if not user:
+    if not deleted:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Delete the user (cascading will delete all related records)
-    db.delete(user)
-    db.commit()
+    # Drop cached tokens so the wiped account cannot be used again
+    invalidate_user(current_user_id)
     
     return AccountWipeResponse(
         success=True,
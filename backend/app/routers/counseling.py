@@ -1,15 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session, load_only
 from datetime import datetime
+from typing import List, Optional
 import json
 
 from app.database import get_db
-from app.models import User, JournalEntry, Conversation
+from app.models import JournalEntry, Conversation
 from app.schemas import (
     StartCounselingRequest, StartCounselingResponse,
-    FollowUpRequest, FollowUpResponse
+    FollowUpRequest, FollowUpResponse, ConversationSummary
 )
+from app.utils.admission import llm_admission
+from app.utils.auth import get_current_user_id, ensure_same_user
+from app.utils.journal_summaries import journal_context
 from app.utils.llm_utils import structured_response
+from app.utils.pagination import keyset_page, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter(prefix="/counseling", tags=["Journaling Counseling"])
 
@@ -30,17 +35,21 @@ Your role is to help the user process their thoughts and feelings, whether they'
 CHAT_STYLE_PROMPT = """You are responding inside an active, back-and-forth chat with someone who may be under stress. Keep every reply under 80 words, use two short paragraphs (blank line between), and end with one gentle, open question. Keep language simple, validating, and focused on immediate emotional grounding or coping micro-actions."""
 
 
-@router.post("/start", response_model=StartCounselingResponse)
-def start_counseling(request: StartCounselingRequest, db: Session = Depends(get_db)):
+@router.post("/start", response_model=StartCounselingResponse, dependencies=[Depends(llm_admission)])
+def start_counseling(
+    request: StartCounselingRequest,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
     """
     Start a new counseling conversation. Can be based on journal entries or general support.
     If journal_entry_ids is provided, only those entries are used for context.
     If journal_entry_ids is None or empty, no journal context is included.
+    Long entries are sent in their condensed form, newest first, up to
+    COUNSELING_JOURNAL_TOKEN_BUDGET tokens; later turns resend only that.
     """
-    # Verify user exists
-    user = db.query(User).filter(User.id == request.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Token subject must match the requested user
+    ensure_same_user(request.user_id, current_user_id)
     
     # Get selected journal entries if IDs are provided
     journals = []
@@ -55,9 +64,8 @@ def start_counseling(request: StartCounselingRequest, db: Session = Depends(get_
     
     # Build initial message based on whether journals were selected
     if journals:
-        # Prepare journal summaries (without dates or identifying info)
-        journal_texts = [j.journal_description for j in journals]
-        journals_context = "\n---\n".join(journal_texts)
+        # Condensed entries under the token budget (without dates or identifying info)
+        journals_context = journal_context(journals)
         
         user_message = f"""Here are the user's journal entries for context:
 
@@ -121,14 +129,21 @@ Please provide an initial live-chat counseling reply (max 80 words, two short pa
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
-@router.post("/followup", response_model=FollowUpResponse)
-def followup_counseling(request: FollowUpRequest, db: Session = Depends(get_db)):
+@router.post("/followup", response_model=FollowUpResponse, dependencies=[Depends(llm_admission)])
+def followup_counseling(
+    request: FollowUpRequest,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
     """
     Continue an existing counseling conversation.
     """
-    # Get conversation
+    # Get conversation (only among the current user's conversations)
     conversation = db.query(Conversation)\
-        .filter(Conversation.id == request.conversation_id)\
+        .filter(
+            Conversation.id == request.conversation_id,
+            Conversation.user_id == current_user_id
+        )\
         .first()
     
     if not conversation:
@@ -180,3 +195,37 @@ def followup_counseling(request: FollowUpRequest, db: Session = Depends(get_db))
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+
+@router.get("/conversations", response_model=List[ConversationSummary])
+def list_conversations(
+    user_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Value of the X-Next-Cursor header from the previous page"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    A user's counseling conversations, newest first, one page at a time.
+    The X-Next-Cursor response header holds the cursor for the next page.
+    """
+    # Token subject must match the requested user
+    ensure_same_user(user_id, current_user_id)
+    
+    # Message blobs are not needed for the listing
+    query = db.query(Conversation)\
+        .options(load_only(Conversation.id, Conversation.created_at, Conversation.updated_at))\
+        .filter(Conversation.user_id == user_id)
+    conversations, next_cursor = keyset_page(query, Conversation, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    
+    return [
+        ConversationSummary(
+            conversation_id=conversation.id,
+            created_at=conversation.created_at,
+            updated_at=conversation.updated_at
+        )
+        for conversation in conversations
+    ]
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timedelta
 
 from app.database import get_db
-from app.models import JournalEntry, User
-from app.schemas import JournalCreateRequest, JournalEntry as JournalEntrySchema, SuccessResponse
+from app.models import JournalEntry
+from app.schemas import JournalCreateRequest, JournalEntry as JournalEntrySchema, JournalSearchResult, SuccessResponse
+from app.utils.auth import get_current_user_id, ensure_same_user
+from app.utils.journal_search import search
+from app.utils.journal_summaries import needs_summary, submit_summary
+from app.utils.pagination import keyset_page, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.utils.versions import JOURNAL, bump_version, get_version, make_etag, matching_etag, not_modified
 
 router = APIRouter(prefix="/journal", tags=["journal"])
 
@@ -13,7 +18,8 @@ router = APIRouter(prefix="/journal", tags=["journal"])
 @router.post("/create", response_model=SuccessResponse)
 def create_journal_entry(
     request: JournalCreateRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
 ):
     """
     Create a new journal entry for a user.
@@ -23,10 +29,8 @@ def create_journal_entry(
     - "30_days": Entry expires 30 days from creation
     - "delete_manually": Entry never expires automatically
     """
-    # Verify user exists
-    user = db.query(User).filter(User.id == request.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Token subject must match the requested user
+    ensure_same_user(request.user_id, current_user_id)
     
     # Validate expiration type
     valid_expiration_types = ["7_days", "30_days", "delete_manually"]
@@ -53,79 +57,129 @@ def create_journal_entry(
     )
     
     db.add(journal_entry)
+    bump_version(db, request.user_id, JOURNAL)
     db.commit()
     db.refresh(journal_entry)
     
+    # Condense long entries for counseling context once, off the request path
+    if needs_summary(journal_entry.journal_description):
+        submit_summary(journal_entry.id)
+    
     return SuccessResponse(success=True, message="Journal entry created successfully")
 
 
 @router.get("/history", response_model=List[JournalEntrySchema])
 def get_journal_history(
     user_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; omit to get every entry"),
+    cursor: Optional[str] = Query(None, description="Value of the X-Next-Cursor header from the previous page"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
 ):
     """
-    Get all journal entries for a user.
+    Get journal entries for a user, sorted by creation date (newest first).
     
-    Automatically filters out expired entries and deletes them.
-    Returns entries sorted by creation date (newest first).
+    Automatically deletes expired entries.
+    With `limit`, returns one page; the X-Next-Cursor response header holds the
+    cursor for the next page and is absent on the last one.
+    Responses carry a weak ETag; a matching If-None-Match gets 304.
     """
-    # Verify user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get all journal entries for the user
-    journal_entries = db.query(JournalEntry).filter(
-        JournalEntry.user_id == user_id
-    ).order_by(JournalEntry.created_at.desc()).all()
-    
-    # Filter out expired entries and delete them
-    active_entries = []
-    current_time = datetime.utcnow()
-    
-    for entry in journal_entries:
-        # Check if entry has expired
-        if entry.expires_at and entry.expires_at <= current_time:
-            # Delete expired entry
-            db.delete(entry)
-        else:
-            active_entries.append(entry)
-    
-    # Commit deletions if any
+    # Token subject must match the requested user
+    ensure_same_user(user_id, current_user_id)
+    
+    # Unchanged history is answered without running the list query
+    version = get_version(db, user_id, JOURNAL)
+    etag = matching_etag(request, version)
+    if etag:
+        return not_modified(etag)
+    
+    # Delete the user's expired entries in a single statement
+    expired = db.query(JournalEntry).filter(
+        JournalEntry.user_id == user_id,
+        JournalEntry.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    if expired:
+        bump_version(db, user_id, JOURNAL)
+        version += 1
     db.commit()
     
+    query = db.query(JournalEntry).filter(JournalEntry.user_id == user_id)
+    if limit is None:
+        entries = query.order_by(JournalEntry.created_at.desc(), JournalEntry.id.desc()).all()
+    else:
+        entries, next_cursor = keyset_page(query, JournalEntry, limit, cursor)
+        set_next_cursor(response, next_cursor)
+    
+    # The listing goes stale when its first entry expires
+    next_expiry = min((entry.expires_at for entry in entries if entry.expires_at), default=None)
+    response.headers["ETag"] = make_etag(request, version, next_expiry)
+    
     # Format response
-    response = []
-    for entry in active_entries:
-        response.append(JournalEntrySchema(
+    return [
+        JournalEntrySchema(
             id=entry.id,
             date=entry.created_at,
             journal=entry.journal_description,
             expires_at=entry.expires_at
-        ))
+        )
+        for entry in entries
+    ]
+
+
+@router.get("/search", response_model=List[JournalSearchResult])
+def search_journal(
+    user_id: int,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="Words to find; the last one also matches as a prefix"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Value of the X-Next-Cursor header from the previous page"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Full-text search of a user's unexpired journal entries, best match first.
+    
+    Each result carries a snippet with the matched terms wrapped in <mark></mark>.
+    The X-Next-Cursor response header holds the cursor for the next page and is
+    absent on the last one.
+    """
+    # Token subject must match the requested user
+    ensure_same_user(user_id, current_user_id)
+    
+    rows, next_cursor = search(db, user_id, q, limit, cursor)
+    set_next_cursor(response, next_cursor)
     
-    return response
+    return [
+        JournalSearchResult(id=row.id, date=row.created_at, snippet=row.snippet, expires_at=row.expires_at)
+        for row in rows
+    ]
 
 
 @router.delete("/entry/{entry_id}", response_model=SuccessResponse)
 def delete_journal_entry(
     entry_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
 ):
     """
     Delete a specific journal entry by ID.
     
     Returns success message if the entry is deleted or doesn't exist.
     """
-    # Find the journal entry
-    journal_entry = db.query(JournalEntry).filter(JournalEntry.id == entry_id).first()
+    # Find the journal entry (only among the current user's entries)
+    journal_entry = db.query(JournalEntry).filter(
+        JournalEntry.id == entry_id,
+        JournalEntry.user_id == current_user_id
+    ).first()
     
     if not journal_entry:
         raise HTTPException(status_code=404, detail="Journal entry not found")
     
     # Delete the entry
     db.delete(journal_entry)
+    bump_version(db, current_user_id, JOURNAL)
     db.commit()
     
     return SuccessResponse(success=True, message="Journal entry deleted successfully")
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Literal, Optional, List
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import json
@@ -8,6 +8,9 @@ import os
 
 from app.database import get_db
 from app.models import UserIntervention
+from app.utils.auth import get_current_user_id, get_optional_user_id, ensure_same_user
+from app.utils.intervention_affinity import next_affinity, personal_scores, record_completion, similarity_expires_at
+from app.utils.versions import INTERVENTIONS, bump_version, get_version, make_etag, matching_etag, not_modified
 
 router = APIRouter(prefix="/library", tags=["Interventions Library"])
 
@@ -52,9 +55,15 @@ def load_interventions():
 
 @router.get("/interventions", response_model=InterventionsListResponse)
 def get_interventions(
+    request: Request,
+    response: Response,
     intervention_ids: Optional[List[int]] = Query(None, description="List of intervention IDs to retrieve"),
     user_id: Optional[int] = Query(None, description="User ID to filter interventions they have completed"),
-    db: Session = Depends(get_db)
+    order: Literal["file", "personalized"] = Query(
+        "file", description="personalized ranks the user's favourite and related interventions first (needs user_id)"
+    ),
+    db: Session = Depends(get_db),
+    current_user_id: Optional[int] = Depends(get_optional_user_id)
 ):
     """
     Get intervention metadata from the library.
@@ -63,7 +72,24 @@ def get_interventions(
     - If intervention_ids provided: Returns specific interventions by ID
     - If user_id provided: Returns all interventions, annotating those the user has completed
     - If both provided: Returns specific interventions by ID, annotating completion data for user
+    
+    With user_id, responses carry a weak ETag; a matching If-None-Match gets 304.
+    order=personalized sorts by the user's personal scores (recency-weighted
+    completions and co-completion similarity), keeping file order for ties.
     """
+    if order == "personalized" and user_id is None:
+        raise HTTPException(status_code=400, detail="order=personalized requires user_id")
+    
+    if user_id is not None:
+        # Completion data is private to the token's subject
+        ensure_same_user(user_id, current_user_id)
+        
+        # Unchanged completion data is answered without querying or serializing
+        version = get_version(db, user_id, INTERVENTIONS)
+        etag = matching_etag(request, version)
+        if etag:
+            return not_modified(etag)
+    
     all_interventions = load_interventions()
     
     # Filter by specific intervention_ids if provided
@@ -107,6 +133,22 @@ def get_interventions(
             else:
                 intervention["times_completed"] = None
                 intervention["last_completed"] = None
+        
+        # Daily counts reset 24 hours after a completion, which changes the listing
+        now = datetime.utcnow()
+        next_reset = min(
+            (ui.last_completed_at + timedelta(hours=24) for ui in user_interventions
+             if ui.last_completed_at and ui.last_completed_at + timedelta(hours=24) > now),
+            default=None
+        )
+        
+        if order == "personalized":
+            # Scores come from this worker's cached affinity row, valid for this version
+            scores = personal_scores(db, user_id, version)
+            all_interventions.sort(key=lambda intervention: -scores.get(str(intervention["id"]), 0.0))
+            # A recomputed similarity matrix can reorder the list without any write
+            next_reset = min(filter(None, [next_reset, similarity_expires_at()]))
+        response.headers["ETag"] = make_etag(request, version, next_reset)
     
     return {
         "count": len(all_interventions),
@@ -117,7 +159,8 @@ def get_interventions(
 @router.post("/interventions/complete", response_model=CompleteInterventionResponse)
 def complete_intervention(
     request: CompleteInterventionRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
 ):
     """
     Record an intervention completion for a user.
@@ -125,6 +168,9 @@ def complete_intervention(
     - Creates a new record if user hasn't completed this intervention before
     - Increments times_completed and updates last_completed_at for existing records
     """
+    # Token subject must match the requested user
+    ensure_same_user(request.user_id, current_user_id)
+    
     # Check if user has already completed this intervention
     user_intervention = db.query(UserIntervention).filter(
         UserIntervention.user_id == request.user_id,
@@ -134,6 +180,10 @@ def complete_intervention(
     current_time = datetime.utcnow()
     
     if user_intervention:
+        # Decay the previous affinity to now and count this completion (rows predating it count times_completed)
+        previous = user_intervention.affinity if user_intervention.affinity is not None else user_intervention.times_completed
+        affinity = next_affinity(previous, user_intervention.last_completed_at, current_time)
+        
         # Check if 24 hours have passed since last completion
         if user_intervention.last_completed_at and (current_time - user_intervention.last_completed_at > timedelta(hours=24)):
             # Reset count for new 24h period
@@ -143,16 +193,23 @@ def complete_intervention(
             user_intervention.times_completed += 1
             
         user_intervention.last_completed_at = current_time
+        user_intervention.affinity = affinity
     else:
         # Create new record
+        affinity = next_affinity(None, None, current_time)
         user_intervention = UserIntervention(
             user_id=request.user_id,
             intervention_id=request.intervention_id,
             times_completed=1,
-            last_completed_at=current_time
+            last_completed_at=current_time,
+            affinity=affinity
         )
         db.add(user_intervention)
     
+    version = bump_version(db, request.user_id, INTERVENTIONS)
     db.commit()
     
+    # This worker's cached affinity row follows the write; other workers reload theirs
+    record_completion(request.user_id, request.intervention_id, affinity, current_time, version)
+    
     return CompleteInterventionResponse(success=True)
@@ -1,39 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
 import json
 
 from app.database import get_db
-from app.models import User, CheckIn, WearableData
-from app.schemas import CheckInRequest, CheckInResponse
+from app.models import CheckIn
+from app.schemas import CheckInRequest, CheckInResponse, CheckInHistoryItem, InterventionConversion
+from app.utils.admission import hold_until_done, optional_llm_admission
+from app.utils.auth import get_current_user_id, ensure_same_user
+from app.utils.fast_recommender import analyze, refine_when_done
+from app.utils.intervention_affinity import rerank
 from app.utils.interventions import load_interventions
 from app.utils.llm_utils import structured_response
+from app.utils.recommendations import conversion_report, record_recommendations
+from app.utils.wearable_features import WINDOW_DAYS, get_wearable_features
+from app.utils.pagination import keyset_page, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter(prefix="/check-in", tags=["AI Check-in"])
 
 
-@router.post("/analyze", response_model=CheckInResponse)
-def analyze_check_in(request: CheckInRequest, db: Session = Depends(get_db)):
-    """
-    Analyze user check-in data with optional wearable data integration.
-    Returns sanitized check-in with recommended interventions.
-    """
-    
-    # Verify user exists
-    user = db.query(User).filter(User.id == request.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get user's latest wearable data if it exists
-    wearable_info = None
-    latest_wearable = db.query(WearableData)\
-        .filter(WearableData.user_id == request.user_id)\
-        .order_by(WearableData.created_at.desc())\
-        .first()
-    
-    if latest_wearable is not None:
-        wearable_info = latest_wearable.wearable_data
-    
+def _llm_analysis(check_in_data: str, wearable_features: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ask the LLM to sanitize a check-in and pick interventions for it."""
     # Load interventions library
     interventions = load_interventions()
     
@@ -70,12 +58,14 @@ Be concise, empathetic, and focus on practical recommendations.
 """
     
     # Build user message with context
-    user_message = f"""Check-in data: {request.check_in_data}
+    user_message = f"""Check-in data: {check_in_data}
 
 """
     
-    if wearable_info is not None:
-        user_message += f"""Wearable data: {wearable_info}
+    if wearable_features is not None:
+        # Rollup features, or a trimmed raw payload when the rollups have no metric
+        label = "latest upload" if "latest_upload" in wearable_features else f"last {WINDOW_DAYS} days"
+        user_message += f"""Wearable signals ({label}): {json.dumps(wearable_features, separators=(",", ":"))}
 
 """
     
@@ -106,17 +96,51 @@ Please analyze this information and provide your response."""
         "additionalProperties": False
     }
     
+    # Call OpenAI API with structured output using shared utility
+    return structured_response(
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ],
+        schema=response_schema,
+        schema_name="check_in_analysis"
+    )
+
+
+@router.post("/analyze", response_model=CheckInResponse)
+def analyze_check_in(
+    request: CheckInRequest,
+    mode: Literal["llm", "fast"] = Query(
+        "llm", description="fast answers from the local recommender without waiting for the LLM"
+    ),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id),
+    llm_admitted: bool = Depends(optional_llm_admission)
+):
+    """
+    Analyze user check-in data with optional wearable data integration.
+    Returns sanitized check-in with recommended interventions.
+    
+    mode=fast scores the intervention library locally and answers at once; the
+    LLM then refines the stored check-in in the background. mode=llm falls back
+    to the same local answer (with mode "fast" in the response) when the LLM
+    fails, is slower than CHECK_IN_LLM_TIMEOUT_SECONDS or is over its rate limits.
+    """
+    
+    # Token subject must match the requested user
+    ensure_same_user(request.user_id, current_user_id)
+    
+    # Compact features over the user's recent wearable history, if any
+    wearable_features = get_wearable_features(db, request.user_id)
+    
+    result, used_mode, pending = analyze(request.check_in_data, wearable_features, mode, llm_admitted, _llm_analysis)
+    # An LLM call still running keeps an in-flight slot after this request releases its own
+    if pending is not None:
+        hold_until_done(pending)
+    # The user's completion history breaks near-ties between recommendations
+    result["recommended_intervention_ids"] = rerank(db, request.user_id, result["recommended_intervention_ids"])
+    
     try:
-        # Call OpenAI API with structured output using shared utility
-        result = structured_response(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            schema=response_schema,
-            schema_name="check_in_analysis"
-        )
-        
         # Convert intervention IDs array to comma-separated string for database
         intervention_ids_str = ",".join(result["recommended_intervention_ids"])
         
@@ -131,19 +155,75 @@ Please analyze this information and provide your response."""
         )
         
         db.add(new_check_in)
+        record_recommendations(db, new_check_in, result["recommended_intervention_ids"])
         db.commit()
         db.refresh(new_check_in)
-        
-        # Return response
-        return CheckInResponse(
-            sanitized_text=result["sanitized_text"],
-            recommended_intervention_ids=intervention_ids_str,
-            ai_reasoning=result["ai_reasoning"]
-        )
-        
     except Exception as e:
         db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Error processing check-in with AI: {str(e)}"
         )
+    
+    # The LLM's answer replaces the fast one once it arrives
+    if pending is not None:
+        refine_when_done(new_check_in.id, pending)
+    
+    # Return response
+    return CheckInResponse(
+        sanitized_text=result["sanitized_text"],
+        recommended_intervention_ids=intervention_ids_str,
+        ai_reasoning=result["ai_reasoning"],
+        check_in_id=new_check_in.id,
+        mode=used_mode
+    )
+
+
+@router.get("/history", response_model=List[CheckInHistoryItem])
+def get_check_in_history(
+    user_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Value of the X-Next-Cursor header from the previous page"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Past check-ins for a user, newest first, one page at a time.
+    The X-Next-Cursor response header holds the cursor for the next page.
+    """
+    # Token subject must match the requested user
+    ensure_same_user(user_id, current_user_id)
+    
+    check_ins, next_cursor = keyset_page(
+        db.query(CheckIn).filter(CheckIn.user_id == user_id),
+        CheckIn, limit, cursor
+    )
+    set_next_cursor(response, next_cursor)
+    
+    return [
+        CheckInHistoryItem(
+            id=check_in.id,
+            date=check_in.created_at,
+            sanitized_text=check_in.sanitized_text,
+            recommended_intervention_ids=check_in.recommended_intervention_ids,
+            ai_reasoning=check_in.ai_reasoning
+        )
+        for check_in in check_ins
+    ]
+
+
+@router.get("/recommendations", response_model=List[InterventionConversion])
+def get_recommendation_conversion(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Interventions recommended to a user by their check-ins, most recommended first,
+    with whether the user completed each after it was first recommended.
+    """
+    # Token subject must match the requested user
+    ensure_same_user(user_id, current_user_id)
+    
+    return conversion_report(db, user_id)
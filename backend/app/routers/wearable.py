@@ -1,53 +1,113 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import date, datetime
 import json
-from typing import List
+import numpy as np
+from typing import List, Literal, Optional
 
 from app.database import get_db
-from app.models import User, WearableData
-from app.schemas import WearableDataRequest, WearableDataResponse, WearableDataSummary, WearableCheckResponse
+from app.models import WearableData, WearableDailyRollup, WearableImportJob, WearableWeeklyRollup
+from app.schemas import (
+    WearableDataRequest, WearableDataResponse, WearableDataSummary, WearableCheckResponse, WearableTrendPoint,
+    WearableImportJobResponse, WearableSeries
+)
+from app.utils.admission import llm_admission
+from app.utils.auth import get_current_user_id, ensure_same_user
+from app.utils.downsampling import lttb
+from app.utils.health_import import FORMATS, create_job, detect_format, submit_import
 from app.utils.llm_utils import structured_response
+from app.utils.wearable_rollups import INTRADAY_INTERVAL, INTRADAY_SERIES, read_intraday, store_upload
+from app.utils.versions import WEARABLE, bump_version, get_version, make_etag, matching_etag, not_modified
 
 router = APIRouter(prefix="/user/wearable", tags=["Wearable Data"])
 
 
 @router.post("", response_model=WearableDataResponse)
-def save_wearable_data(request: WearableDataRequest, db: Session = Depends(get_db)):
+def save_wearable_data(
+    request: WearableDataRequest,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
     """
     Saves or updates the user's latest wearable data to their profile.
     Works for both anonymous and authenticated users.
+    Re-posting a payload the user already uploaded (same content, any key order) is a no-op.
+    New uploads update the user's daily and weekly rollups in the same transaction.
     """
     
-    # Verify user exists
-    user = db.query(User).filter(User.id == request.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Token subject must match the requested user
+    ensure_same_user(request.user_id, current_user_id)
     
-    # Create new wearable data entry
-    new_wearable = WearableData(
-        user_id=request.user_id,
-        wearable_data=request.wearable_data
-    )
-    
-    db.add(new_wearable)
+    # Insert unless the same content is already stored for this user
+    if store_upload(db, request.user_id, request.wearable_data):
+        bump_version(db, request.user_id, WEARABLE)
     db.commit()
-    db.refresh(new_wearable)
     
     return WearableDataResponse(success=True)
 
 
-@router.get("/view", response_model=List[WearableDataSummary])
-def view_wearable_data(user_id: int, limit: int = 1, db: Session = Depends(get_db)):
+@router.post("/import", response_model=WearableImportJobResponse, status_code=202)
+def import_wearable_export(
+    user_id: int,
+    file: UploadFile = File(...),
+    import_format: Optional[Literal["apple_health", "csv"]] = Query(
+        None, alias="format", description="Export format; detected from the file name (.xml, .csv) when omitted"
+    ),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Upload a bulk health export (Apple Health export.xml or CSV) and import it in the background.
+    Returns the queued job; poll GET /user/wearable/import/{job_id} for progress.
+    """
+    
+    # Token subject must match the requested user
+    ensure_same_user(user_id, current_user_id)
+    
+    import_format = import_format or detect_format(file.filename or "")
+    if import_format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown export format; pass format as one of {', '.join(FORMATS)}")
+    
+    try:
+        job = create_job(db, user_id, import_format, file.file)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    submit_import(job.id)
+    return job
+
+
+@router.get("/import/{job_id}", response_model=WearableImportJobResponse)
+def get_import_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """Return the progress of one of the current user's import jobs."""
+    
+    job = db.query(WearableImportJob)\
+        .filter(WearableImportJob.id == job_id, WearableImportJob.user_id == current_user_id)\
+        .first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    
+    return job
+
+
+@router.get("/view", response_model=List[WearableDataSummary], dependencies=[Depends(llm_admission)])
+def view_wearable_data(
+    user_id: int,
+    limit: int = 1,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
     """
     Extract user wearable information from user's records.
     Uses LLM to summarize information based on user_id.
     """
     
-    # Verify user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Token subject must match the requested user
+    ensure_same_user(user_id, current_user_id)
     
     # Get all wearable data for the user
     wearable_records = db.query(WearableData)\
@@ -128,15 +188,27 @@ Highlight aspects like activity levels, heart rate variability, sleep quality, a
 
 
 @router.get("/check", response_model=WearableCheckResponse)
-def check_wearable_data(user_id: int, db: Session = Depends(get_db)):
+def check_wearable_data(
+    user_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
     """
     Check if a user has any wearable data and return the latest created_at if available.
+    Responses carry a weak ETag; a matching If-None-Match gets 304.
     """
     
-    # Verify user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Token subject must match the requested user
+    ensure_same_user(user_id, current_user_id)
+    
+    # Unchanged data is answered without loading the latest payload
+    version = get_version(db, user_id, WEARABLE)
+    etag = matching_etag(request, version)
+    if etag:
+        return not_modified(etag)
+    response.headers["ETag"] = make_etag(request, version)
     
     # Get the latest wearable data for the user
     latest_wearable = db.query(WearableData)\
@@ -154,3 +226,126 @@ def check_wearable_data(user_id: int, db: Session = Depends(get_db)):
         return WearableCheckResponse(success=True, created_at=latest_wearable.created_at, data=data)
     else:
         return WearableCheckResponse(success=False, created_at=None, data=None)
+
+
+@router.get("/trends", response_model=List[WearableTrendPoint])
+def wearable_trends(
+    user_id: int,
+    request: Request,
+    response: Response,
+    period: Literal["daily", "weekly"] = "daily",
+    limit: int = Query(30, ge=1, le=366, description="Most recent days or weeks to return"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Return the user's daily or weekly wearable rollups, newest first.
+    Reads only the rollup tables, so the cost does not grow with the user's history.
+    Responses carry a weak ETag; a matching If-None-Match gets 304.
+    """
+    
+    # Token subject must match the requested user
+    ensure_same_user(user_id, current_user_id)
+    
+    version = get_version(db, user_id, WEARABLE)
+    etag = matching_etag(request, version)
+    if etag:
+        return not_modified(etag)
+    response.headers["ETag"] = make_etag(request, version)
+    
+    if period == "daily":
+        rollups = db.query(WearableDailyRollup)\
+            .filter(WearableDailyRollup.user_id == user_id)\
+            .order_by(WearableDailyRollup.day.desc())\
+            .limit(limit)\
+            .all()
+        return [
+            WearableTrendPoint(
+                period_start=rollup.day, days=1,
+                hr_min=rollup.hr_min, hr_mean=rollup.hr_mean, hr_max=rollup.hr_max,
+                steps=rollup.steps, sleep_hours=rollup.sleep_hours, active_minutes=rollup.active_minutes
+            )
+            for rollup in rollups
+        ]
+    
+    rollups = db.query(WearableWeeklyRollup)\
+        .filter(WearableWeeklyRollup.user_id == user_id)\
+        .order_by(WearableWeeklyRollup.week_start.desc())\
+        .limit(limit)\
+        .all()
+    return [
+        WearableTrendPoint(
+            period_start=rollup.week_start, days=rollup.days,
+            hr_min=rollup.hr_min, hr_mean=rollup.hr_mean, hr_max=rollup.hr_max,
+            steps=rollup.steps_total, sleep_hours=rollup.sleep_hours_total, active_minutes=rollup.active_minutes_total
+        )
+        for rollup in rollups
+    ]
+
+
+@router.get("/series", response_model=WearableSeries)
+def wearable_series(
+    user_id: int,
+    request: Request,
+    response: Response,
+    metric: Literal["hr_min", "hr_mean", "hr_max", "steps", "sleep_hours", "active_minutes", "hr_5min", "hrv_5min"],
+    start: Optional[date] = Query(None, alias="from", description="First day, inclusive"),
+    end: Optional[date] = Query(None, alias="to", description="Last day, inclusive"),
+    points: int = Query(500, ge=3, le=5000, description="Most points to return"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Return one metric as a chart-ready series, downsampled with
+    Largest-Triangle-Three-Buckets to at most `points` points. Daily metrics
+    come from the daily rollups (one point per day); hr_5min and hrv_5min are
+    the 5-minute samples of each day's upload (288 points per day at most), as
+    long as raw uploads are kept (WEARABLE_RAW_RETENTION_MODE).
+    Responses carry a weak ETag; a matching If-None-Match gets 304.
+    """
+    
+    # Token subject must match the requested user
+    ensure_same_user(user_id, current_user_id)
+    
+    version = get_version(db, user_id, WEARABLE)
+    etag = matching_etag(request, version)
+    if etag:
+        return not_modified(etag)
+    response.headers["ETag"] = make_etag(request, version)
+    
+    if metric in INTRADAY_SERIES:
+        # The upload each day's rollup came from, so a day is never counted twice
+        query = db.query(WearableDailyRollup.day, WearableData.wearable_data)\
+            .join(WearableData, WearableData.id == WearableDailyRollup.source_id)\
+            .filter(WearableDailyRollup.user_id == user_id)
+    else:
+        column = getattr(WearableDailyRollup, metric)
+        query = db.query(WearableDailyRollup.day, column)\
+            .filter(WearableDailyRollup.user_id == user_id, column.isnot(None))
+    if start is not None:
+        query = query.filter(WearableDailyRollup.day >= start)
+    if end is not None:
+        query = query.filter(WearableDailyRollup.day <= end)
+    rows = query.order_by(WearableDailyRollup.day).all()
+    
+    if metric in INTRADAY_SERIES:
+        timestamps, samples = [], []
+        for day, wearable_data in rows:
+            midnight = datetime.combine(day, datetime.min.time())
+            day_samples = read_intraday(wearable_data, INTRADAY_SERIES[metric])
+            timestamps.extend(midnight + index * INTRADAY_INTERVAL for index in range(len(day_samples)))
+            samples.extend(day_samples)
+        values = np.array(samples, dtype=float)
+        x = np.fromiter((moment.timestamp() for moment in timestamps), dtype=float, count=len(timestamps))
+    else:
+        timestamps = [row[0] for row in rows]
+        values = np.fromiter((row[1] for row in rows), dtype=float, count=len(rows))
+        x = np.fromiter((day.toordinal() for day in timestamps), dtype=float, count=len(timestamps))
+    kept = lttb(x, values, points)
+    
+    return WearableSeries(
+        metric=metric,
+        total_points=len(values),
+        timestamps=[timestamps[index] for index in kept],
+        values=values[kept].tolist()
+    )
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Union
+from datetime import date, datetime
 
 
 # Authentication schemas
@@ -58,11 +58,33 @@ class CheckInResponse(BaseModel):
     sanitized_text: str
     recommended_intervention_ids: str
     ai_reasoning: str
+    check_in_id: Optional[int] = None
+    mode: str = "llm"  # "fast" when answered by the local recommender; see /check-in/history for refinements
 
     class Config:
         from_attributes = True
 
 
+class CheckInHistoryItem(BaseModel):
+    id: int
+    date: datetime
+    sanitized_text: Optional[str] = None
+    recommended_intervention_ids: Optional[str] = None
+    ai_reasoning: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class InterventionConversion(BaseModel):
+    intervention_id: str
+    name: Optional[str] = None  # None for ids no longer in the library
+    recommendations: int  # Times recommended by check-ins
+    users_recommended: int  # Users it was recommended to
+    users_completed: int  # Of those, users who completed it after its first recommendation
+    conversion_rate: float  # users_completed / users_recommended
+
+
 # Wearable data schemas
 class WearableDataRequest(BaseModel):
     user_id: int
@@ -93,6 +115,42 @@ class WearableCheckResponse(BaseModel):
         from_attributes = True
 
 
+class WearableTrendPoint(BaseModel):
+    period_start: date  # The day, or the Monday of the week
+    days: int  # Days with data in the period
+    hr_min: Optional[float] = None
+    hr_mean: Optional[float] = None
+    hr_max: Optional[float] = None
+    # Totals over the period
+    steps: Optional[float] = None
+    sleep_hours: Optional[float] = None
+    active_minutes: Optional[float] = None
+
+
+class WearableImportJobResponse(BaseModel):
+    id: str
+    format: str
+    status: str  # "queued", "running", "done" or "failed"
+    bytes_total: int
+    bytes_read: int
+    records_read: int
+    days_imported: int
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class WearableSeries(BaseModel):
+    metric: str
+    total_points: int  # Points in the range before downsampling
+    # Parallel arrays, ready to hand to a chart: days, or times for the intraday metrics
+    timestamps: List[Union[date, datetime]]
+    values: List[float]
+
+
 # Intervention schemas
 class InterventionBase(BaseModel):
     id: str
@@ -130,6 +188,13 @@ class JournalEntry(BaseModel):
     journal: str
     expires_at: Optional[datetime] = None
 
+
+class JournalSearchResult(BaseModel):
+    id: int
+    date: datetime
+    snippet: str  # Matched terms wrapped in <mark></mark>
+    expires_at: Optional[datetime] = None
+
     class Config:
         from_attributes = True
 
@@ -158,6 +223,15 @@ class StartCounselingResponse(BaseModel):
         from_attributes = True
 
 
+class ConversationSummary(BaseModel):
+    conversation_id: int
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class FollowUpRequest(BaseModel):
     conversation_id: int
     message: str
@@ -0,0 +1,34 @@
+"""
+Helpers for deleting users together with everything they own.
+"""
+from typing import List
+from sqlalchemy.orm import Session
+
+from app.models import (
+    User, CheckIn, CheckInRecommendation, WearableData, WearableDailyRollup, WearableWeeklyRollup, WearableImportJob,
+    JournalEntry, UserIntervention, Conversation, DataVersion, RateLimitBucket
+)
+
+# Tables holding per-user rows; each has an indexed user_id column (or leads its primary key)
+USER_DATA_MODELS = [
+    CheckInRecommendation, CheckIn, WearableData, WearableDailyRollup, WearableWeeklyRollup, WearableImportJob, JournalEntry,
+    UserIntervention, Conversation, DataVersion
+]
+
+
+def delete_users(db: Session, user_ids: List[int]) -> int:
+    """
+    Delete users and all their rows with one set-based DELETE per table.
+    Does not commit, so callers control the transaction. Returns the number of users deleted.
+    """
+    if not user_ids:
+        return 0
+
+    for model in USER_DATA_MODELS:
+        db.query(model).filter(model.user_id.in_(user_ids)).delete(synchronize_session=False)
+    # LLM admission buckets are keyed "user:<id>" rather than by user_id
+    db.query(RateLimitBucket).filter(
+        RateLimitBucket.key.in_([f"user:{user_id}" for user_id in user_ids])
+    ).delete(synchronize_session=False)
+
+    return db.query(User).filter(User.id.in_(user_ids)).delete(synchronize_session=False)
@@ -0,0 +1,205 @@
+"""
+Admission control for LLM-backed routes.
+
+Requests first reserve a slot under the worker's in-flight LLM limit; beyond
+it the worker sheds load with 503. They then pass per-user and global token
+buckets kept in SQLite, so the limits hold across uvicorn workers; an empty
+bucket means 429 and frees the slot. Both carry a Retry-After header. Tokens
+of a request the route rejects with 403 (another user's id) are refunded.
+LLM work that outlives its request (a timed-out call, a background refinement)
+holds its own slot until it finishes (hold_until_done).
+"""
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict
+from fastapi import Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import config
+from app.database import get_db
+from app.utils.auth import get_current_user_id
+
+# Seconds a shed client should wait before retrying
+SHED_RETRY_AFTER = 5
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+_admission_stats = {
+    "admitted": 0,
+    "rejected_user_rate": 0,
+    "rejected_global_rate": 0,
+    "shed": 0,
+}
+
+
+def _count(name: str) -> None:
+    with _in_flight_lock:
+        _admission_stats[name] += 1
+
+
+def get_admission_stats() -> Dict[str, int]:
+    """Return a snapshot of this process's admission counters and in-flight LLM requests."""
+    with _in_flight_lock:
+        return {**_admission_stats, "in_flight": _in_flight}
+
+
+def _take_token(db: Session, key: str, rate_per_minute: float, burst: float) -> float:
+    """
+    Atomically refill and take one token from a bucket.
+    Returns 0 when admitted, otherwise the seconds until a token is available.
+    """
+    rate = rate_per_minute / 60.0
+    now = time.time()
+    params = {"key": key, "burst": burst, "rate": rate, "now": now}
+
+    db.execute(text(
+        "INSERT OR IGNORE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (:key, :burst, :now)"
+    ), params)
+    # A single UPDATE is atomic across workers: it only succeeds if a token is available
+    taken = db.execute(text(
+        "UPDATE rate_limit_buckets "
+        "SET tokens = min(:burst, tokens + (:now - updated_at) * :rate) - 1, updated_at = :now "
+        "WHERE key = :key AND min(:burst, tokens + (:now - updated_at) * :rate) >= 1"
+    ), params).rowcount
+    if taken:
+        return 0
+
+    tokens = db.execute(text(
+        "SELECT min(:burst, tokens + (:now - updated_at) * :rate) FROM rate_limit_buckets WHERE key = :key"
+    ), params).scalar()
+    return (1 - tokens) / rate if rate > 0 else float(SHED_RETRY_AFTER)
+
+
+def _refund_token(db: Session, key: str) -> None:
+    db.execute(text("UPDATE rate_limit_buckets SET tokens = tokens + 1 WHERE key = :key"), {"key": key})
+
+
+def _rate_limited(retry_after: float, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+def _admit(db: Session, current_user_id: int) -> None:
+    """
+    Reserve an in-flight slot and take the user's and the global tokens, or
+    raise 503/429. The slot comes first so a shed request spends no tokens.
+    """
+    global _in_flight
+
+    with _in_flight_lock:
+        if _in_flight >= config.LLM_MAX_IN_FLIGHT:
+            _admission_stats["shed"] += 1
+            shed = True
+        else:
+            _in_flight += 1
+            shed = False
+    if shed:
+        raise HTTPException(
+            status_code=503,
+            detail="The service is overloaded, please try again shortly",
+            headers={"Retry-After": str(SHED_RETRY_AFTER)}
+        )
+
+    user_key = f"user:{current_user_id}"
+    try:
+        wait = _take_token(db, user_key, config.LLM_USER_RATE_PER_MINUTE, config.LLM_USER_BURST)
+        if wait:
+            db.commit()
+            _count("rejected_user_rate")
+            raise _rate_limited(wait, "Too many requests, please slow down")
+
+        wait = _take_token(db, "global", config.LLM_GLOBAL_RATE_PER_MINUTE, config.LLM_GLOBAL_BURST)
+        if wait:
+            _refund_token(db, user_key)
+            db.commit()
+            _count("rejected_global_rate")
+            raise _rate_limited(wait, "The service is busy, please try again shortly")
+        db.commit()
+    except Exception as e:
+        if not isinstance(e, HTTPException):
+            db.rollback()
+        _release()
+        raise
+    _count("admitted")
+
+
+def _refund_forbidden(db: Session, current_user_id: int) -> None:
+    """Give back the tokens of a request the route rejected as another user's (ensure_same_user)."""
+    try:
+        db.rollback()
+        _refund_token(db, f"user:{current_user_id}")
+        _refund_token(db, "global")
+        db.commit()
+    except Exception:
+        db.rollback()
+
+
+def _release() -> None:
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+def hold_until_done(future: Future) -> None:
+    """
+    Count `future` against the in-flight limit until it completes. Call it while
+    the request still holds its own slot, so the work is never uncounted.
+    """
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+    future.add_done_callback(lambda _: _release())
+
+
+def llm_admission(
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """Dependency admitting a request to an LLM-backed route, or rejecting it with 429/503."""
+    _admit(db, current_user_id)
+    try:
+        yield
+    except HTTPException as e:
+        if e.status_code == 403:
+            _refund_forbidden(db, current_user_id)
+        raise
+    finally:
+        _release()
+
+
+def optional_llm_admission(
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Like llm_admission, for routes that can answer without the LLM: yields whether
+    the request was admitted instead of rejecting it.
+    """
+    try:
+        _admit(db, current_user_id)
+    except HTTPException:
+        yield False
+        return
+    try:
+        yield True
+    except HTTPException as e:
+        if e.status_code == 403:
+            _refund_forbidden(db, current_user_id)
+        raise
+    finally:
+        _release()
+
+
+def purge_idle_buckets(db: Session) -> int:
+    """Delete buckets idle long enough to have refilled completely; they are recreated full on demand."""
+    cutoff = time.time() - 3600
+    deleted = db.execute(text("DELETE FROM rate_limit_buckets WHERE updated_at < :cutoff"), {"cutoff": cutoff}).rowcount
+    db.commit()
+    return deleted
@@ -1,14 +1,27 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+from fastapi import Depends, Header, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy.orm import Session
+
+from app import config
+from app.database import DATA_DIR, get_db
+from app.models import User
 
 # Configuration
 SECRET_KEY = "your-secret-key-change-this-in-production"  # Change this!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=config.BCRYPT_ROUNDS)
 
 # bcrypt has a 72-byte limit for passwords
 BCRYPT_MAX_PASSWORD_LENGTH = 72
@@ -22,24 +35,91 @@ def _truncate_password(password: str) -> str:
     return password_bytes.decode('utf-8', errors='ignore')
 
 
+# Seconds a client should wait before retrying when the hashing queue is full
+PASSWORD_HASH_RETRY_AFTER = 2
+
+# bcrypt runs in a dedicated process pool so a burst of logins cannot pin the
+# request threadpool; the semaphore bounds running + queued hashing jobs
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_pool_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(
+    max(config.PASSWORD_HASH_WORKERS, 1) + config.PASSWORD_HASH_MAX_QUEUE
+)
+
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            # spawn avoids forking a process that already runs server threads
+            _hash_pool = ProcessPoolExecutor(
+                max_workers=config.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _hash_pool
+
+
+def _run_hashing(fn, *args):
+    """Run a bcrypt job on the hashing pool, rejecting it with 503 when the queue is full."""
+    if not _hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please try again shortly",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)}
+        )
+    try:
+        if config.PASSWORD_HASH_WORKERS <= 0:
+            return fn(*args)
+        return _get_hash_pool().submit(fn, *args).result()
+    finally:
+        _hash_slots.release()
+
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(_truncate_password(plain_password), hashed_password)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(_truncate_password(password))
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
-    return pwd_context.verify(_truncate_password(plain_password), hashed_password)
+    return _run_hashing(_verify_and_update, plain_password, hashed_password)[0]
+
+
+def verify_password_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password against its hash.
+    Returns (valid, new_hash); new_hash is set when the stored hash uses an outdated cost.
+    """
+    return _run_hashing(_verify_and_update, plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     """Hash a password."""
-    return pwd_context.hash(_truncate_password(password))
+    return _run_hashing(_hash, password)
+
+
+def account_stamp(created_at: Optional[datetime]) -> int:
+    """An account's creation time in microseconds, the "acct" claim tying a token to that account."""
+    if created_at is None:
+        return 0
+    return (created_at - datetime(1970, 1, 1)) // timedelta(microseconds=1)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """Create a JWT access token."""
+    """
+    Create a JWT access token. Pass the account's account_stamp() as "acct", so
+    the token cannot outlive its account if the id is reused after a deletion.
+    """
     to_encode = data.copy()
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+        expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "iat": now})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -51,3 +131,199 @@ def decode_access_token(token: str) -> Optional[dict]:
         return payload
     except JWTError:
         return None
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Dependency guarding admin endpoints with the X-Admin-Token header."""
+    if not config.ADMIN_TOKEN:
+        # Admin endpoints are hidden entirely when no token is configured
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token != config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+class _LRUCache:
+    """Small thread-safe LRU mapping with per-entry expiry (monotonic seconds)."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard_where(self, predicate) -> None:
+        with self._lock:
+            for key in [k for k, (v, _) in self._entries.items() if predicate(k, v)]:
+                del self._entries[key]
+
+
+# Verified tokens (token -> (user id, acct claim, issued at)) and, for user ids known
+# to exist in the database, (account_stamp(), last_seen_at epoch seconds).
+# Each uvicorn worker keeps its own caches, so known users also expire after a TTL,
+# and every account deletion appends a byte to DELETIONS_FILE: a worker that sees
+# the file change (one stat per request) forgets all known users, so a deleted
+# user's token gets 401 in every worker on its next request.
+_token_cache = _LRUCache(config.AUTH_CACHE_SIZE)
+_known_users = _LRUCache(config.AUTH_CACHE_SIZE)
+
+# Seconds between updates of a user's last_seen_at
+LAST_SEEN_INTERVAL_SECONDS = 3600
+
+DELETIONS_FILE = os.path.join(DATA_DIR, "account_deletions")
+# The file starts over past this size; (mtime, size) still changes
+DELETIONS_FILE_MAX_BYTES = 4096
+_deletions_seen: Optional[Tuple[int, int]] = None
+_deletions_lock = threading.Lock()
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+def _invalid_token() -> HTTPException:
+    return HTTPException(
+        status_code=401,
+        detail="Invalid or expired token",
+        headers={"WWW-Authenticate": "Bearer"}
+    )
+
+
+def _resolve_token(token: str) -> Tuple[int, Optional[int], float]:
+    """(user id, acct claim or None, issued-at epoch seconds) of a valid token."""
+    resolved = _token_cache.get(token)
+    if resolved is not None:
+        return resolved
+
+    payload = decode_access_token(token)
+    try:
+        user_id = int(payload["sub"])
+        account = int(payload["acct"]) if "acct" in payload else None
+        # Tokens issued before "iat" was added all had the default lifetime
+        issued_at = float(payload.get("iat", payload["exp"] - ACCESS_TOKEN_EXPIRE_MINUTES * 60))
+    except (TypeError, KeyError, ValueError):
+        raise _invalid_token()
+
+    # Cache until the token expires (wall clock -> monotonic)
+    expires = time.monotonic() + (payload["exp"] - time.time())
+    resolved = (user_id, account, issued_at)
+    _token_cache.set(token, resolved, expires)
+    return resolved
+
+
+def _deletions_marker() -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(DELETIONS_FILE)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _sync_deletions() -> None:
+    """Forget known users when any worker deleted an account since the last check."""
+    global _deletions_seen
+    marker = _deletions_marker()
+    if marker == _deletions_seen:
+        return
+    with _deletions_lock:
+        if marker != _deletions_seen:
+            _known_users.discard_where(lambda _key, _value: True)
+            _deletions_seen = marker
+
+
+def _announce_deletion() -> None:
+    try:
+        size = os.path.getsize(DELETIONS_FILE)
+    except OSError:
+        size = 0
+    with open(DELETIONS_FILE, "wb" if size >= DELETIONS_FILE_MAX_BYTES else "ab") as f:
+        f.write(b".")
+
+
+def get_current_user_id(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db: Session = Depends(get_db)
+) -> int:
+    """
+    Dependency resolving the bearer token to an existing user's id.
+    Token verification and the user existence check are cached, so most
+    requests need neither JWT decoding nor a users query.
+
+    User ids are SQLite rowids, which a new account can reuse after a deletion,
+    so the token must also belong to the account that now has the id: its
+    "acct" claim must match, and tokens without one must predate the account.
+    """
+    if credentials is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    user_id, account, issued_at = _resolve_token(credentials.credentials)
+
+    _sync_deletions()
+    known = _known_users.get(user_id)
+    if known is None:
+        user = db.query(User.created_at, User.last_seen_at).filter(User.id == user_id).first()
+        if not user:
+            # The account was deleted; its tokens are no longer valid
+            raise _invalid_token()
+        last_seen = (user.last_seen_at - datetime(1970, 1, 1)).total_seconds() if user.last_seen_at else 0.0
+        known = (account_stamp(user.created_at), last_seen)
+        _known_users.set(user_id, known, time.monotonic() + config.AUTH_CACHE_TTL_SECONDS)
+    stamp, last_seen = known
+
+    # A token for an earlier account that had this id
+    if (account is not None and account != stamp) or (account is None and stamp > issued_at * 1e6):
+        raise _invalid_token()
+
+    # Reads count as activity for the anonymous user reaper, recorded at most once per interval
+    if time.time() - last_seen > LAST_SEEN_INTERVAL_SECONDS:
+        db.query(User).filter(User.id == user_id).update({"last_seen_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        _known_users.set(user_id, (stamp, time.time()), time.monotonic() + config.AUTH_CACHE_TTL_SECONDS)
+
+    return user_id
+
+
+def get_optional_user_id(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db: Session = Depends(get_db)
+) -> Optional[int]:
+    """Like get_current_user_id, but returns None for anonymous requests without a token."""
+    if credentials is None:
+        return None
+    return get_current_user_id(credentials, db)
+
+
+def ensure_same_user(user_id: Optional[int], current_user_id: Optional[int]) -> None:
+    """Reject requests that act on a user other than the token's subject."""
+    if user_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Not authorized for this user")
+
+
+def invalidate_user(user_id: int) -> None:
+    """Forget cached tokens and existence for a deleted user, in this worker and (via DELETIONS_FILE) the others."""
+    _known_users.discard_where(lambda key, _: key == user_id)
+    _token_cache.discard_where(lambda _, value: value[0] == user_id)
+    try:
+        _announce_deletion()
+    except OSError:
+        # Other workers still notice within AUTH_CACHE_TTL_SECONDS
+        pass
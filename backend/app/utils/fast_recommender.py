@@ -0,0 +1,410 @@
+"""
+Local rule-based recommender for /check-in/analyze (mode=fast), and the LLM
+fallback and refinement around it.
+
+The LLM path blocks a check-in on a multi-second call even when the answer is
+plain from the structured fields of interventions_library.json. The fast path
+scores every intervention locally, in well under a millisecond, from:
+
+- the stress level parsed from the check-in (a JSON "stressLevel" field on any
+  scale, or "Stress: 8/10" in the app's text format), matched against stress_range
+- context keywords in the check-in's text (anxiety, fatigue, grief, trauma,
+  conflict) and word overlap with each intervention's name, trigger case and
+  goal tags
+- signals: a high wearable stress proxy or stress level favours calming
+  modalities, sleep debt or illness favours rest and energy goals, and low
+  capacity favours short interventions (duration_min)
+
+Its sanitized_text is a best-effort regex redaction of the check-in (dates
+with a year, emails, phone numbers and titled names everywhere; multi-word
+proper names only in the free-text notes, not in field labels like "Sleep
+Debt").
+
+mode=llm (the default) still asks the LLM, on this worker's check-in thread
+pool, but answers from the fast path when the call fails or takes longer than
+CHECK_IN_LLM_TIMEOUT_SECONDS, or when LLM admission rejects the request. A
+call that timed out keeps running, and when it finishes its result replaces
+the stored check-in's fast answer, as does the background refinement queued
+for mode=fast check-ins (CHECK_IN_FAST_REFINE). Both count against the LLM
+in-flight limit until they finish (admission.hold_until_done). Clients see
+refined results in /check-in/history.
+
+Either way the route re-ranks the recommendations with the user's completion
+history (see app/utils/intervention_affinity.py), and so do refinements.
+"""
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from app import config
+from app.database import SessionLocal
+from app.models import CheckIn
+from app.utils.intervention_affinity import rerank
+from app.utils.interventions import INTERVENTIONS_FILE, load_interventions
+from app.utils.recommendations import replace_recommendations
+
+logger = logging.getLogger(__name__)
+
+# Interventions recommended per check-in, like the LLM path's 1-3
+RECOMMENDATIONS = 3
+
+# Words suggesting each library context
+CONTEXT_KEYWORDS = {
+    "anxiety": ["anxious", "anxiety", "panic", "nervous", "worried", "worry", "fear", "scared", "racing",
+                "shaking", "overwhelmed", "dread", "tense", "incompetent", "judged"],
+    "fatigue": ["tired", "exhausted", "exhaustion", "sleep", "slept", "drowsy", "fatigue", "drained", "burnout",
+                "numb", "blur", "shift", "cynical", "isolated", "rumination"],
+    "grief": ["death", "died", "dying", "loss", "lost", "grief", "grieving", "mourning", "passed", "funeral",
+              "palliative", "comfort"],
+    "trauma": ["code", "coded", "resuscitation", "froze", "flashback", "replaying", "error", "mistake",
+               "injury", "needle", "trauma", "failed", "traumatic"],
+    "conflict": ["argument", "argue", "arguing", "yelled", "yelling", "angry", "anger", "blame", "abuse",
+                 "aggressive", "shouted", "conflict", "rude", "irritable", "frustrated"],
+}
+
+# Modalities and goal tags favoured by physiological stress, and by sleep debt
+CALMING_MODALITIES = {"breathing", "somatic", "physical", "sensory"}
+CALMING_TAGS = {"regulation", "physiological-reset", "grounding", "relaxation", "tension-release", "panic-reduction"}
+REST_TAGS = {"rest", "circadian-rhythm", "alertness", "energy", "self-care"}
+
+# Score weights
+STRESS_WEIGHT = 3.0
+CONTEXT_WEIGHT = 2.0
+KEYWORD_WEIGHT = 1.5
+SIGNAL_WEIGHT = 1.0
+SHORT_WEIGHT = 0.5
+
+# Capacity (0-10) at or below which short interventions are preferred, and what counts as short
+LOW_CAPACITY = 3
+SHORT_MINUTES = 2
+# Sleep debt, in check-in points (0-10) or wearable hours over 7 days, that counts as significant
+SLEEP_DEBT_POINTS = 6
+SLEEP_DEBT_HOURS = 5
+# Illness symptoms (0-10) at or above which rest is favoured too
+ILLNESS_POINTS = 6
+
+STOPWORDS = {
+    "a", "an", "and", "the", "of", "to", "in", "on", "at", "or", "for", "with", "by", "from", "after", "before",
+    "during", "into", "due", "their", "her", "his", "my", "me", "i", "it", "is", "was", "be", "been", "being",
+    "this", "that", "these", "those", "e", "g", "eg", "vs", "than", "but", "not", "no", "so", "very", "just",
+    "had", "have", "has", "feel", "feeling", "felt", "today", "yesterday", "tomorrow", "really", "about",
+}
+
+_WORD = re.compile(r"[a-z]+")
+# Fields of a plain-text check-in, e.g. the app's "Stress: 7/10, Capacity: 3/10, Sleep Debt: 8/10,
+# Illness: 2/10. Notes: ...", and a score after each on any scale
+TEXT_FIELDS = {
+    "stress": r"stress(?:ed)?(?:\s+level)?",
+    "capacity": r"(?:current\s+)?capacity",
+    "sleep_debt": r"sleep\s+debt",
+    "illness": r"illness(?:\s+symptoms)?",
+}
+_TEXT_FIELDS = {
+    name: re.compile(pattern + r"\D{0,12}?(\d{1,2}(?:\.\d+)?)(?:\s*(?:/|out of)\s*(\d{1,2}))?")
+    for name, pattern in TEXT_FIELDS.items()
+}
+_NOTES_LABEL = re.compile(r"\bnotes?\s*:\s*", re.IGNORECASE)
+
+REDACTIONS = [
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "[email]"),
+    (re.compile(r"\+?\d[\d\s().-]{7,}\d"), "[phone]"),
+    # Slash dates need a year, so scores like "7/10" are kept
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}(?:[T ][\d:.]+Z?)?\b|\b\d{1,2}/\d{1,2}/\d{2,4}\b"), "[date]"),
+    (re.compile(r"\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2}(?:st|nd|rd|th)?"
+                r"(?:,?\s+\d{4})?\b"), "[date]"),
+    (re.compile(r"\b(?:Dr|Mr|Mrs|Ms|Mx|Prof|Nurse|Patient|patient)\.?\s+[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*"), "[name]"),
+]
+# Two or more capitalized words in a row, e.g. a person or a hospital; applied to free-text notes only
+PROPER_NAMES = (re.compile(r"\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)+"), "[redacted]")
+
+_library_lock = threading.Lock()
+_library: Optional[Tuple[float, List[Dict[str, Any]]]] = None
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s", "ly"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+def _stems(text: str) -> Set[str]:
+    return {_stem(word) for word in _WORD.findall(text.lower()) if word not in STOPWORDS and len(word) > 2}
+
+
+def _compile(interventions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    compiled = []
+    for intervention in interventions:
+        tags = intervention.get("goal_tags", [])
+        stress_range = intervention.get("stress_range") or {}
+        compiled.append({
+            "id": str(intervention["id"]),
+            "name": intervention.get("name", ""),
+            "context": intervention.get("context", ""),
+            "modality": intervention.get("modality", ""),
+            "tags": set(tags),
+            "stress_min": stress_range.get("min", 0),
+            "stress_max": stress_range.get("max", 10),
+            "duration_min": intervention.get("duration_min", 0),
+            "keywords": _stems(" ".join([intervention.get("name", ""), intervention.get("trigger_case", "")]
+                                        + [tag.replace("-", " ") for tag in tags])),
+        })
+    return compiled
+
+
+def library() -> List[Dict[str, Any]]:
+    """The intervention library prepared for scoring, reloaded when the file changes."""
+    global _library
+    try:
+        mtime = os.path.getmtime(INTERVENTIONS_FILE)
+    except OSError:
+        mtime = 0.0
+    with _library_lock:
+        if _library is None or _library[0] != mtime:
+            _library = (mtime, _compile(load_interventions()))
+        return _library[1]
+
+
+def _scaled(value: Any) -> Optional[float]:
+    """A check-in field as 0-10: a number, or {"value": n, "scaleMax": m}."""
+    scale = 10.0
+    if isinstance(value, dict):
+        scale = value.get("scaleMax") or value.get("scale_max") or 10.0
+        value = value.get("value")
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and scale:
+        return max(0.0, min(10.0, float(value) * 10.0 / float(scale)))
+    return None
+
+
+def _find(payload: Any, names: Tuple[str, ...]) -> Any:
+    """The first value under any of `names` (compared without case or underscores), searching nested objects."""
+    if isinstance(payload, dict):
+        for key, value in payload.items():
+            if key.replace("_", "").lower() in names:
+                return value
+        for value in payload.values():
+            found = _find(value, names)
+            if found is not None:
+                return found
+    return None
+
+
+def _strings(payload: Any) -> List[str]:
+    if isinstance(payload, str):
+        return [payload]
+    if isinstance(payload, dict):
+        return [text for value in payload.values() for text in _strings(value)]
+    if isinstance(payload, list):
+        return [text for value in payload for text in _strings(value)]
+    return []
+
+
+def parse_check_in(check_in_data: str) -> Dict[str, Any]:
+    """
+    Stress, capacity, sleep debt and illness (0-10, or None), all text of a
+    check-in, its free-text notes, and for plain text the fields before the
+    notes ("fields", None otherwise).
+    """
+    try:
+        payload = json.loads(check_in_data)
+    except (TypeError, ValueError):
+        payload = None
+
+    if isinstance(payload, (dict, list)):
+        notes = _find(payload, ("usernotes", "notes", "note", "text", "description"))
+        signals = {
+            "stress": _scaled(_find(payload, ("stresslevel", "stress"))),
+            "capacity": _scaled(_find(payload, ("currentcapacity", "capacity"))),
+            "sleep_debt": _scaled(_find(payload, ("sleepdebt",))),
+            "illness": _scaled(_find(payload, ("illnesssymptoms", "illness"))),
+            # Labels ("High", "Significant debt") carry words too
+            "text": " ".join(_strings(payload)),
+            "notes": notes if isinstance(notes, str) else None,
+            "fields": None,
+        }
+    else:
+        text = check_in_data or ""
+        label = _NOTES_LABEL.search(text)
+        signals = {
+            "stress": None, "capacity": None, "sleep_debt": None, "illness": None, "text": text,
+            "notes": text[label.end():] if label else text,
+            "fields": text[:label.end()] if label else None,
+        }
+
+    lowered = signals["text"].lower()
+    for name, pattern in _TEXT_FIELDS.items():
+        if signals[name] is None:
+            match = pattern.search(lowered)
+            if match:
+                scale = float(match.group(2) or 10) or 10.0
+                signals[name] = max(0.0, min(10.0, float(match.group(1)) * 10.0 / scale))
+    return signals
+
+
+def redact(text: str, proper_names: bool = True) -> str:
+    """
+    Best-effort removal of identifying details; the LLM refinement does the
+    thorough job. Pass proper_names=False for text with capitalized labels.
+    """
+    for pattern, replacement in REDACTIONS + ([PROPER_NAMES] if proper_names else []):
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _stress_fit(stress: Optional[float], low: float, high: float) -> float:
+    if stress is None:
+        return 0.5
+    distance = max(low - stress, stress - high, 0)
+    return max(0.0, 1.0 - distance / 3.0)
+
+
+def recommend(check_in_data: str, wearable_features: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Score the library against a check-in and return a result shaped like the
+    LLM's: sanitized_text, recommended_intervention_ids (best first) and ai_reasoning.
+    """
+    signals = parse_check_in(check_in_data)
+    # The app's text format has fixed labels ("Sleep Debt") before the notes, which are not signs of anything
+    words = _stems(signals["notes"] if signals["fields"] is not None else signals["text"])
+    wearable_features = wearable_features or {}
+
+    # Wearable stress stands in for a check-in without a stress level (proxy is in z units)
+    stress = signals["stress"]
+    proxy = wearable_features.get("stress_proxy")
+    if stress is None and isinstance(proxy, (int, float)):
+        stress = max(0.0, min(10.0, 5.0 + 1.5 * proxy))
+    physiological_stress = wearable_features.get("stress_level") in ("high", "elevated") or (stress or 0) >= 8
+    sleep_hours_debt = wearable_features.get("sleep_debt_7d_hours")
+    sleep_debt = (signals["sleep_debt"] or 0) >= SLEEP_DEBT_POINTS \
+        or (isinstance(sleep_hours_debt, (int, float)) and sleep_hours_debt >= SLEEP_DEBT_HOURS)
+    ill = (signals["illness"] or 0) >= ILLNESS_POINTS
+    low_capacity = signals["capacity"] is not None and signals["capacity"] <= LOW_CAPACITY
+
+    context_hits = {
+        context: len(words & {_stem(keyword) for keyword in keywords})
+        for context, keywords in CONTEXT_KEYWORDS.items()
+    }
+    if sleep_debt:
+        context_hits["fatigue"] += 1
+    most_hits = max(context_hits.values())
+
+    scored = []
+    for intervention in library():
+        signal = 0.0
+        if physiological_stress and (intervention["modality"] in CALMING_MODALITIES or intervention["tags"] & CALMING_TAGS):
+            signal += 0.5
+        if (sleep_debt or ill) and intervention["tags"] & REST_TAGS:
+            signal += 0.5
+        score = (
+            STRESS_WEIGHT * _stress_fit(stress, intervention["stress_min"], intervention["stress_max"])
+            + CONTEXT_WEIGHT * (context_hits.get(intervention["context"], 0) / most_hits if most_hits else 0.0)
+            + KEYWORD_WEIGHT * min(len(words & intervention["keywords"]), 3) / 3
+            + SIGNAL_WEIGHT * signal
+            + SHORT_WEIGHT * (low_capacity and intervention["duration_min"] <= SHORT_MINUTES)
+        )
+        scored.append((-score, int(intervention["id"]) if intervention["id"].isdigit() else 0, intervention))
+    scored.sort(key=lambda item: item[:2])
+    best = [intervention for _, _, intervention in scored[:RECOMMENDATIONS]]
+
+    reasons = []
+    if stress is not None:
+        reasons.append(f"a stress level of about {stress:.0f}/10")
+    themes = [context for context, hits in sorted(context_hits.items(), key=lambda item: -item[1]) if hits][:2]
+    if themes:
+        reasons.append(f"signs of {' and '.join(themes)}")
+    if sleep_debt:
+        reasons.append("accumulated sleep debt")
+    if ill:
+        reasons.append("illness symptoms")
+    if physiological_stress and wearable_features.get("stress_level"):
+        reasons.append("elevated physiological stress in wearable data")
+    if low_capacity:
+        reasons.append("low current capacity, so shorter exercises rank higher")
+    reasoning = f"Quick match on {', '.join(reasons) or 'the general check-in'}: " \
+                f"{'; '.join(intervention['name'] for intervention in best)}."
+
+    if signals["notes"]:
+        # Field labels ("Sleep Debt") are not names; only the notes get the proper-name rule
+        sanitized = redact(signals["fields"] or "", proper_names=False) + redact(signals["notes"])
+    else:
+        parts = [f"{name.replace('_', ' ')} {signals[name]:.0f}/10" for name in TEXT_FIELDS if signals[name] is not None]
+        sanitized = redact("Check-in: " + (", ".join(parts) if parts else "no details given") + ".", proper_names=False)
+    return {
+        "sanitized_text": sanitized,
+        "recommended_intervention_ids": [intervention["id"] for intervention in best],
+        "ai_reasoning": reasoning,
+    }
+
+
+def submit_llm(fn: Callable[..., Dict[str, Any]], *args) -> Future:
+    """Run an LLM analysis on this worker's check-in threads."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.CHECK_IN_LLM_WORKERS, thread_name_prefix="check-in-llm")
+    return _executor.submit(fn, *args)
+
+
+def apply_refinement(check_in_id: int, result: Dict[str, Any]) -> bool:
+    """Replace a stored fast-mode answer with the LLM's. Returns False if the check-in is gone."""
+    db = SessionLocal()
+    try:
+        check_in = db.query(CheckIn).filter(CheckIn.id == check_in_id).first()
+        if check_in is None:
+            return False
+        intervention_ids = rerank(db, check_in.user_id, result["recommended_intervention_ids"])
+        check_in.sanitized_text = result["sanitized_text"]
+        check_in.recommended_intervention_ids = ",".join(intervention_ids)
+        check_in.ai_reasoning = result["ai_reasoning"]
+        replace_recommendations(db, check_in, intervention_ids)
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def refine_when_done(check_in_id: int, future: Future) -> None:
+    """Apply the LLM result of `future` to a stored check-in once it arrives (now, if it already has)."""
+    def _apply(done: Future) -> None:
+        try:
+            apply_refinement(check_in_id, done.result())
+        except Exception:
+            # The fast answer stays
+            logger.exception("Refining check-in %s with the LLM failed", check_in_id)
+
+    future.add_done_callback(_apply)
+
+
+def analyze(check_in_data: str, wearable_features: Optional[Dict[str, Any]], mode: str, llm_allowed: bool,
+            llm_analysis: Callable[..., Dict[str, Any]]) -> Tuple[Dict[str, Any], str, Optional[Future]]:
+    """
+    (result, mode used, pending LLM future) for a check-in. The future, if any, is an
+    LLM analysis still to be applied with refine_when_done() once the check-in is stored.
+    """
+    if mode == "llm" and llm_allowed:
+        future = submit_llm(llm_analysis, check_in_data, wearable_features)
+        try:
+            return future.result(timeout=config.CHECK_IN_LLM_TIMEOUT_SECONDS), "llm", None
+        except TimeoutError:
+            logger.warning("Check-in LLM call exceeded %.1f s; answering in fast mode",
+                           config.CHECK_IN_LLM_TIMEOUT_SECONDS)
+            return recommend(check_in_data, wearable_features), "fast", future
+        except Exception:
+            logger.exception("Check-in LLM call failed; answering in fast mode")
+            return recommend(check_in_data, wearable_features), "fast", None
+
+    result = recommend(check_in_data, wearable_features)
+    pending = None
+    if mode == "fast" and llm_allowed and config.CHECK_IN_FAST_REFINE:
+        pending = submit_llm(llm_analysis, check_in_data, wearable_features)
+    return result, "fast", pending
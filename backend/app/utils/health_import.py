@@ -0,0 +1,349 @@
+"""
+Background import of bulk health exports (Apple Health export.xml, CSV).
+
+The upload is streamed to WEARABLE_IMPORT_DIR and a WearableImportJob row is
+queued; a per-worker thread pool then parses the file in constant memory
+(xml.etree iterparse, clearing every element once read; csv row by row) and
+reduces its records to one daily payload per day:
+
+    {"date": "2024-03-01", "steps": 8412, "heart_rate": {"average": 71.2, "min": 52, "max": 148,
+     "resting": 58}, "sleep": {"total_hours": 7.1}, "active_minutes": 34, "source": "apple_health"}
+
+Days are stored through the same path as POST /user/wearable (deduplicated
+and rolled up) in transactions of DAYS_PER_TRANSACTION, so importing the same
+export twice adds nothing. Progress (bytes and records read, days imported) is
+written to the job row about once a second for GET /user/wearable/import/{id}.
+
+Steps, sleep and exercise minutes are summed per source (Apple Health's
+sourceName, e.g. an iPhone and an Apple Watch) and each day keeps the source
+that recorded the most, since devices record the same activity twice. Imported
+days are stored with created_at at the start of the day they describe, so the
+latest upload stays the most recent day rather than the last one written.
+
+Only days are kept in memory while parsing, since Apple Health groups records
+by type rather than by time: a decade of history is a few thousand entries
+however large the file is.
+
+CSV exports need a time column (date, timestamp, time, datetime, start or
+startDate) and any of the metric columns in CSV_COLUMNS; times are read as
+ISO 8601, and only their date part is used.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import secrets
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+
+from app import config
+from app.database import SessionLocal
+from app.models import WearableImportJob
+from app.utils.versions import WEARABLE, bump_version
+from app.utils.wearable_rollups import store_upload
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("apple_health", "csv")
+
+# Apple Health record types and the metric each feeds
+APPLE_HEALTH_TYPES = {
+    "HKQuantityTypeIdentifierStepCount": "steps",
+    "HKQuantityTypeIdentifierHeartRate": "heart_rate",
+    "HKQuantityTypeIdentifierRestingHeartRate": "resting_heart_rate",
+    "HKQuantityTypeIdentifierAppleExerciseTime": "active_minutes",
+    "HKCategoryTypeIdentifierSleepAnalysis": "sleep_hours",
+}
+
+# CSV header names (lowercased) and the metric each column feeds
+CSV_TIME_COLUMNS = ("date", "timestamp", "time", "datetime", "start", "startdate")
+CSV_COLUMNS = {
+    "steps": "steps",
+    "step_count": "steps",
+    "heart_rate": "heart_rate",
+    "hr": "heart_rate",
+    "bpm": "heart_rate",
+    "resting_heart_rate": "resting_heart_rate",
+    "resting_hr": "resting_heart_rate",
+    "sleep_hours": "sleep_hours",
+    "sleep": "sleep_hours",
+    "active_minutes": "active_minutes",
+    "exercise_minutes": "active_minutes",
+}
+
+# Days written per transaction
+DAYS_PER_TRANSACTION = 200
+
+# Seconds between progress updates of a running job
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+# Upload chunk size when streaming the request body to disk
+CHUNK_SIZE = 1024 * 1024
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+class ImportCancelled(Exception):
+    """The job row disappeared (e.g. the account was wiped) while the import ran."""
+
+
+class _Day:
+    """Running totals of one day's records."""
+
+    __slots__ = ("totals", "hr_sum", "hr_count", "hr_min", "hr_max", "resting")
+
+    def __init__(self):
+        # Summed metrics (steps, sleep_hours, active_minutes) -> source -> total
+        self.totals: Dict[str, Dict[Optional[str], float]] = {}
+        self.hr_sum, self.hr_count = 0.0, 0
+        self.hr_min = self.hr_max = self.resting = None
+
+    def add(self, metric: str, value: float, source: Optional[str] = None) -> None:
+        if metric == "heart_rate":
+            self.hr_sum += value
+            self.hr_count += 1
+            self.hr_min = value if self.hr_min is None else min(self.hr_min, value)
+            self.hr_max = value if self.hr_max is None else max(self.hr_max, value)
+        elif metric == "resting_heart_rate":
+            # Devices report one resting rate a day; keep the lowest if there are several
+            self.resting = value if self.resting is None else min(self.resting, value)
+        else:
+            by_source = self.totals.setdefault(metric, {})
+            by_source[source] = by_source.get(source, 0.0) + value
+
+    def total(self, metric: str) -> Optional[float]:
+        """
+        The day's total of a summed metric from a single source, the one that
+        recorded the most: a phone and a watch both count the same steps and
+        sleep, so adding their records up would double them.
+        """
+        by_source = self.totals.get(metric)
+        return max(by_source.values()) if by_source else None
+
+    def payload(self, day: date, source: str) -> Dict:
+        payload: Dict = {"date": day.isoformat()}
+        steps, sleep_hours, active_minutes = self.total("steps"), self.total("sleep_hours"), self.total("active_minutes")
+        if steps is not None:
+            payload["steps"] = round(steps)
+        heart_rate = {}
+        if self.hr_count:
+            heart_rate = {"average": round(self.hr_sum / self.hr_count, 1), "min": self.hr_min, "max": self.hr_max}
+        if self.resting is not None:
+            heart_rate["resting"] = self.resting
+        if heart_rate:
+            payload["heart_rate"] = heart_rate
+        if sleep_hours is not None:
+            payload["sleep"] = {"total_hours": round(sleep_hours, 2)}
+        if active_minutes is not None:
+            payload["active_minutes"] = round(active_minutes)
+        payload["source"] = source
+        return payload
+
+
+def _parse_time(value: str) -> datetime:
+    # Apple Health writes "2024-03-01 07:12:44 -0800"
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S %z")
+
+
+def iter_apple_health(stream: BinaryIO) -> Iterator[Tuple[date, str, float, Optional[str]]]:
+    """Yield (day, metric, value, sourceName) for every record of interest in an export.xml."""
+    events = ET.iterparse(stream, events=("start", "end"))
+    _, root = next(events)
+    for event, element in events:
+        if event != "end":
+            continue
+        if element.tag == "Record":
+            metric = APPLE_HEALTH_TYPES.get(element.get("type"))
+            start_date = element.get("startDate")
+            try:
+                if metric == "sleep_hours":
+                    # Only time asleep counts, not in bed or awake; a night counts towards the day it ends on
+                    if element.get("value", "").startswith("HKCategoryValueSleepAnalysisAsleep"):
+                        end_date = element.get("endDate")
+                        hours = (_parse_time(end_date) - _parse_time(start_date)).total_seconds() / 3600
+                        yield date.fromisoformat(end_date[:10]), metric, hours, element.get("sourceName")
+                elif metric is not None:
+                    yield date.fromisoformat(start_date[:10]), metric, float(element.get("value")), element.get("sourceName")
+            except (TypeError, ValueError):
+                # Malformed record
+                pass
+        # Drop every finished element (records, workouts, metadata) so memory stays flat
+        if element is not root:
+            root.clear()
+
+
+def iter_csv(stream: BinaryIO) -> Iterator[Tuple[date, str, float, Optional[str]]]:
+    """Yield (day, metric, value, None) for every non-empty metric cell of a CSV export; rows have no source."""
+    reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    header = [name.strip().lower() for name in next(reader, [])]
+    time_index = next((i for i, name in enumerate(header) if name in CSV_TIME_COLUMNS), None)
+    if time_index is None:
+        raise ValueError(f"CSV export needs a time column ({', '.join(CSV_TIME_COLUMNS)})")
+    metric_columns = [(i, CSV_COLUMNS[name]) for i, name in enumerate(header) if name in CSV_COLUMNS]
+    if not metric_columns:
+        raise ValueError(f"CSV export has none of the columns {', '.join(sorted(CSV_COLUMNS))}")
+
+    for row in reader:
+        try:
+            day = date.fromisoformat(row[time_index].strip()[:10])
+        except (IndexError, ValueError):
+            continue
+        for index, metric in metric_columns:
+            try:
+                yield day, metric, float(row[index]), None
+            except (IndexError, ValueError):
+                pass
+
+
+PARSERS: Dict[str, Callable[[BinaryIO], Iterator[Tuple[date, str, float, Optional[str]]]]] = {
+    "apple_health": iter_apple_health,
+    "csv": iter_csv,
+}
+
+
+def detect_format(filename: str) -> Optional[str]:
+    name = filename.lower()
+    if name.endswith(".xml"):
+        return "apple_health"
+    if name.endswith(".csv"):
+        return "csv"
+    return None
+
+
+def upload_path(job_id: str) -> str:
+    return os.path.join(config.WEARABLE_IMPORT_DIR, f"{job_id}.upload")
+
+
+def create_job(db, user_id: int, import_format: str, upload: BinaryIO) -> WearableImportJob:
+    """
+    Copy an uploaded export to disk chunk by chunk and queue its job. Commits.
+    Raises ValueError if the file is larger than WEARABLE_IMPORT_MAX_BYTES.
+    """
+    os.makedirs(config.WEARABLE_IMPORT_DIR, exist_ok=True)
+    job_id = secrets.token_hex(16)
+    path = upload_path(job_id)
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > config.WEARABLE_IMPORT_MAX_BYTES:
+                    raise ValueError(f"Export is larger than {config.WEARABLE_IMPORT_MAX_BYTES} bytes")
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    job = WearableImportJob(id=job_id, user_id=user_id, format=import_format, status="queued", bytes_total=size)
+    db.add(job)
+    db.commit()
+    return job
+
+
+def _update_job(job_id: str, **values) -> None:
+    db = SessionLocal()
+    try:
+        if not db.query(WearableImportJob).filter(WearableImportJob.id == job_id).update(values):
+            raise ImportCancelled(job_id)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _store_days(user_id: int, days: Dict[date, _Day], source: str) -> int:
+    """Write the days' payloads in batched transactions. Returns the number of new uploads."""
+    stored = 0
+    ordered = sorted(days)
+    for start in range(0, len(ordered), DAYS_PER_TRANSACTION):
+        db = SessionLocal()
+        try:
+            batch_stored = 0
+            for day in ordered[start:start + DAYS_PER_TRANSACTION]:
+                payload = json.dumps(days[day].payload(day, source))
+                # Dated by the day it describes, so the latest upload stays the most recent day
+                batch_stored += store_upload(db, user_id, payload, created_at=datetime.combine(day, datetime.min.time()))
+            if batch_stored:
+                bump_version(db, user_id, WEARABLE)
+            db.commit()
+            stored += batch_stored
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    return stored
+
+
+def run_import(job_id: str) -> None:
+    """Parse a queued job's file and store its days, recording progress and the outcome on the job."""
+    db = SessionLocal()
+    try:
+        job = db.query(WearableImportJob).filter(WearableImportJob.id == job_id).first()
+        if job is None or job.status != "queued":
+            return
+        user_id, import_format = job.user_id, job.format
+    finally:
+        db.close()
+
+    path = upload_path(job_id)
+    try:
+        _update_job(job_id, status="running")
+        days: Dict[date, _Day] = {}
+        records = 0
+        next_progress = time.monotonic() + PROGRESS_INTERVAL_SECONDS
+        with open(path, "rb") as stream:
+            for day, metric, value, source in PARSERS[import_format](stream):
+                if day not in days:
+                    days[day] = _Day()
+                days[day].add(metric, value, source)
+                records += 1
+                if time.monotonic() >= next_progress:
+                    _update_job(job_id, bytes_read=stream.tell(), records_read=records)
+                    next_progress = time.monotonic() + PROGRESS_INTERVAL_SECONDS
+
+        _update_job(job_id, bytes_read=os.path.getsize(path), records_read=records)
+        stored = _store_days(user_id, days, import_format)
+        _update_job(job_id, status="done", days_imported=stored, finished_at=datetime.utcnow())
+    except ImportCancelled:
+        pass
+    except Exception as e:
+        logger.exception("Wearable import %s failed", job_id)
+        try:
+            _update_job(job_id, status="failed", error=str(e)[:500], finished_at=datetime.utcnow())
+        except ImportCancelled:
+            pass
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def fail_interrupted_jobs() -> int:
+    """Mark jobs left queued or running by a stopped worker as failed. Returns how many."""
+    db = SessionLocal()
+    try:
+        jobs = db.query(WearableImportJob).filter(WearableImportJob.status.in_(["queued", "running"])).all()
+        for job in jobs:
+            job.status = "failed"
+            job.error = "Interrupted by a restart; upload the export again"
+            job.finished_at = datetime.utcnow()
+            if os.path.exists(upload_path(job.id)):
+                os.remove(upload_path(job.id))
+        db.commit()
+        return len(jobs)
+    finally:
+        db.close()
+
+
+def submit_import(job_id: str) -> None:
+    """Queue a job on this worker's import threads."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=config.WEARABLE_IMPORT_WORKERS, thread_name_prefix="wearable-import")
+    _executor.submit(run_import, job_id)
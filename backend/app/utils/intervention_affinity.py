@@ -0,0 +1,320 @@
+"""
+Personalized intervention ranking from completion history.
+
+Each UserIntervention row carries an affinity: a completion count with
+exponential recency decay (INTERVENTION_AFFINITY_HALF_LIFE_DAYS), updated in
+O(1) on every completion as previous * decay(time since last completion) + 1
+and stored with the row, so it holds across workers and restarts. Rows that
+predate the column count their times_completed instead.
+
+Each worker keeps a user x intervention NumPy matrix of affinities (and last
+completion times) for its most recent INTERVENTION_AFFINITY_CACHE_SIZE users,
+with columns in library order. A row is valid for the user's interventions
+data version (see app/utils/versions.py): the worker that records a completion
+updates its row in place, and other workers reload theirs with one indexed
+lookup of the user's completions when the version moves on.
+
+Item-item similarity is the cosine of co-completion: two interventions are
+similar when the same users complete both. It is recomputed in each worker in
+the background every INTERVENTION_SIMILARITY_REFRESH_SECONDS, in one pass over
+user_interventions that builds a (users x interventions) block per batch and
+accumulates block.T @ block, so requests never aggregate completions in SQL.
+Until the first pass finishes, scores use the user's own affinities alone.
+
+A user's personal score of an intervention blends their own (decayed,
+normalized) affinity with its similarity to what they complete, both 0-1. It
+drives order=personalized on /library/interventions and re-ranks check-in
+recommendations. The similarity matrix can be recomputed by hand:
+
+    python -m app.utils.intervention_affinity
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import config
+from app.database import SessionLocal
+from app.models import UserIntervention
+from app.utils.interventions import INTERVENTIONS_FILE, load_interventions
+from app.utils.versions import INTERVENTIONS, get_version
+
+logger = logging.getLogger(__name__)
+
+# Share of a personal score from the user's own affinities; the rest is similarity to them
+OWN_WEIGHT = 0.5
+
+# Completion rows read per batch of the similarity pass
+SIMILARITY_BATCH_SIZE = 50000
+
+_EPOCH = datetime(1970, 1, 1)
+
+_lock = threading.Lock()
+# Library ids (column order) and their columns, reloaded when the file changes
+_library: Optional[Tuple[float, Tuple[str, ...], Dict[str, int]]] = None
+# Cached users: user_id -> (matrix row, data version), least recently used first
+_slots: "OrderedDict[int, Tuple[int, int]]" = OrderedDict()
+_affinity: Optional[np.ndarray] = None
+_last: Optional[np.ndarray] = None
+# Item-item similarity for the library ids it was computed for, and when
+_similarity: Optional[Tuple[Tuple[str, ...], np.ndarray, float]] = None
+
+_executor: Optional[ThreadPoolExecutor] = None
+_refreshing = False
+
+
+def _seconds(moment: datetime) -> float:
+    return (moment - _EPOCH).total_seconds()
+
+
+def _decay_rate() -> float:
+    return math.log(2) / (config.INTERVENTION_AFFINITY_HALF_LIFE_DAYS * 86400)
+
+
+def next_affinity(previous: Optional[float], last_completed_at: Optional[datetime], completed_at: datetime) -> float:
+    """A completion's affinity given the row's previous affinity and completion time."""
+    if not previous or last_completed_at is None:
+        return 1.0
+    elapsed = max(_seconds(completed_at) - _seconds(last_completed_at), 0.0)
+    return previous * math.exp(-_decay_rate() * elapsed) + 1.0
+
+
+def _columns() -> Tuple[Tuple[str, ...], Dict[str, int]]:
+    """Library ids in file order and their matrix columns. Call with _lock held."""
+    global _library, _affinity, _last
+    try:
+        mtime = os.path.getmtime(INTERVENTIONS_FILE)
+    except OSError:
+        mtime = 0.0
+    if _library is None or _library[0] != mtime:
+        ids = tuple(str(intervention["id"]) for intervention in load_interventions())
+        if _library is None or _library[1] != ids:
+            # Columns moved, so every cached row is stale
+            _slots.clear()
+            _affinity = np.zeros((config.INTERVENTION_AFFINITY_CACHE_SIZE, len(ids)))
+            _last = np.zeros_like(_affinity)
+        _library = (mtime, ids, {intervention_id: column for column, intervention_id in enumerate(ids)})
+    return _library[1], _library[2]
+
+
+def _slot(user_id: int, version: int) -> int:
+    """A matrix row for `user_id`, evicting the least recently used user if needed. Call with _lock held."""
+    if user_id in _slots:
+        slot = _slots[user_id][0]
+    elif len(_slots) < _affinity.shape[0]:
+        slot = len(_slots)
+    else:
+        slot = _slots.popitem(last=False)[1][0]
+    _slots[user_id] = (slot, version)
+    _slots.move_to_end(user_id)
+    return slot
+
+
+def _load_row(db: Session, user_id: int, index: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    affinity = np.zeros(len(index))
+    last = np.zeros(len(index))
+    rows = db.query(UserIntervention.intervention_id, UserIntervention.affinity,
+                    UserIntervention.times_completed, UserIntervention.last_completed_at)\
+        .filter(UserIntervention.user_id == user_id)\
+        .all()
+    for row in rows:
+        column = index.get(row.intervention_id)
+        if column is None or row.last_completed_at is None:
+            continue
+        affinity[column] = row.affinity if row.affinity is not None else (row.times_completed or 0)
+        last[column] = _seconds(row.last_completed_at)
+    return affinity, last
+
+
+def record_completion(user_id: int, intervention_id: str, affinity: float, completed_at: datetime,
+                      version: int) -> None:
+    """
+    Apply a committed completion to this worker's cached row, now at data
+    version `version`. A row that missed other writes is dropped instead.
+    """
+    with _lock:
+        _, index = _columns()
+        cached = _slots.get(user_id)
+        if cached is None:
+            return
+        slot, cached_version = cached
+        if cached_version != version - 1 or intervention_id not in index:
+            del _slots[user_id]
+            return
+        _affinity[slot, index[intervention_id]] = affinity
+        _last[slot, index[intervention_id]] = _seconds(completed_at)
+        _slots[user_id] = (slot, version)
+
+
+def _user_row(db: Session, user_id: int, version: Optional[int]) -> Tuple[Tuple[str, ...], np.ndarray, np.ndarray]:
+    if version is None:
+        version = get_version(db, user_id, INTERVENTIONS)
+    with _lock:
+        ids, index = _columns()
+        cached = _slots.get(user_id)
+        if cached is not None and cached[1] == version:
+            _slots.move_to_end(user_id)
+            return ids, _affinity[cached[0]].copy(), _last[cached[0]].copy()
+
+    affinity, last = _load_row(db, user_id, index)
+    with _lock:
+        if _library[1] == ids:
+            slot = _slot(user_id, version)
+            _affinity[slot] = affinity
+            _last[slot] = last
+    return ids, affinity, last
+
+
+def personal_scores(db: Session, user_id: int, version: Optional[int] = None) -> Dict[str, float]:
+    """
+    The user's 0-1 personal score of every library intervention (see the module
+    docstring); all zero for a user without completions. Pass the user's
+    interventions data version if it is already known.
+    """
+    ids, affinity, last = _user_row(db, user_id, version)
+    if not affinity.any():
+        return dict.fromkeys(ids, 0.0)
+
+    decayed = affinity * np.exp(-_decay_rate() * np.maximum(time.time() - last, 0.0))
+    own = decayed / decayed.max()
+    scores = OWN_WEIGHT * own
+    similar_to = similarity(ids)
+    if similar_to is not None:
+        similar = own @ similar_to
+        if similar.max() > 0:
+            scores = scores + (1 - OWN_WEIGHT) * similar / similar.max()
+    return dict(zip(ids, scores.tolist()))
+
+
+def rerank(db: Session, user_id: int, intervention_ids: List[str]) -> List[str]:
+    """
+    Reorder recommended ids by their rank blended with the user's personal
+    scores (INTERVENTION_AFFINITY_RERANK_WEIGHT), so history breaks near-ties
+    without overriding the recommender.
+    """
+    if len(intervention_ids) < 2 or config.INTERVENTION_AFFINITY_RERANK_WEIGHT <= 0:
+        return intervention_ids
+    scores = personal_scores(db, user_id)
+    count = len(intervention_ids)
+    blended = {
+        intervention_id: (count - rank) / count
+        + config.INTERVENTION_AFFINITY_RERANK_WEIGHT * scores.get(str(intervention_id), 0.0)
+        for rank, intervention_id in enumerate(intervention_ids)
+    }
+    return sorted(intervention_ids, key=lambda intervention_id: -blended[intervention_id])
+
+
+def compute_similarity(db: Session, ids: Tuple[str, ...]) -> np.ndarray:
+    """Co-completion cosine similarity of the library ids (zero diagonal), in one batched pass."""
+    index = {intervention_id: column for column, intervention_id in enumerate(ids)}
+    gram = np.zeros((len(ids), len(ids)))
+    rows = db.execute(
+        select(UserIntervention.user_id, UserIntervention.intervention_id)
+        .order_by(UserIntervention.user_id)
+        .execution_options(yield_per=SIMILARITY_BATCH_SIZE)
+    )
+
+    def accumulate(batch: List[Tuple[int, str]]) -> None:
+        pairs = [(user_id, index[intervention_id]) for user_id, intervention_id in batch if intervention_id in index]
+        if not pairs:
+            return
+        users, columns = np.array(pairs, dtype=np.int64).T
+        _, user_rows = np.unique(users, return_inverse=True)
+        block = np.zeros((user_rows.max() + 1, len(ids)))
+        block[user_rows, columns] = 1.0
+        gram[:] += block.T @ block
+
+    carried: List[Tuple[int, str]] = []
+    for partition in rows.partitions():
+        batch = carried + [tuple(row) for row in partition]
+        # A user's completions may continue in the next partition
+        last_user = batch[-1][0]
+        split = len(batch)
+        while split and batch[split - 1][0] == last_user:
+            split -= 1
+        accumulate(batch[:split])
+        carried = batch[split:]
+    accumulate(carried)
+
+    norms = np.sqrt(np.diag(gram))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = np.nan_to_num(gram / np.outer(norms, norms))
+    np.fill_diagonal(result, 0.0)
+    return result
+
+
+def refresh_similarity() -> np.ndarray:
+    """Recompute this worker's similarity matrix now."""
+    global _similarity, _refreshing
+    try:
+        with _lock:
+            ids, _ = _columns()
+        db = SessionLocal()
+        try:
+            result = compute_similarity(db, ids)
+        finally:
+            db.close()
+        with _lock:
+            _similarity = (ids, result, time.time())
+        return result
+    finally:
+        with _lock:
+            _refreshing = False
+
+
+def _refresh_in_background() -> None:
+    try:
+        refresh_similarity()
+    except Exception:
+        # Scores keep the previous matrix, if any, and the next call retries
+        logger.exception("Recomputing intervention similarity failed")
+
+
+def similarity(ids: Tuple[str, ...]) -> Optional[np.ndarray]:
+    """
+    This worker's similarity matrix for `ids`, or None before the first pass.
+    Queues a background recomputation when it is missing or stale.
+    """
+    global _executor, _refreshing
+    with _lock:
+        current = _similarity if _similarity is not None and _similarity[0] == ids else None
+        stale = current is None or time.time() - current[2] > config.INTERVENTION_SIMILARITY_REFRESH_SECONDS
+        if stale and not _refreshing:
+            _refreshing = True
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="intervention-similarity")
+            _executor.submit(_refresh_in_background)
+    return current[1] if current is not None else None
+
+
+def similarity_expires_at() -> datetime:
+    """
+    When this worker's similarity matrix is next recomputed, which can reorder
+    personalized lists; now if the first pass has not finished.
+    """
+    with _lock:
+        if _similarity is None:
+            return datetime.utcnow()
+        return datetime.utcfromtimestamp(_similarity[2] + config.INTERVENTION_SIMILARITY_REFRESH_SECONDS)
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    matrix = refresh_similarity()
+    elapsed = time.perf_counter() - started
+    with _lock:
+        library_ids, _ = _columns()
+    pairs = [(matrix[i, j], library_ids[i], library_ids[j])
+             for i in range(len(library_ids)) for j in range(i + 1, len(library_ids))]
+    for value, first, second in sorted((pair for pair in pairs if pair[0] > 0), reverse=True)[:5]:
+        print(f"  {first:>4} ~ {second:<4} {value:.3f}")
+    print(f"✓ Recomputed intervention similarity for {len(library_ids)} interventions in {elapsed:.2f} s")
@@ -0,0 +1,134 @@
+"""
+Full-text search over journal entries (SQLite FTS5).
+
+journal_search is an external-content FTS5 index: the text lives only in
+journal_entries (compressed, see app/utils/text_compression.py) and is read
+through the journal_search_content view, so the index adds postings but no
+second copy of every entry. Triggers on journal_entries keep it in sync for
+every insert, update and delete, including expiry sweeps and account wipes.
+
+Each entry is indexed with an `owner` token ("u<user_id>") next to its text.
+A search matches `owner:"u42" AND body:(...)`, so FTS5 intersects the user's
+posting list with the query's instead of ranking every user's matches.
+Results are ranked with BM25 on the text alone.
+"""
+import base64
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Float, Integer, String, bindparam, column, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+# Markers around matched terms in snippets, and the snippet length in tokens
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+SNIPPET_TOKENS = 16
+
+SCHEMA = [
+    """CREATE VIEW IF NOT EXISTS journal_search_content AS
+       SELECT id, 'u' || user_id AS owner, decompress_text(journal_description) AS body FROM journal_entries""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS journal_search USING fts5(
+       owner, body, content='journal_search_content', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS journal_search_insert AFTER INSERT ON journal_entries BEGIN
+       INSERT INTO journal_search (rowid, owner, body)
+       VALUES (new.id, 'u' || new.user_id, decompress_text(new.journal_description));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS journal_search_delete AFTER DELETE ON journal_entries BEGIN
+       INSERT INTO journal_search (journal_search, rowid, owner, body)
+       VALUES ('delete', old.id, 'u' || old.user_id, decompress_text(old.journal_description));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS journal_search_update AFTER UPDATE OF user_id, journal_description ON journal_entries
+       BEGIN
+       INSERT INTO journal_search (journal_search, rowid, owner, body)
+       VALUES ('delete', old.id, 'u' || old.user_id, decompress_text(old.journal_description));
+       INSERT INTO journal_search (rowid, owner, body)
+       VALUES (new.id, 'u' || new.user_id, decompress_text(new.journal_description));
+       END""",
+]
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def create_search_index(connection: Connection) -> None:
+    """Create the index, view and triggers if missing, indexing existing entries on first creation."""
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'journal_search'"
+    )).first()
+    for statement in SCHEMA:
+        connection.execute(text(statement))
+    if not exists:
+        # BM25 over the text only; every row of a search shares the owner token
+        connection.execute(text("INSERT INTO journal_search (journal_search, rank) VALUES ('rank', 'bm25(0.0, 1.0)')"))
+        connection.execute(text("INSERT INTO journal_search (journal_search) VALUES ('rebuild')"))
+
+
+def match_expression(user_id: int, query: str) -> Optional[str]:
+    """
+    FTS5 query for a user's search text: every word must match, the last one as a
+    prefix (search as you type). User input is reduced to quoted words, so FTS5
+    syntax in it is never interpreted. None when the text has no words.
+    """
+    words = _WORD.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return f'owner:"u{int(user_id)}" AND body:({" ".join(terms)})'
+
+
+def _encode_cursor(rank: float, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{rank!r}|{row_id}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, row_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|")
+        return float(rank), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def search(db: Session, user_id: int, query: str, limit: int, cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """
+    One page of the user's unexpired entries matching `query`, best match first,
+    plus the cursor for the next page (None on the last page). Rows have
+    id, created_at, expires_at and snippet.
+    """
+    match = match_expression(user_id, query)
+    if match is None:
+        return [], None
+
+    params = {
+        "match": match, "user_id": user_id, "now": datetime.utcnow(), "limit": limit + 1,
+        "start": HIGHLIGHT_START, "end": HIGHLIGHT_END, "tokens": SNIPPET_TOKENS,
+    }
+    after = ""
+    if cursor:
+        # Keyset over (rank, id): ranks are stable between pages unless the index changes
+        params["rank"], params["row_id"] = _decode_cursor(cursor)
+        after = "AND (journal_search.rank > :rank OR (journal_search.rank = :rank AND e.id > :row_id))"
+
+    rows = db.execute(text(f"""
+        SELECT e.id, e.created_at, e.expires_at, journal_search.rank AS rank,
+               snippet(journal_search, 1, :start, :end, '…', :tokens) AS snippet
+        FROM journal_search JOIN journal_entries e ON e.id = journal_search.rowid
+        WHERE journal_search MATCH :match
+          AND e.user_id = :user_id
+          AND (e.expires_at IS NULL OR e.expires_at > :now)
+          {after}
+        ORDER BY journal_search.rank, e.id
+        LIMIT :limit
+    """).bindparams(bindparam("now", type_=DateTime)).columns(
+        column("id", Integer), column("created_at", DateTime), column("expires_at", DateTime),
+        column("rank", Float), column("snippet", String)
+    ), params).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].rank, rows[-1].id)
+    return rows, next_cursor
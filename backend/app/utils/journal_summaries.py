@@ -0,0 +1,193 @@
+"""
+Condensed journal entries for counseling context.
+
+Counseling sends the selected entries in its first prompt, and every later
+turn resends the whole conversation, so a dozen long entries make each turn of
+the chat slow and expensive. Instead, each long entry is summarized once, in
+the background right after it is created, and the summary is stored on the
+entry (journal_entries.summary). Counseling then builds its journal context
+from the condensed forms under COUNSELING_JOURNAL_TOKEN_BUDGET:
+
+- entries of at most JOURNAL_SUMMARY_MIN_TOKENS are used in full and never summarized
+- longer entries use their summary
+- a long entry whose summary is not ready (still running, or the call failed)
+  uses an excerpt of its opening and is queued for summarizing again
+
+Entries that predate summaries can be summarized by hand:
+
+    python -m app.utils.journal_summaries
+
+Token counts are estimated from the text length (about four characters per
+token for English), which is close enough for budgeting a prompt.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set
+
+from app import config
+from app.database import SessionLocal
+from app.models import JournalEntry
+from app.utils.llm_utils import structured_response
+
+logger = logging.getLogger(__name__)
+
+# Average characters per token used by estimate_tokens()
+CHARS_PER_TOKEN = 4
+
+# Separator between entries in the counseling context
+ENTRY_SEPARATOR = "\n---\n"
+
+# Smallest leftover budget worth filling with a truncated entry
+MIN_PARTIAL_TOKENS = 32
+
+SUMMARY_PROMPT = """You condense private journal entries into context for a supportive counselor.
+
+Summarize the entry in at most {words} words, in the third person ("the user").
+Keep the feelings, their intensity, what triggered them, and any coping the user tried or asked about.
+Leave out names, dates, places and other identifying details."""
+
+SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {
+            "type": "string",
+            "description": "The condensed journal entry"
+        }
+    },
+    "required": ["summary"],
+    "additionalProperties": False
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+# Entries queued or being summarized in this process, so each is summarized once
+_pending: Set[int] = set()
+_pending_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def needs_summary(journal_description: str) -> bool:
+    return estimate_tokens(journal_description) > config.JOURNAL_SUMMARY_MIN_TOKENS
+
+
+def truncate(text: str, tokens: int) -> str:
+    """The opening of `text` within about `tokens` tokens, cut at a word boundary."""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit - 1]
+    if " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    return cut.rstrip() + "…"
+
+
+def summarize_text(journal_description: str) -> str:
+    """Ask the LLM for the condensed form of one entry."""
+    messages = [
+        {"role": "system", "content": SUMMARY_PROMPT.format(words=config.JOURNAL_SUMMARY_MAX_WORDS)},
+        {"role": "user", "content": journal_description}
+    ]
+    result = structured_response(messages=messages, schema=SUMMARY_SCHEMA, schema_name="journal_summary")
+    return result["summary"].strip()
+
+
+def summarize_entry(entry_id: int) -> bool:
+    """
+    Summarize one entry and store the summary, unless it is short, already
+    summarized or gone. Returns whether a summary was stored.
+    """
+    try:
+        db = SessionLocal()
+        try:
+            entry = db.query(JournalEntry.journal_description, JournalEntry.summary)\
+                .filter(JournalEntry.id == entry_id)\
+                .first()
+        finally:
+            db.close()
+        if entry is None or entry.summary is not None or not needs_summary(entry.journal_description):
+            return False
+
+        # No connection is held during the LLM call
+        summary = summarize_text(entry.journal_description)
+
+        db = SessionLocal()
+        try:
+            # Updates nothing if the entry was deleted meanwhile
+            stored = db.query(JournalEntry).filter(JournalEntry.id == entry_id).update({"summary": summary})
+            db.commit()
+            return bool(stored)
+        finally:
+            db.close()
+    except Exception:
+        # Counseling falls back to an excerpt and queues the entry again
+        logger.exception("Summarizing journal entry %s failed", entry_id)
+        return False
+    finally:
+        with _pending_lock:
+            _pending.discard(entry_id)
+
+
+def submit_summary(entry_id: int) -> None:
+    """Queue an entry on this worker's summary threads, unless it is already queued."""
+    global _executor
+    with _pending_lock:
+        if entry_id in _pending:
+            return
+        _pending.add(entry_id)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.JOURNAL_SUMMARY_WORKERS, thread_name_prefix="journal-summary")
+    _executor.submit(summarize_entry, entry_id)
+
+
+def condensed_text(entry: JournalEntry) -> str:
+    """The form of an entry used in counseling context (see the module docstring)."""
+    if not needs_summary(entry.journal_description):
+        return entry.journal_description
+    if entry.summary is not None:
+        return entry.summary
+    submit_summary(entry.id)
+    return truncate(entry.journal_description, config.JOURNAL_SUMMARY_MIN_TOKENS)
+
+
+def journal_context(entries: List[JournalEntry], budget: Optional[int] = None) -> str:
+    """
+    Condensed forms of `entries`, in order, joined with ENTRY_SEPARATOR. Entries
+    stop once the token budget is spent; the entry that crosses it is truncated.
+    """
+    budget = config.COUNSELING_JOURNAL_TOKEN_BUDGET if budget is None else budget
+    parts = []
+    used = 0
+    separator_tokens = estimate_tokens(ENTRY_SEPARATOR)
+    for entry in entries:
+        text = condensed_text(entry)
+        cost = estimate_tokens(text) + (separator_tokens if parts else 0)
+        if used + cost > budget:
+            remaining = budget - used - (separator_tokens if parts else 0)
+            if remaining >= MIN_PARTIAL_TOKENS or not parts:
+                parts.append(truncate(text, max(remaining, MIN_PARTIAL_TOKENS)))
+            break
+        parts.append(text)
+        used += cost
+    return ENTRY_SEPARATOR.join(parts)
+
+
+def summarize_missing_entries() -> int:
+    """Summarize every long entry without a summary, oldest first. Returns how many were summarized."""
+    db = SessionLocal()
+    try:
+        rows = db.query(JournalEntry.id, JournalEntry.journal_description)\
+            .filter(JournalEntry.summary.is_(None))\
+            .order_by(JournalEntry.id)\
+            .yield_per(1000)
+        entry_ids = [row.id for row in rows if needs_summary(row.journal_description)]
+    finally:
+        db.close()
+
+    return sum(summarize_entry(entry_id) for entry_id in entry_ids)
+
+
+if __name__ == "__main__":
+    print(f"✓ Summarized {summarize_missing_entries()} journal entries")
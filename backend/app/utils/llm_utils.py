@@ -3,36 +3,105 @@ Utility module for OpenAI LLM interactions.
 Provides shared client initialization and helper functions.
 """
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
-from typing import List, Dict, Any
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from typing import List, Dict, Any, Optional
 import json
 
-# Load environment variables
-load_dotenv()
+from app import config
+from app.database import SessionLocal
+from app.models import LLMCallLock
 
-# Initialize OpenAI client (shared instance)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# OpenAI client (shared instance), created on first use by get_client()
+_client = None
+_client_lock = threading.Lock()
 
-def structured_response(
+# Polling interval while waiting for another worker's call to finish
+CROSS_WORKER_POLL_SECONDS = 0.2
+
+# In-flight upstream calls in this process, keyed by request hash
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+# Coalescing counters for this process
+_coalesce_stats = {
+    "upstream_calls": 0,
+    "coalesced": 0,
+    "cross_worker_coalesced": 0,
+}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _coalesce_stats[name] += 1
+
+
+def get_coalesce_stats() -> Dict[str, int]:
+    """Return a snapshot of this process's LLM coalescing counters."""
+    with _stats_lock:
+        return dict(_coalesce_stats)
+
+
+def request_key(messages: List[Dict[str, str]], schema_name: str, model: str) -> str:
+    """Hash (model, schema_name, messages) into the key used to coalesce identical calls."""
+    payload = json.dumps([model, schema_name, messages], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_client():
+    """Return the shared OpenAI client, importing and constructing it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Imported lazily: the openai package dominates the app's import time
+            from openai import OpenAI
+            _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return _client
+
+
+def fake_response(schema: Dict[str, Any]) -> Any:
+    """Build a placeholder value matching a JSON schema (used when LLM_FAKE is set)."""
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "null")
+    if kind == "object":
+        return {name: fake_response(prop) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        # Item strings are numbered so id lists (e.g. intervention ids) stay valid
+        item = schema.get("items", {})
+        if item.get("type") == "string" and "enum" not in item:
+            return ["1", "2", "3"]
+        return [fake_response(item)]
+    if kind == "string":
+        return "This is a placeholder response from the fake LLM."
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    return None
+
+
+def _call_openai(
     messages: List[Dict[str, str]],
     schema: Dict[str, Any],
     schema_name: str,
-    model: str = "gpt-5-mini"
+    model: str
 ) -> Dict[str, Any]:
-    """
-    Structured output wrapper for OpenAI API with JSON schema validation.
-    
-    Args:
-        messages: List of message dicts with 'role' and 'content'
-        schema: JSON schema for response validation
-        schema_name: Name for the schema
-        model: Model name to use
-    
-    Returns:
-        Parsed JSON response matching the schema
-    """
-    response = client.responses.create(
+    if config.LLM_FAKE:
+        # Load tests and trace replay run without calling OpenAI
+        time.sleep(config.LLM_FAKE_LATENCY_SECONDS)
+        return fake_response(schema)
+
+    response = get_client().responses.create(
         model=model,
         input=messages,
         text={
@@ -44,5 +113,157 @@ def structured_response(
             }
         }
     )
-    
+
     return json.loads(response.output_text)
+
+
+def _wait_for_other_worker(key: str, owner: str) -> Optional[Dict[str, Any]]:
+    """
+    Try to become the cross-worker leader for `key`, holding its lock row as `owner`.
+
+    Returns the result of another worker's identical call if one finished while we waited,
+    or None once this worker must call upstream itself: as the row's owner, or without
+    the row if another leader still held it at the deadline.
+    """
+    deadline = time.monotonic() + config.LLM_COALESCE_WAIT_SECONDS
+    db = SessionLocal()
+    try:
+        while True:
+            now = datetime.utcnow()
+            stale = now - timedelta(seconds=config.LLM_COALESCE_WAIT_SECONDS)
+
+            # Drop finished results past their TTL and locks nobody has taken over since their owner died
+            db.query(LLMCallLock).filter(
+                LLMCallLock.completed_at < now - timedelta(seconds=config.LLM_COALESCE_RESULT_TTL_SECONDS)
+            ).delete(synchronize_session=False)
+            db.query(LLMCallLock).filter(
+                LLMCallLock.completed_at.is_(None),
+                LLMCallLock.created_at < stale - timedelta(seconds=config.LLM_COALESCE_WAIT_SECONDS)
+            ).delete(synchronize_session=False)
+            db.commit()
+
+            lock = db.query(LLMCallLock).filter(LLMCallLock.key == key).first()
+            if lock is None:
+                try:
+                    db.add(LLMCallLock(key=key, owner=owner, created_at=now))
+                    db.commit()
+                    return None
+                except IntegrityError:
+                    # Another worker inserted the row first; wait for its result
+                    db.rollback()
+            elif lock.result is not None:
+                return json.loads(lock.result)
+            elif lock.created_at < stale:
+                # Its owner died mid-call. Only one worker's takeover matches the stale owner
+                taken = db.query(LLMCallLock).filter(
+                    LLMCallLock.key == key,
+                    LLMCallLock.owner == lock.owner,
+                    LLMCallLock.completed_at.is_(None)
+                ).update({"owner": owner, "created_at": now}, synchronize_session=False)
+                db.commit()
+                if taken:
+                    return None
+
+            if time.monotonic() >= deadline:
+                return None
+
+            db.expire_all()
+            time.sleep(CROSS_WORKER_POLL_SECONDS)
+    finally:
+        db.close()
+
+
+def _release_cross_worker_lock(key: str, owner: str, result: Optional[Dict[str, Any]]) -> None:
+    """
+    Publish the leader's result to other workers, or drop the lock if the call failed.
+    Does nothing unless `owner` still holds the row, e.g. after another worker took it over.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(LLMCallLock).filter(LLMCallLock.key == key, LLMCallLock.owner == owner)
+        if result is None:
+            query.delete(synchronize_session=False)
+        else:
+            query.update(
+                {"result": json.dumps(result), "completed_at": datetime.utcnow()},
+                synchronize_session=False
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _coalesced_upstream_call(
+    key: str,
+    messages: List[Dict[str, str]],
+    schema: Dict[str, Any],
+    schema_name: str,
+    model: str
+) -> Dict[str, Any]:
+    if not config.LLM_COALESCE_CROSS_WORKER:
+        _count("upstream_calls")
+        return _call_openai(messages, schema, schema_name, model)
+
+    owner = uuid.uuid4().hex
+    shared = _wait_for_other_worker(key, owner)
+    if shared is not None:
+        _count("cross_worker_coalesced")
+        return shared
+
+    result = None
+    try:
+        _count("upstream_calls")
+        result = _call_openai(messages, schema, schema_name, model)
+        return result
+    finally:
+        _release_cross_worker_lock(key, owner, result)
+
+
+def structured_response(
+    messages: List[Dict[str, str]],
+    schema: Dict[str, Any],
+    schema_name: str,
+    model: str = "gpt-5-mini"
+) -> Dict[str, Any]:
+    """
+    Structured output wrapper for OpenAI API with JSON schema validation.
+
+    Identical concurrent calls (same model, schema_name and messages) share a single
+    upstream request: the first caller makes it and the others wait for its result.
+    With LLM_COALESCE_CROSS_WORKER enabled, calls are also coalesced across uvicorn
+    workers through the llm_call_locks table.
+
+    Args:
+        messages: List of message dicts with 'role' and 'content'
+        schema: JSON schema for response validation
+        schema_name: Name for the schema
+        model: Model name to use
+
+    Returns:
+        Parsed JSON response matching the schema
+    """
+    key = request_key(messages, schema_name, model)
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not is_leader:
+        _count("coalesced")
+        # Callers may mutate the result, so each one gets its own copy
+        return copy.deepcopy(future.result())
+
+    try:
+        result = _coalesced_upstream_call(key, messages, schema, schema_name, model)
+        future.set_result(result)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+    return copy.deepcopy(result)
@@ -0,0 +1,59 @@
+"""
+Keyset (cursor) pagination over (created_at, id), newest first.
+
+Cursors are opaque to clients: the (created_at, id) of the last row on a page,
+base64url-encoded. Fetching the next page is an index range scan, so response
+time does not grow with the length of a user's history.
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Tuple, List
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(query: Query, model, limit: int, cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """
+    Return one page of `query` ordered by (created_at, id) descending,
+    plus the cursor for the next page (None when this is the last page).
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id)
+        ))
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,293 @@
+"""
+Opt-in per-request sampling profiler.
+
+When PROFILER_ENABLED is set, ProfilingMiddleware profiles requests that carry
+the X-Profile-Token header (matching PROFILER_TOKEN) and a random
+PROFILER_SAMPLE_RATE fraction of all other requests. A background thread samples
+the Python stacks of every thread running application code at
+PROFILER_INTERVAL_SECONDS, so the handler, SQLAlchemy and the OpenAI client are
+all covered without tracing overhead. Each profile is written as a speedscope
+JSON file and a pstats file to a ring buffer of the PROFILER_MAX_PROFILES most
+recent profiles, listed and downloaded through /admin/profiles.
+
+Samples come from all threads running application code, so a profile taken
+while other requests are in flight may include their stacks too; the profile
+metadata records how many were in flight when it started.
+"""
+import hmac
+import json
+import marshal
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import config
+
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+FORMATS = {"speedscope": ".speedscope.json", "pstats": ".pstats"}
+
+# Deepest stack recorded per sample
+MAX_STACK_DEPTH = 256
+
+# Stacks without a frame from the app package are idle threads
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+_PROFILE_ID_PATTERN = re.compile(r"^\d{8}T\d{12}-[0-9a-f]{12}$")
+
+# (filename, first line, function name), the key pstats uses for a function
+FrameKey = Tuple[str, int, str]
+
+
+class _Sampler(threading.Thread):
+    """Samples the stacks of all threads running application code until stopped."""
+
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        # (thread name, stack from root to leaf, seconds since the previous sample)
+        self.samples: List[Tuple[str, List[FrameKey], float]] = []
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+
+    def _sample(self, weight: float) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident:
+                continue
+            stack = []
+            in_app = False
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                in_app = in_app or code.co_filename.startswith(_APP_DIR)
+                frame = frame.f_back
+            if in_app:
+                stack.reverse()
+                self.samples.append((names.get(thread_id, str(thread_id)), stack, weight))
+
+    def stop(self) -> List[Tuple[str, List[FrameKey], float]]:
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+def to_speedscope(name: str, duration: float, samples: List[Tuple[str, List[FrameKey], float]]) -> Dict[str, Any]:
+    """Build a speedscope "sampled" profile with one profile per thread."""
+    frames: List[Dict[str, Any]] = []
+    frame_index: Dict[FrameKey, int] = {}
+    by_thread: Dict[str, Dict[str, list]] = {}
+
+    for thread_name, stack, weight in samples:
+        indexes = []
+        for key in stack:
+            if key not in frame_index:
+                frame_index[key] = len(frames)
+                frames.append({"name": key[2], "file": key[0], "line": key[1]})
+            indexes.append(frame_index[key])
+        profile = by_thread.setdefault(thread_name, {"samples": [], "weights": []})
+        profile["samples"].append(indexes)
+        profile["weights"].append(weight)
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "rerhythm-profiler",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": max(duration, sum(profile["weights"])),
+                "samples": profile["samples"],
+                "weights": profile["weights"],
+            }
+            for thread_name, profile in by_thread.items()
+        ],
+    }
+
+
+def to_pstats(samples: List[Tuple[str, List[FrameKey], float]]) -> Dict[FrameKey, tuple]:
+    """
+    Build the dict pstats.Stats loads from a marshal file.
+    Call counts are sample counts; times are sampled wall-clock seconds.
+    """
+    counts: Dict[FrameKey, int] = {}
+    self_time: Dict[FrameKey, float] = {}
+    total_time: Dict[FrameKey, float] = {}
+    callers: Dict[FrameKey, Dict[FrameKey, list]] = {}
+
+    for _, stack, weight in samples:
+        leaf = stack[-1]
+        self_time[leaf] = self_time.get(leaf, 0.0) + weight
+        # Recursive functions count once per sample
+        for key in set(stack):
+            counts[key] = counts.get(key, 0) + 1
+            total_time[key] = total_time.get(key, 0.0) + weight
+        for caller, callee in set(zip(stack, stack[1:])):
+            edge = callers.setdefault(callee, {}).setdefault(caller, [0, 0, 0.0, 0.0])
+            edge[0] += 1
+            edge[1] += 1
+            edge[3] += weight
+            if callee == leaf:
+                edge[2] += weight
+
+    return {
+        key: (
+            counts[key],
+            counts[key],
+            self_time.get(key, 0.0),
+            total_time[key],
+            {caller: tuple(edge) for caller, edge in callers.get(key, {}).items()},
+        )
+        for key in counts
+    }
+
+
+class ProfileStore:
+    """Ring buffer of recent profiles in a directory shared by all workers."""
+
+    def __init__(self, directory: str, max_profiles: int):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def write(self, profile_id: str, metadata: Dict[str, Any], samples: List[Tuple[str, List[FrameKey], float]]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{metadata['method']} {metadata['path']} ({metadata['duration_ms']} ms)"
+        base = os.path.join(self.directory, profile_id)
+
+        with open(base + FORMATS["speedscope"], "w") as f:
+            json.dump(to_speedscope(name, metadata["duration_ms"] / 1000, samples), f)
+        with open(base + FORMATS["pstats"], "wb") as f:
+            marshal.dump(to_pstats(samples), f)
+        # Written last: a profile is listed only once all of its files exist
+        with open(base + ".meta.json", "w") as f:
+            json.dump(metadata, f)
+
+        self._prune()
+
+    def _profile_ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # Ids start with a UTC timestamp, so they sort oldest first
+        return sorted(name[:-len(".meta.json")] for name in names if name.endswith(".meta.json"))
+
+    def _prune(self) -> None:
+        for profile_id in self._profile_ids()[:-self.max_profiles or None]:
+            for suffix in (".meta.json", *FORMATS.values()):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    # Already pruned by another worker
+                    pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Metadata of the stored profiles, newest first."""
+        profiles = []
+        for profile_id in reversed(self._profile_ids()):
+            try:
+                with open(os.path.join(self.directory, profile_id + ".meta.json")) as f:
+                    profiles.append(json.load(f))
+            except FileNotFoundError:
+                continue
+        return profiles
+
+    def path(self, profile_id: str, fmt: str) -> Optional[str]:
+        """Path of a stored profile file, or None if it does not exist."""
+        if fmt not in FORMATS or not _PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + FORMATS[fmt])
+        return path if os.path.isfile(path) else None
+
+
+profile_store = ProfileStore(config.PROFILER_DIR, config.PROFILER_MAX_PROFILES)
+
+
+class ProfilingMiddleware:
+    """Profile requests selected by the X-Profile-Token header or PROFILER_SAMPLE_RATE."""
+
+    def __init__(self, app: ASGIApp, token: Optional[str] = None, sample_rate: float = 0.0, interval: float = 0.005):
+        self.app = app
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._in_flight = 0
+
+    def _should_profile(self, scope: Scope) -> bool:
+        if self.token:
+            header = Headers(scope=scope).get(PROFILE_TOKEN_HEADER)
+            if header is not None and hmac.compare_digest(header, self.token):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self._in_flight += 1
+        try:
+            if self._should_profile(scope):
+                await self._profile(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            self._in_flight -= 1
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:12]}"
+        other_requests = self._in_flight - 1
+        status = None
+
+        async def send_with_profile_id(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER.lower().encode("latin-1"), profile_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        sampler = _Sampler(self.interval)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            duration = time.perf_counter() - start
+            # Joining the sampler can take up to an interval; not on the event loop
+            samples = await anyio.to_thread.run_sync(sampler.stop)
+            metadata = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "started_at": started_at.isoformat(),
+                "duration_ms": round(duration * 1000, 1),
+                "samples": len(samples),
+                "other_requests_in_flight": other_requests,
+                "pid": os.getpid(),
+            }
+            await anyio.to_thread.run_sync(profile_store.write, profile_id, metadata, samples)
@@ -0,0 +1,175 @@
+"""
+Per-request SQL statistics and slow-query log.
+
+Engine event hooks count the statements each request runs and the time spent
+in them; QueryStatsMiddleware reports both in a Server-Timing header:
+
+    Server-Timing: db;dur=3.1;desc="4 queries"
+
+Statements slower than SLOW_QUERY_MS are logged as one JSON line with the
+normalized SQL, the shape of its parameters and its EXPLAIN QUERY PLAN.
+Tests can bound a route's query count with assert_max_queries().
+"""
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+# Statements worth an EXPLAIN QUERY PLAN in the slow-query log
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+class QueryStats:
+    """Statements run while serving one request and their total duration."""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.count = 0
+        self.duration = 0.0
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+# Active assert_max_queries() blocks, which see statements from every thread
+_observers: List[List[str]] = []
+_observers_lock = threading.Lock()
+
+
+def normalize_sql(statement: str) -> str:
+    """Collapse whitespace, literals and placeholder lists so equal query shapes compare equal."""
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return _PLACEHOLDER_LIST.sub("(?...)", statement)
+
+
+def _parameters_shape(parameters: Any, executemany: bool) -> Any:
+    """Describe parameters by type only, so values never reach the log."""
+    if executemany:
+        rows = list(parameters)
+        return {"rows": len(rows), "row": _parameters_shape(rows[0], False) if rows else None}
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _explain(cursor, statement: str, parameters: Any, executemany: bool) -> Optional[List[str]]:
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    if executemany:
+        parameters = next(iter(parameters), ())
+    try:
+        # A separate DBAPI cursor, so the explain itself is not counted or logged
+        explain_cursor = cursor.connection.cursor()
+        try:
+            rows = explain_cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        finally:
+            explain_cursor.close()
+    except sqlite3.Error:
+        return None
+    return [row[-1] for row in rows]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+
+    if _observers:
+        with _observers_lock:
+            for statements in _observers:
+                statements.append(statement)
+
+    if elapsed * 1000 >= config.SLOW_QUERY_MS:
+        logger.warning(json.dumps({
+            "event": "slow_query",
+            "duration_ms": round(elapsed * 1000, 1),
+            "path": stats.path if stats is not None else None,
+            "sql": normalize_sql(statement),
+            "parameters": _parameters_shape(parameters, executemany),
+            "plan": _explain(cursor, statement, parameters, executemany),
+        }))
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Attach the statement counting and slow-query hooks to an engine."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(max_count: int) -> Iterator[List[str]]:
+    """
+    Fail if the block runs more than `max_count` statements, on any thread.
+
+        with assert_max_queries(3):
+            client.get(f"/journal/history/{user_id}", headers=headers)
+    """
+    statements: List[str] = []
+    with _observers_lock:
+        _observers.append(statements)
+    try:
+        yield statements
+    finally:
+        with _observers_lock:
+            _observers.remove(statements)
+
+    if len(statements) > max_count:
+        listing = "\n".join(f"  {normalize_sql(statement)}" for statement in statements)
+        raise AssertionError(f"Expected at most {max_count} queries, ran {len(statements)}:\n{listing}")
+
+
+class QueryStatsMiddleware:
+    """Report each request's statement count and database time in a Server-Timing header."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope["path"])
+        # Sync handlers run in a copy of this context, so they update the same object
+        token = _current_stats.set(stats)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                timing = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", timing.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
@@ -0,0 +1,146 @@
+"""
+Background garbage collection of abandoned anonymous users.
+
+Every anonymous login creates a new user, so users that show no activity for
+ANON_USER_RETENTION_DAYS are deleted with all their data. Activity is any
+write, or any authenticated request at all (users.last_seen_at), so a user
+who only reads their "delete manually" journal entries keeps them. Deletion
+happens in small batches, each in its own short transaction, with a pause in
+between so request handlers never wait long for the SQLite write lock. The same thread
+applies the raw wearable retention policy (see app/utils/wearable_rollups.py).
+"""
+import logging
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import exists, or_
+from sqlalchemy.orm import Session
+
+from app import config
+from app.database import SessionLocal, engine
+from app.models import User, CheckIn, WearableData, JournalEntry, UserIntervention, Conversation
+from app.utils.accounts import delete_users
+from app.utils.admission import purge_idle_buckets
+from app.utils.auth import invalidate_user
+from app.utils.wearable_rollups import trim_raw_uploads
+
+logger = logging.getLogger(__name__)
+
+_stop_event = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def find_abandoned_users(db: Session, cutoff: datetime, limit: int) -> List[int]:
+    """Ids of anonymous users created before `cutoff` with no activity since."""
+    recent_activity = or_(
+        # Any authenticated request, reads included (see get_current_user_id)
+        User.last_seen_at >= cutoff,
+        exists().where(CheckIn.user_id == User.id, CheckIn.created_at >= cutoff),
+        exists().where(WearableData.user_id == User.id, WearableData.created_at >= cutoff),
+        exists().where(JournalEntry.user_id == User.id, JournalEntry.created_at >= cutoff),
+        exists().where(UserIntervention.user_id == User.id, UserIntervention.last_completed_at >= cutoff),
+        exists().where(Conversation.user_id == User.id, Conversation.updated_at >= cutoff),
+    )
+    rows = db.query(User.id)\
+        .filter(
+            User.is_anonymous == True,  # noqa: E712
+            User.created_at < cutoff,
+            ~recent_activity
+        )\
+        .order_by(User.id)\
+        .limit(limit)\
+        .all()
+    return [row.id for row in rows]
+
+
+def reap_abandoned_users(stop_event: Optional[threading.Event] = None) -> int:
+    """
+    Delete abandoned anonymous users in batches until none are left.
+    Returns the number of users deleted.
+    """
+    stop_event = stop_event or threading.Event()
+    cutoff = datetime.utcnow() - timedelta(days=config.ANON_USER_RETENTION_DAYS)
+    total = 0
+
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            user_ids = find_abandoned_users(db, cutoff, config.ANON_REAPER_BATCH_SIZE)
+            if not user_ids:
+                break
+            total += delete_users(db, user_ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        for user_id in user_ids:
+            invalidate_user(user_id)
+
+        # Give request handlers a chance at the write lock between batches
+        stop_event.wait(config.ANON_REAPER_BATCH_PAUSE_SECONDS)
+
+    if total:
+        _incremental_vacuum()
+    return total
+
+
+def _incremental_vacuum() -> None:
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # Only databases in incremental auto_vacuum mode can release pages this way
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            # Each step frees one page; executescript steps the statement to completion
+            cursor.executescript(f"PRAGMA incremental_vacuum({int(config.ANON_REAPER_VACUUM_PAGES)});")
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _purge_rate_limit_buckets() -> None:
+    # Rate-limit buckets of users who stopped calling (or were reaped) pile up too
+    db = SessionLocal()
+    try:
+        purge_idle_buckets(db)
+    finally:
+        db.close()
+
+
+def _run(stop_event: threading.Event) -> None:
+    # Spread the workers' first runs so they don't start reaping at the same moment
+    stop_event.wait(random.uniform(0, 60))
+    while not stop_event.is_set():
+        try:
+            deleted = reap_abandoned_users(stop_event)
+            if deleted:
+                logger.info("Reaped %d abandoned anonymous users", deleted)
+            _purge_rate_limit_buckets()
+            trimmed = trim_raw_uploads(stop_event)
+            if trimmed:
+                logger.info("Trimmed %d raw wearable uploads past retention", trimmed)
+                _incremental_vacuum()
+        except Exception:
+            logger.exception("Anonymous user reaper failed")
+        stop_event.wait(config.ANON_REAPER_INTERVAL_SECONDS)
+
+
+def start_reaper() -> None:
+    """Start the reaper thread (no-op when disabled or already running)."""
+    global _thread
+    if not config.ANON_REAPER_ENABLED or (_thread is not None and _thread.is_alive()):
+        return
+    _stop_event.clear()
+    _thread = threading.Thread(target=_run, args=(_stop_event,), name="anon-user-reaper", daemon=True)
+    _thread.start()
+
+
+def stop_reaper() -> None:
+    """Signal the reaper thread to stop after its current batch."""
+    _stop_event.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
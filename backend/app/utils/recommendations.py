@@ -0,0 +1,132 @@
+"""
+Normalized check-in recommendations and recommendation-to-completion analytics.
+
+CheckIn.recommended_intervention_ids keeps the comma-joined ids the API has
+always returned. Each id is also stored as a check_in_recommendations row
+(check_in_id, rank, intervention_id, plus the check-in's user_id and
+created_at), so analytics are indexed aggregates instead of a scan of every
+check-in with string splitting in Python. Check-ins stored before the table
+existed are backfilled by the migration step.
+
+A recommendation counts as completed when the user's UserIntervention row for
+that intervention was last completed at or after the user's first
+recommendation of it. UserIntervention keeps only the latest completion, so
+this is the best ordering the data allows.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, case, exists, func
+from sqlalchemy.orm import Session
+
+from app.models import CheckIn, CheckInRecommendation, UserIntervention
+from app.utils.interventions import load_interventions
+
+# Check-ins backfilled per transaction
+BATCH_SIZE = 5000
+
+
+def parse_ids(recommended_intervention_ids: Optional[str]) -> List[str]:
+    """The ids of a comma-joined recommended_intervention_ids value, in order."""
+    if not recommended_intervention_ids:
+        return []
+    return [part.strip() for part in recommended_intervention_ids.split(",") if part.strip()]
+
+
+def _rows(check_in_id: int, user_id: int, created_at: datetime, intervention_ids: List[str]) -> List[Dict]:
+    return [
+        {"check_in_id": check_in_id, "rank": rank, "intervention_id": intervention_id,
+         "user_id": user_id, "created_at": created_at}
+        for rank, intervention_id in enumerate(intervention_ids, start=1)
+    ]
+
+
+def record_recommendations(db: Session, check_in: CheckIn, intervention_ids: List[str]) -> None:
+    """Store a new check-in's recommendations. Flushes the check-in for its id; does not commit."""
+    db.flush()
+    rows = _rows(check_in.id, check_in.user_id, check_in.created_at, [str(i) for i in intervention_ids])
+    if rows:
+        db.bulk_insert_mappings(CheckInRecommendation, rows)
+
+
+def replace_recommendations(db: Session, check_in: CheckIn, intervention_ids: List[str]) -> None:
+    """Swap a stored check-in's recommendations for new ones. Does not commit."""
+    db.query(CheckInRecommendation)\
+        .filter(CheckInRecommendation.check_in_id == check_in.id)\
+        .delete(synchronize_session=False)
+    record_recommendations(db, check_in, intervention_ids)
+
+
+def backfill_recommendations(db: Session) -> int:
+    """Normalize check-ins stored before check_in_recommendations existed. Returns how many."""
+    missing = ~exists().where(CheckInRecommendation.check_in_id == CheckIn.id)
+    total = 0
+    last_id = 0
+    while True:
+        check_ins = db.query(CheckIn.id, CheckIn.user_id, CheckIn.created_at, CheckIn.recommended_intervention_ids)\
+            .filter(CheckIn.id > last_id, CheckIn.recommended_intervention_ids.isnot(None), missing)\
+            .order_by(CheckIn.id)\
+            .limit(BATCH_SIZE)\
+            .all()
+        if not check_ins:
+            return total
+
+        rows = []
+        for check_in in check_ins:
+            rows.extend(_rows(check_in.id, check_in.user_id, check_in.created_at or datetime.utcnow(),
+                              parse_ids(check_in.recommended_intervention_ids)))
+        if rows:
+            db.bulk_insert_mappings(CheckInRecommendation, rows)
+        db.commit()
+        total += len(check_ins)
+        last_id = check_ins[-1].id
+
+
+def conversion_by_intervention(db: Session, user_id: Optional[int] = None) -> List:
+    """
+    Recommendation-to-completion conversion per intervention, most recommended
+    first: rows of intervention_id, recommendations, users_recommended and
+    users_completed. All users' recommendations unless `user_id` is given.
+    """
+    # One row per (user, intervention) recommended, from the (user_id, intervention_id, created_at) index
+    per_user = db.query(
+        CheckInRecommendation.user_id,
+        CheckInRecommendation.intervention_id,
+        func.count().label("recommendations"),
+        func.min(CheckInRecommendation.created_at).label("first_recommended_at")
+    )
+    if user_id is not None:
+        per_user = per_user.filter(CheckInRecommendation.user_id == user_id)
+    per_user = per_user.group_by(CheckInRecommendation.user_id, CheckInRecommendation.intervention_id).subquery()
+
+    completed = exists().where(and_(
+        UserIntervention.user_id == per_user.c.user_id,
+        UserIntervention.intervention_id == per_user.c.intervention_id,
+        UserIntervention.times_completed > 0,
+        UserIntervention.last_completed_at >= per_user.c.first_recommended_at
+    ))
+    recommendations = func.sum(per_user.c.recommendations)
+    return db.query(
+        per_user.c.intervention_id,
+        recommendations.label("recommendations"),
+        func.count().label("users_recommended"),
+        func.sum(case((completed, 1), else_=0)).label("users_completed")
+    ).group_by(per_user.c.intervention_id)\
+        .order_by(recommendations.desc(), per_user.c.intervention_id)\
+        .all()
+
+
+def conversion_report(db: Session, user_id: Optional[int] = None) -> List[Dict]:
+    """conversion_by_intervention() with intervention names and conversion rates, for the API."""
+    names = {str(intervention["id"]): intervention.get("name") for intervention in load_interventions()}
+    return [
+        {
+            "intervention_id": row.intervention_id,
+            "name": names.get(row.intervention_id),
+            "recommendations": row.recommendations,
+            "users_recommended": row.users_recommended,
+            "users_completed": row.users_completed,
+            "conversion_rate": row.users_completed / row.users_recommended
+        }
+        for row in conversion_by_intervention(db, user_id)
+    ]
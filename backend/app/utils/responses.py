@@ -0,0 +1,205 @@
+"""
+Fast JSON responses and negotiated response compression.
+
+FastJSONResponse serializes with orjson or msgspec when installed and falls back
+to the standard library. CompressionMiddleware compresses responses above a size
+threshold with brotli (when installed) or gzip, whichever the client prefers.
+It is a plain ASGI middleware on starlette's public datastructures only, so it
+does not depend on the internals of starlette's GZipMiddleware.
+"""
+import json
+import zlib
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - optional dependency
+    msgspec = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+def _stdlib_dumps(content: Any) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _msgspec_dumps(content: Any) -> bytes:
+    return msgspec.json.encode(content)
+
+
+# Available JSON encoders, fastest first
+JSON_BACKENDS: Dict[str, Callable[[Any], bytes]] = {}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = _orjson_dumps
+if msgspec is not None:
+    JSON_BACKENDS["msgspec"] = _msgspec_dumps
+JSON_BACKENDS["json"] = _stdlib_dumps
+
+
+def get_json_dumps(backend: str = None) -> Callable[[Any], bytes]:
+    """Return the encoder for `backend`, or the fastest available one."""
+    if backend:
+        if backend not in JSON_BACKENDS:
+            raise ValueError(f"JSON backend '{backend}' is not available (have: {', '.join(JSON_BACKENDS)})")
+        return JSON_BACKENDS[backend]
+    return next(iter(JSON_BACKENDS.values()))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fastest available encoder."""
+
+    dumps = staticmethod(get_json_dumps())
+
+    def render(self, content: Any) -> bytes:
+        return self.dumps(content)
+
+
+class _GzipEncoder:
+    content_encoding = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, body: bytes, *, more_body: bool) -> bytes:
+        # Streamed chunks are flushed so each one reaches the client promptly
+        flush_mode = zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH
+        return self._compressor.compress(body) + self._compressor.flush(flush_mode)
+
+
+class _BrotliEncoder:
+    content_encoding = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+
+    def compress(self, body: bytes, *, more_body: bool) -> bytes:
+        if more_body:
+            return self._compressor.process(body) + self._compressor.flush()
+        return self._compressor.process(body) + self._compressor.finish()
+
+
+class _CompressionResponder:
+    """
+    Compress one response with a fresh encoder unless it is smaller than
+    `minimum_size` in a single body message, already encoded, or an event stream.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int, make_encoder: Callable[[], Any]):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.make_encoder = make_encoder
+        self.start_message: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers or \
+                headers.get("content-type", "").startswith("text/event-stream")
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._flush_start()
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self._flush_start()
+                await self.send(message)
+                return
+            self.encoder = self.make_encoder()
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoder.content_encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+                await self._flush_start()
+                await self.send({**message, "body": self.encoder.compress(body, more_body=True)})
+            else:
+                body = self.encoder.compress(body, more_body=False)
+                headers["Content-Length"] = str(len(body))
+                await self._flush_start()
+                await self.send({**message, "body": body})
+            return
+
+        await self.send({**message, "body": self.encoder.compress(body, more_body=more_body)})
+
+    async def _flush_start(self) -> None:
+        if self.start_message is not None:
+            start_message, self.start_message = self.start_message, None
+            await self.send(start_message)
+
+
+def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: q}."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    Compress responses of at least `minimum_size` bytes with the encoding the
+    client prefers: brotli when available and accepted, otherwise gzip.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = _accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        br_q = accepted.get("br", 0.0) if brotli is not None else 0.0
+        gzip_q = accepted.get("gzip", 0.0)
+
+        if br_q > 0 and br_q >= gzip_q:
+            make_encoder = lambda: _BrotliEncoder(self.brotli_quality)
+        elif gzip_q > 0:
+            make_encoder = lambda: _GzipEncoder(self.gzip_level)
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        await _CompressionResponder(self.app, self.minimum_size, make_encoder)(scope, receive, send)
@@ -0,0 +1,257 @@
+"""
+Transparent compression of large Text columns.
+
+CompressedText stores values of TEXT_COMPRESSION_MIN_BYTES or more as a BLOB
+with a one-byte format marker, and smaller values as plain text:
+
+    str              uncompressed (small values, and rows written before compression)
+    b"\\x01" + data   zlib
+    b"\\x02" + frame  zstd; the frame header names the dictionary it was built with
+
+zstd (the optional zstandard package) is used when installed, with the newest
+dictionary trained for the column if there is one; otherwise values fall back
+to zlib. Dictionaries live in the compression_dictionaries table and are
+trained from existing rows by the recompression job, which also rewrites rows
+stored in an older format:
+
+    python -m app.utils.text_compression --train
+
+Compressed values cannot be compared or searched in SQL (=, LIKE); the
+columns using this type are only ever read whole. SQL that needs the text, such
+as the journal search triggers, calls decompress_text(), which every app
+connection registers.
+"""
+import argparse
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Text, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.types import TypeDecorator
+
+from app import config
+from app.database import engine
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+ZLIB = b"\x01"
+ZSTD = b"\x02"
+
+# zstd reserves dictionary ids below 32768; ours are offset table ids
+DICTIONARY_ID_OFFSET = 32768
+
+# How often workers look for dictionaries trained by another process
+DICTIONARY_REFRESH_SECONDS = 300
+
+# Training input per column, and the size of the trained dictionary
+TRAINING_SAMPLES = 5000
+DICTIONARY_SIZE = 32 * 1024
+
+
+class _DictionaryRegistry:
+    """Trained zstd dictionaries, loaded from the database and refreshed periodically."""
+
+    def __init__(self):
+        self._by_id: Dict[int, Any] = {}
+        self._current: Dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        by_id, current = {}, {}
+        try:
+            with engine.connect() as connection:
+                rows = connection.execute(text(
+                    "SELECT id, column_key, data FROM compression_dictionaries ORDER BY id"
+                )).all()
+        except OperationalError:
+            # Table not created yet (migrations have not run)
+            rows = []
+        for row in rows:
+            dict_id = DICTIONARY_ID_OFFSET + row.id
+            dictionary = zstandard.ZstdCompressionDict(row.data, dict_type=zstandard.DICT_TYPE_FULLDICT)
+            dictionary.precompute_compress(level=config.TEXT_COMPRESSION_LEVEL)
+            by_id[dict_id] = dictionary
+            current[row.column_key] = dict_id
+        self._by_id, self._current = by_id, current
+        self._loaded_at = time.monotonic()
+
+    def reload(self) -> None:
+        with self._lock:
+            self._load()
+
+    def current(self, column_key: str) -> Tuple[int, Any]:
+        """(dictionary id, dictionary) to compress new values with; (0, None) when none is trained."""
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > DICTIONARY_REFRESH_SECONDS:
+                self._load()
+            dict_id = self._current.get(column_key, 0)
+            return dict_id, self._by_id.get(dict_id)
+
+    def get(self, dict_id: int) -> Any:
+        with self._lock:
+            if dict_id not in self._by_id:
+                # Trained by another process since the last refresh
+                self._load()
+            return self._by_id[dict_id]
+
+
+dictionaries = _DictionaryRegistry()
+
+
+@event.listens_for(engine, "connect")
+def _register_sql_functions(dbapi_connection, connection_record):
+    # SQL that must see the text (the journal search triggers) reads through decompress_text()
+    register_sql_functions(dbapi_connection)
+
+
+def register_sql_functions(dbapi_connection) -> None:
+    """Make decompress_text(value) available on a raw sqlite3 connection."""
+    dbapi_connection.create_function("decompress_text", 1, decompress, deterministic=True)
+
+
+def compress(value: str, column_key: str) -> Any:
+    """Encode a value for storage: a marked BLOB if compression pays off, the str itself otherwise."""
+    raw = value.encode("utf-8")
+    if len(raw) < config.TEXT_COMPRESSION_MIN_BYTES:
+        return value
+    if zstandard is not None:
+        _, dictionary = dictionaries.current(column_key)
+        compressor = zstandard.ZstdCompressor(level=config.TEXT_COMPRESSION_LEVEL, dict_data=dictionary)
+        encoded = ZSTD + compressor.compress(raw)
+    else:
+        encoded = ZLIB + zlib.compress(raw, config.TEXT_COMPRESSION_ZLIB_LEVEL)
+    return encoded if len(encoded) < len(raw) else value
+
+
+def decompress(stored: Any) -> Optional[str]:
+    """Decode a stored value in any of the supported formats."""
+    if stored is None or isinstance(stored, str):
+        return stored
+    stored = bytes(stored)
+    marker, data = stored[:1], stored[1:]
+    if marker == ZLIB:
+        return zlib.decompress(data).decode("utf-8")
+    if marker == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed value found but the zstandard package is not installed")
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        dictionary = dictionaries.get(dict_id) if dict_id else None
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown compressed text marker {marker!r}")
+
+
+def is_current(stored: Any, column_key: str) -> bool:
+    """Whether a stored value is already in the format compress() would produce now."""
+    if stored is None:
+        return True
+    if isinstance(stored, str):
+        return len(stored.encode("utf-8")) < config.TEXT_COMPRESSION_MIN_BYTES
+    if zstandard is None:
+        return stored[:1] == ZLIB
+    return stored[:1] == ZSTD and zstandard.get_frame_parameters(bytes(stored[1:])).dict_id == dictionaries.current(column_key)[0]
+
+
+class CompressedText(TypeDecorator):
+    """Text column whose large values are stored compressed (see module docstring)."""
+
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, column_key: str, *args, **kwargs):
+        # "<table>.<column>", selects the column's trained dictionary
+        self.column_key = column_key
+        super().__init__(*args, **kwargs)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress(value, self.column_key)
+
+    def process_result_value(self, value, dialect):
+        return decompress(value)
+
+
+def compressed_columns() -> List[Tuple[str, str, str]]:
+    """(table, column, column_key) of every CompressedText column."""
+    from app.models import Base
+    return [
+        (table.name, column.name, column.type.column_key)
+        for table in Base.metadata.sorted_tables
+        for column in table.columns
+        if isinstance(column.type, CompressedText)
+    ]
+
+
+def train_dictionaries() -> Dict[str, int]:
+    """Train a zstd dictionary per column from its newest rows. Returns samples used per column."""
+    if zstandard is None:
+        raise RuntimeError("Dictionary training needs the zstandard package")
+    trained = {}
+    for table, column, column_key in compressed_columns():
+        with engine.connect() as connection:
+            rows = connection.execute(text(
+                f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY id DESC LIMIT :limit"
+            ), {"limit": TRAINING_SAMPLES}).all()
+        samples = [decompress(row[0]).encode("utf-8") for row in rows]
+        with engine.begin() as connection:
+            # The dictionary id is written into every frame, so it must match the row id
+            next_id = connection.execute(text("SELECT COALESCE(MAX(id), 0) + 1 FROM compression_dictionaries")).scalar()
+            try:
+                dictionary = zstandard.train_dictionary(DICTIONARY_SIZE, samples, dict_id=DICTIONARY_ID_OFFSET + next_id)
+            except zstandard.ZstdError:
+                # Too few or too small samples to train on
+                continue
+            connection.execute(text(
+                "INSERT INTO compression_dictionaries (id, column_key, data, created_at) "
+                "VALUES (:id, :column_key, :data, CURRENT_TIMESTAMP)"
+            ), {"id": next_id, "column_key": column_key, "data": dictionary.as_bytes()})
+        trained[column_key] = len(samples)
+    dictionaries.reload()
+    return trained
+
+
+def recompress(batch_size: int = 500, pause: float = 0.2, stop_event: Optional[threading.Event] = None) -> Dict[str, int]:
+    """
+    Rewrite every row not stored in the current format, in short batches with a
+    pause in between so request handlers get the write lock. Returns rows rewritten per column.
+    """
+    stop_event = stop_event or threading.Event()
+    rewritten = {}
+    for table, column, column_key in compressed_columns():
+        rewritten[column_key] = 0
+        last_id = 0
+        while not stop_event.is_set():
+            with engine.begin() as connection:
+                rows = connection.execute(text(
+                    f"SELECT id, {column} FROM {table} WHERE id > :last_id ORDER BY id LIMIT :limit"
+                ), {"last_id": last_id, "limit": batch_size}).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                updates = [
+                    {"id": row.id, "value": compress(decompress(row[1]), column_key)}
+                    for row in rows if not is_current(row[1], column_key)
+                ]
+                if updates:
+                    connection.execute(text(f"UPDATE {table} SET {column} = :value WHERE id = :id"), updates)
+                    rewritten[column_key] += len(updates)
+            stop_event.wait(pause)
+    return rewritten
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompress large text columns")
+    parser.add_argument("--train", action="store_true", help="Train new zstd dictionaries first")
+    args = parser.parse_args()
+
+    if args.train:
+        for key, samples in train_dictionaries().items():
+            print(f"✓ Trained a dictionary for {key} from {samples} rows")
+    for key, count in recompress().items():
+        print(f"✓ Rewrote {count} rows of {key}")
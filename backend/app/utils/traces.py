@@ -0,0 +1,189 @@
+"""
+Capture of sanitized request traces for replay (see benchmarks/replay.py).
+
+When TRACE_CAPTURE_ENABLED is set, TraceCaptureMiddleware appends one JSON line
+per request to a rotating file in TRACE_CAPTURE_DIR (one file per worker
+process). A trace keeps what a replay needs to send a request of the same size
+and shape, and nothing a user wrote:
+
+    {"ts": 1760000000.12, "method": "POST", "route": "/journal/create",
+     "user": "3f9a0c1e52b7", "path_params": {}, "query": {},
+     "body": {"user_id": "int", "journal_description": "str:212", "expiration_type": "7_days"},
+     "status": 200, "duration_ms": 8.4, "request_bytes": 271, "response_bytes": 27}
+
+Users are replaced by a stable pseudonym, strings by their length and numbers
+by their type. Values of SAFE_KEYS (enums and small knobs) are kept, and strings
+holding JSON are recorded by their shape under "$json". Query parameters map to
+the list of their values, since a key may repeat.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import config
+from app.utils.auth import SECRET_KEY, decode_access_token
+
+# Parameters whose values are not user content and are needed to replay faithfully
+SAFE_KEYS = {"expiration_type", "context", "limit", "intervention_id", "role"}
+
+# Larger bodies are recorded by size only
+MAX_SHAPED_BODY_BYTES = 64 * 1024
+
+# Routes never captured
+EXCLUDED_PREFIXES = ("/admin", "/health")
+
+_logger: Optional[logging.Logger] = None
+
+
+def _trace_logger() -> logging.Logger:
+    """Per-process rotating JSONL writer, created on first capture."""
+    global _logger
+    if _logger is None:
+        os.makedirs(config.TRACE_CAPTURE_DIR, exist_ok=True)
+        handler = RotatingFileHandler(
+            os.path.join(config.TRACE_CAPTURE_DIR, f"traces-{os.getpid()}.jsonl"),
+            maxBytes=config.TRACE_CAPTURE_MAX_BYTES,
+            backupCount=config.TRACE_CAPTURE_BACKUPS,
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger = logging.getLogger(f"{__name__}.capture")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def pseudonym(user_id: Any) -> str:
+    """Stable, non-reversible stand-in for a user id."""
+    return hashlib.sha256(f"{SECRET_KEY}:{user_id}".encode("utf-8")).hexdigest()[:12]
+
+
+def shape(value: Any, key: Optional[str] = None) -> Any:
+    """Replace a JSON value by its shape, keeping only SAFE_KEYS values."""
+    if key in SAFE_KEYS and not isinstance(value, (dict, list)):
+        return value
+    if isinstance(value, dict):
+        return {k: shape(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [len(value), shape(value[0]) if value else None]
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        if value[:1] in ("{", "["):
+            try:
+                return {"$json": shape(json.loads(value))}
+            except ValueError:
+                pass
+        return f"str:{len(value)}"
+    return "null"
+
+
+def _param_shape(name: str, value: str) -> str:
+    """Shape of a path or query parameter, which arrives as a string."""
+    if name in SAFE_KEYS:
+        return value
+    return "int" if value.lstrip("-").isdigit() else f"str:{len(value)}"
+
+
+def _query_shape(query_string: str) -> Dict[str, List[str]]:
+    """Shapes of every value of each query parameter, in order; a key may repeat (?ids=1&ids=2)."""
+    query: Dict[str, List[str]] = {}
+    for name, value in parse_qsl(query_string, keep_blank_values=True):
+        query.setdefault(name, []).append(_param_shape(name, value))
+    return query
+
+
+def _user_pseudonym(headers: Headers) -> Optional[str]:
+    authorization = headers.get("Authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    payload = decode_access_token(authorization[7:])
+    if not payload or "sub" not in payload:
+        return None
+    return pseudonym(payload["sub"])
+
+
+class TraceCaptureMiddleware:
+    """Record a sanitized trace of TRACE_CAPTURE_SAMPLE_RATE of all requests."""
+
+    def __init__(self, app: ASGIApp, sample_rate: float = 1.0):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["path"].startswith(EXCLUDED_PREFIXES)
+            or random.random() >= self.sample_rate
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.time()
+        start = time.perf_counter()
+        body = bytearray()
+        request_bytes = 0
+        response_bytes = 0
+        status = None
+
+        async def receive_and_measure() -> Message:
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                request_bytes += len(chunk)
+                if len(body) + len(chunk) <= MAX_SHAPED_BODY_BYTES:
+                    body.extend(chunk)
+            return message
+
+        async def send_and_measure(message: Message) -> None:
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_and_measure, send_and_measure)
+        finally:
+            self._record(scope, started, start, bytes(body), request_bytes, response_bytes, status)
+
+    def _record(self, scope: Scope, started: float, start: float, body: bytes,
+                request_bytes: int, response_bytes: int, status: Optional[int]) -> None:
+        route = scope.get("route")
+        body_shape = None
+        if body and request_bytes <= MAX_SHAPED_BODY_BYTES:
+            try:
+                body_shape = shape(json.loads(body))
+            except ValueError:
+                body_shape = f"bytes:{request_bytes}"
+
+        _trace_logger().info(json.dumps({
+            "ts": round(started, 3),
+            "method": scope["method"],
+            # The route template, so ids in the path are not recorded
+            "route": route.path if route is not None else None,
+            "user": _user_pseudonym(Headers(scope=scope)),
+            "path_params": {name: _param_shape(name, str(value)) for name, value in scope.get("path_params", {}).items()},
+            "query": _query_shape(scope.get("query_string", b"").decode("latin-1")),
+            "body": body_shape,
+            "status": status,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            "request_bytes": request_bytes,
+            "response_bytes": response_bytes,
+        }, separators=(",", ":")))
@@ -0,0 +1,78 @@
+"""
+Per-user, per-resource data version counters backing weak ETags.
+
+Every write path bumps the counter of the resource it changes, in the same
+transaction as the write. List endpoints put the version in a weak ETag, so a
+request whose If-None-Match still matches is answered with 304 before the list
+query runs. The counters live in SQLite, so they hold across uvicorn workers.
+"""
+import hashlib
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import Request, Response
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app.models import DataVersion
+
+JOURNAL = "journal"
+WEARABLE = "wearable"
+INTERVENTIONS = "interventions"
+
+
+def bump_version(db: Session, user_id: int, resource: str) -> int:
+    """Increment a resource's version and return the new one. Does not commit; call inside the write's transaction."""
+    statement = insert(DataVersion).values(user_id=user_id, resource=resource, version=1)
+    return db.execute(statement.on_conflict_do_update(
+        index_elements=[DataVersion.user_id, DataVersion.resource],
+        set_={"version": DataVersion.version + 1}
+    ).returning(DataVersion.version)).scalar_one()
+
+
+def get_version(db: Session, user_id: int, resource: str) -> int:
+    version = db.query(DataVersion.version).filter(
+        DataVersion.user_id == user_id,
+        DataVersion.resource == resource
+    ).scalar()
+    return version or 0
+
+
+def _variant(request: Request) -> str:
+    """Short hash of the query string, since e.g. limit/cursor change the representation."""
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    return hashlib.sha1(query.encode("utf-8")).hexdigest()[:10]
+
+
+def make_etag(request: Request, version: int, expires_at: Optional[datetime] = None) -> str:
+    """
+    Build a weak ETag for the current representation.
+    `expires_at` is when the representation goes stale without any write
+    (e.g. a journal entry expiring); the ETag stops matching after it.
+    """
+    expires = int(expires_at.replace(tzinfo=timezone.utc).timestamp()) if expires_at else 0
+    return f'W/"{version}.{expires}.{_variant(request)}"'
+
+
+def matching_etag(request: Request, version: int) -> Optional[str]:
+    """Return the If-None-Match ETag that is still valid for this version and query, if any."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+
+    now = datetime.now(timezone.utc).timestamp()
+    variant = _variant(request)
+    for etag in header.split(","):
+        etag = etag.strip()
+        try:
+            tag_version, tag_expires, tag_variant = etag.removeprefix("W/").strip('"').split(".")
+            if int(tag_version) == version and tag_variant == variant and (
+                int(tag_expires) == 0 or int(tag_expires) > now
+            ):
+                return etag
+        except ValueError:
+            continue
+    return None
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
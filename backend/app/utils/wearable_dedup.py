@@ -0,0 +1,95 @@
+"""
+Content-hash deduplication of wearable uploads.
+
+The frontend re-posts the same daily payload on every sync. Each upload is
+stored with a hash of its canonical JSON form (keys sorted, no whitespace), and
+a unique (user_id, content_hash) index turns repeat uploads into no-ops.
+
+This is deliberate for created_at as well: it stays the time the content was
+first uploaded, so the latest upload (GET /user/wearable/check, the check-in
+prompt features keyed on its id and created_at) only moves when new data
+arrives, and re-syncs invalidate no caches. Sync activity itself counts for the
+anonymous user reaper through users.last_seen_at instead.
+
+compact_wearable_duplicates() is the one-off job for rows stored before the
+hash existed: it hashes them and deletes every duplicate but the first upload.
+The migration step runs it before creating the unique index; it can also be
+run by hand:
+
+    python -m app.utils.wearable_dedup
+"""
+import hashlib
+import json
+from typing import Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import WearableData
+from app.utils.versions import WEARABLE, bump_version
+
+# Rows hashed or deleted per transaction
+BATCH_SIZE = 5000
+
+
+def canonical_hash(wearable_data: str) -> str:
+    """sha256 of the payload's canonical JSON form (or of the raw text if it is not JSON)."""
+    try:
+        canonical = json.dumps(json.loads(wearable_data), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    except ValueError:
+        canonical = wearable_data.strip()
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _backfill_hashes(db: Session) -> int:
+    hashed = 0
+    while True:
+        rows = db.query(WearableData.id, WearableData.wearable_data)\
+            .filter(WearableData.content_hash.is_(None))\
+            .limit(BATCH_SIZE)\
+            .all()
+        if not rows:
+            return hashed
+        db.bulk_update_mappings(WearableData, [
+            {"id": row.id, "content_hash": canonical_hash(row.wearable_data)} for row in rows
+        ])
+        db.commit()
+        hashed += len(rows)
+
+
+def _delete_duplicates(db: Session) -> int:
+    # Keep the first upload of each (user, content) pair
+    first_ids = db.query(func.min(WearableData.id))\
+        .group_by(WearableData.user_id, WearableData.content_hash)
+    duplicates = db.query(WearableData.id, WearableData.user_id)\
+        .filter(WearableData.id.notin_(first_ids.scalar_subquery()))\
+        .all()
+
+    for start in range(0, len(duplicates), BATCH_SIZE):
+        batch = duplicates[start:start + BATCH_SIZE]
+        db.query(WearableData)\
+            .filter(WearableData.id.in_([row.id for row in batch]))\
+            .delete(synchronize_session=False)
+        # The latest upload may have changed, so cached /user/wearable/check responses are stale
+        for user_id in {row.user_id for row in batch}:
+            bump_version(db, user_id, WEARABLE)
+        db.commit()
+    return len(duplicates)
+
+
+def compact_wearable_duplicates(db: Session) -> Tuple[int, int]:
+    """Hash unhashed rows and collapse duplicates. Returns (rows hashed, rows deleted)."""
+    hashed = _backfill_hashes(db)
+    deleted = _delete_duplicates(db)
+    return hashed, deleted
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        hashed, deleted = compact_wearable_duplicates(session)
+    finally:
+        session.close()
+    print(f"✓ Hashed {hashed} wearable uploads and removed {deleted} duplicates")
@@ -0,0 +1,192 @@
+"""
+Compact wearable features for LLM prompts.
+
+Instead of a raw wearable payload (one day, many tokens), prompts get a short
+feature dict computed over the user's recent history: 7- and 30-day baselines,
+the resting heart rate z-score, sleep debt, the activity trend and a stress
+proxy. Values come from the daily rollups (see app/utils/wearable_rollups.py)
+and are laid out as a (days x metrics) NumPy array with NaN for missing days,
+so every feature comes out of one vectorized pass.
+
+When the rollups carry no metric for the user (a payload format the rollups
+do not read, or an upload not rolled up yet), prompts get a trimmed copy of
+the newest raw payload under "latest_upload" instead, so wearable context is
+never silently dropped.
+
+Features are cached per user in each worker, keyed by the user's newest upload
+(id and created_at), so a new upload invalidates them in every worker. The
+created_at also keeps a reused user id from hitting a deleted user's entry.
+"""
+import json
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app import config
+from app.models import WearableData, WearableDailyRollup
+
+# Days of history the features look at, ending at the latest day with data
+WINDOW_DAYS = 30
+
+# Nightly sleep the sleep debt is measured against
+SLEEP_NEED_HOURS = 7.5
+
+# Metric columns and the daily rollup column each is read from
+METRICS = {
+    "resting_hr": "hr_min",
+    "sleep_hours": "sleep_hours",
+    "steps": "steps",
+    "active_minutes": "active_minutes",
+}
+_COLUMNS = {name: index for index, name in enumerate(METRICS)}
+
+# Size limits of the raw payload fallback: whole payload, each string, and
+# longest list kept (longer ones are sample series that only cost tokens)
+RAW_FALLBACK_MAX_CHARS = 1500
+RAW_FALLBACK_MAX_STRING = 80
+RAW_FALLBACK_MAX_LIST = 5
+
+_cache: "OrderedDict[int, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def daily_matrix(rollups: List[WearableDailyRollup]) -> Optional[np.ndarray]:
+    """
+    Lay daily rollups out as a (WINDOW_DAYS x metrics) array, oldest day first,
+    ending at the latest day with data. Missing days and metrics are NaN.
+    """
+    if not rollups:
+        return None
+
+    last_day = max(rollup.day for rollup in rollups)
+    matrix = np.full((WINDOW_DAYS, len(METRICS)), np.nan)
+    for rollup in rollups:
+        offset = (last_day - rollup.day).days
+        if offset < WINDOW_DAYS:
+            matrix[WINDOW_DAYS - 1 - offset] = [
+                np.nan if getattr(rollup, column) is None else getattr(rollup, column) for column in METRICS.values()
+            ]
+    return matrix
+
+
+def _round(value: float, digits: int = 1) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def compute_features(matrix: np.ndarray) -> Dict[str, Any]:
+    """Summarize a daily matrix into the compact feature dict used in prompts."""
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        # Metrics with no data at all come out as NaN ("Mean of empty slice")
+        warnings.simplefilter("ignore", RuntimeWarning)
+        last_7 = matrix[-7:]
+        # Column-wise baselines for every metric at once (NaN-aware)
+        mean_7 = np.nanmean(last_7, axis=0)
+        mean_30 = np.nanmean(matrix, axis=0)
+        std_30 = np.nanstd(matrix, axis=0)
+
+        # Latest observed value of each metric
+        observed = np.isfinite(matrix)
+        last_index = np.where(observed.any(axis=0), WINDOW_DAYS - 1 - np.argmax(observed[::-1], axis=0), -1)
+        latest = np.where(last_index >= 0, matrix[last_index.clip(0), np.arange(len(METRICS))], np.nan)
+        # A flat baseline gives a z-score of 0, a metric with no data gives NaN
+        z_latest = np.where(std_30 > 0, (latest - mean_30) / std_30, np.where(np.isfinite(latest), 0.0, np.nan))
+
+        sleep_7 = last_7[:, _COLUMNS["sleep_hours"]]
+        sleep_debt = np.nansum(np.clip(SLEEP_NEED_HOURS - sleep_7, 0, None)) if np.isfinite(sleep_7).any() else np.nan
+
+        activity_trend = mean_7[_COLUMNS["steps"]] / mean_30[_COLUMNS["steps"]] - 1
+
+        # Stress proxy: resting heart rate above baseline and sleep below it, in z units
+        stress_parts = np.array([z_latest[_COLUMNS["resting_hr"]], -z_latest[_COLUMNS["sleep_hours"]]])
+        stress_parts = stress_parts[np.isfinite(stress_parts)]
+        stress = float(np.clip(stress_parts.mean(), -3, 3)) if stress_parts.size else np.nan
+
+    features: Dict[str, Any] = {"days_with_data": int(observed.any(axis=1).sum())}
+    for name, column in _COLUMNS.items():
+        features[name] = {
+            "latest": _round(latest[column]),
+            "avg_7d": _round(mean_7[column]),
+            "avg_30d": _round(mean_30[column]),
+        }
+    features["resting_hr"]["z_score"] = _round(z_latest[_COLUMNS["resting_hr"]], 2)
+    features["sleep_debt_7d_hours"] = _round(sleep_debt)
+    features["activity_trend_7d_vs_30d"] = _round(activity_trend, 2)
+    features["stress_proxy"] = _round(stress, 2)
+    if not np.isnan(stress):
+        features["stress_level"] = "high" if stress >= 1 else "elevated" if stress >= 0.5 else "normal"
+
+    # Unknown values only cost prompt tokens
+    compact: Dict[str, Any] = {}
+    for name, value in features.items():
+        if isinstance(value, dict):
+            value = {k: v for k, v in value.items() if v is not None}
+        if value not in (None, {}):
+            compact[name] = value
+    return compact
+
+
+def _trim(value: Any) -> Any:
+    if isinstance(value, dict):
+        trimmed = {key: _trim(item) for key, item in value.items()}
+        return {key: item for key, item in trimmed.items() if item not in (None, {})}
+    if isinstance(value, list):
+        return [_trim(item) for item in value] if len(value) <= RAW_FALLBACK_MAX_LIST else None
+    if isinstance(value, str):
+        return value[:RAW_FALLBACK_MAX_STRING]
+    return value
+
+
+def raw_fallback(wearable_data: str) -> Dict[str, Any]:
+    """The features used when the rollups have no metric: a trimmed copy of the raw payload."""
+    try:
+        payload = json.loads(wearable_data)
+    except (TypeError, ValueError):
+        return {"days_with_data": 0, "latest_upload": (wearable_data or "")[:RAW_FALLBACK_MAX_CHARS]}
+
+    trimmed = _trim(payload)
+    if isinstance(trimmed, dict):
+        # Drop trailing sections until the payload fits
+        while len(trimmed) > 1 and len(json.dumps(trimmed, separators=(",", ":"))) > RAW_FALLBACK_MAX_CHARS:
+            trimmed.popitem()
+    text = json.dumps(trimmed, separators=(",", ":"))
+    return {"days_with_data": 0, "latest_upload": trimmed if len(text) <= RAW_FALLBACK_MAX_CHARS
+            else text[:RAW_FALLBACK_MAX_CHARS]}
+
+
+def get_wearable_features(db: Session, user_id: int) -> Optional[Dict[str, Any]]:
+    """Return the user's wearable features, or None when they have no wearable data."""
+    newest = db.query(WearableData.id, WearableData.created_at)\
+        .filter(WearableData.user_id == user_id)\
+        .order_by(WearableData.created_at.desc(), WearableData.id.desc())\
+        .first()
+    if newest is None:
+        return None
+    key = (newest.id, newest.created_at)
+
+    with _cache_lock:
+        cached = _cache.get(user_id)
+        if cached is not None and cached[0] == key:
+            _cache.move_to_end(user_id)
+            return cached[1]
+
+    rollups = db.query(WearableDailyRollup)\
+        .filter(WearableDailyRollup.user_id == user_id)\
+        .order_by(WearableDailyRollup.day.desc())\
+        .limit(WINDOW_DAYS)\
+        .all()
+    matrix = daily_matrix(rollups)
+    features = compute_features(matrix) if matrix is not None else None
+    if features is None or not features.get("days_with_data"):
+        wearable_data = db.query(WearableData.wearable_data).filter(WearableData.id == newest.id).scalar()
+        features = raw_fallback(wearable_data)
+
+    with _cache_lock:
+        _cache[user_id] = (key, features)
+        _cache.move_to_end(user_id)
+        while len(_cache) > config.WEARABLE_FEATURE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return features
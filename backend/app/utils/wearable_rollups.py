@@ -0,0 +1,306 @@
+"""
+Daily and weekly rollups of wearable uploads, and raw-data retention.
+
+Each payload describes one day. On ingest, the upload's metrics become that
+day's row in wearable_daily_rollups (the newest upload of a day wins) and the
+week's row in wearable_weekly_rollups is recomputed from its at most seven
+daily rows, so trend reads never touch raw payloads and cost the same however
+much history a user has.
+
+An upload's `day` column is set when it is rolled up. Uploads stored before
+rollups existed, and days whose upload had no recognized metric when it was
+rolled up, are (re-)rolled up by the migration step, or by hand:
+
+    python -m app.utils.wearable_rollups
+
+Raw uploads for days older than WEARABLE_RAW_RETENTION_DAYS are then trimmed
+by the reaper thread: "downsample" keeps the upload each daily rollup came
+from, "drop" deletes them all.
+"""
+import json
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, exists, func, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app import config
+from app.database import SessionLocal
+from app.models import WearableData, WearableDailyRollup, WearableWeeklyRollup
+from app.utils.versions import WEARABLE, bump_version
+from app.utils.wearable_dedup import canonical_hash
+
+# Rollup columns and the payload paths each can be read from, first match wins.
+# Payloads without a daily minimum heart rate report the resting rate instead.
+# The nested biometrics/activity/sleep paths are the app's own sync format
+# (frontend/public/wearable_example.json).
+METRICS = {
+    "hr_min": [("heart_rate", "min"), ("heart_rate", "resting"), ("resting_heart_rate",),
+               ("biometrics", "resting_heart_rate")],
+    "hr_mean": [("heart_rate", "average"), ("heart_rate", "mean"), ("average_heart_rate",)],
+    "hr_max": [("heart_rate", "max"), ("max_heart_rate",)],
+    "steps": [("steps",), ("activity", "steps")],
+    "sleep_hours": [("sleep", "total_hours"), ("sleep_hours",), ("sleep", "total_sleep_duration_min")],
+    "active_minutes": [("active_minutes",), ("activity", "active_minutes")],
+}
+
+# Paths reported in other units than their rollup column, and the factor converting them
+UNIT_FACTORS = {
+    ("sleep", "total_sleep_duration_min"): 1 / 60,
+}
+
+# Intraday series (GET /user/wearable/series) and where an upload carries their samples.
+# Payloads give no start time, so samples are placed INTRADAY_INTERVAL apart from the start of their day
+INTRADAY_SERIES = {
+    "hr_5min": ("trends", "hr_5min_samples"),
+    "hrv_5min": ("trends", "hrv_5min_samples"),
+}
+INTRADAY_INTERVAL = timedelta(minutes=5)
+
+# Uploads rolled up or trimmed per transaction
+BATCH_SIZE = 1000
+
+
+def _read_metric(payload: Dict[str, Any], paths: list) -> Optional[float]:
+    for path in paths:
+        value: Any = payload
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value) * UNIT_FACTORS.get(path, 1)
+    return None
+
+
+def read_intraday(wearable_data: str, path: Tuple[str, ...]) -> List[float]:
+    """The numeric samples at `path` in an upload; empty if it has none."""
+    try:
+        value: Any = json.loads(wearable_data)
+    except (TypeError, ValueError):
+        return []
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    if not isinstance(value, list):
+        return []
+    return [float(sample) for sample in value if isinstance(sample, (int, float)) and not isinstance(sample, bool)]
+
+
+def parse_upload(wearable_data: str, created_at: datetime) -> Tuple[date, Optional[Dict[str, Optional[float]]]]:
+    """
+    (day, metrics) of an upload. The day is the payload's "date", else the upload
+    day; metrics are None for payloads that are not a JSON object.
+    """
+    try:
+        payload = json.loads(wearable_data)
+    except (TypeError, ValueError):
+        payload = None
+    if not isinstance(payload, dict):
+        return created_at.date(), None
+
+    try:
+        day = date.fromisoformat(str(payload["date"])[:10])
+    except (KeyError, ValueError):
+        day = created_at.date()
+    return day, {name: _read_metric(payload, paths) for name, paths in METRICS.items()}
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _refresh_week(db: Session, user_id: int, start: date) -> None:
+    totals = db.query(
+        func.count(),
+        func.min(WearableDailyRollup.hr_min),
+        func.avg(WearableDailyRollup.hr_mean),
+        func.max(WearableDailyRollup.hr_max),
+        func.sum(WearableDailyRollup.steps),
+        func.sum(WearableDailyRollup.sleep_hours),
+        func.sum(WearableDailyRollup.active_minutes),
+    ).filter(
+        WearableDailyRollup.user_id == user_id,
+        WearableDailyRollup.day >= start,
+        WearableDailyRollup.day < start + timedelta(days=7)
+    ).one()
+
+    values = dict(zip(
+        ["days", "hr_min", "hr_mean", "hr_max", "steps_total", "sleep_hours_total", "active_minutes_total"],
+        totals
+    ))
+    values["updated_at"] = datetime.utcnow()
+    statement = insert(WearableWeeklyRollup).values(user_id=user_id, week_start=start, **values)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[WearableWeeklyRollup.user_id, WearableWeeklyRollup.week_start],
+        set_=values
+    ))
+
+
+def _upsert_daily(db: Session, rows: List[Dict[str, Any]]) -> int:
+    """Write daily rollups unless a newer upload already describes the day. Returns rows written."""
+    statement = insert(WearableDailyRollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=[WearableDailyRollup.user_id, WearableDailyRollup.day],
+        set_={name: statement.excluded[name] for name in ["source_id", *METRICS, "updated_at"]},
+        where=WearableDailyRollup.source_id < statement.excluded.source_id
+    )
+    # Core execution: the ORM would treat a list of rows as a bulk insert without a rowcount
+    return db.connection().execute(statement, rows).rowcount
+
+
+def _daily_row(user_id: int, upload_id: int, day: date, metrics: Dict[str, Optional[float]]) -> Dict[str, Any]:
+    return {"user_id": user_id, "day": day, "source_id": upload_id, "updated_at": datetime.utcnow(), **metrics}
+
+
+def rollup_upload(db: Session, user_id: int, upload_id: int, day: date,
+                  metrics: Optional[Dict[str, Optional[float]]]) -> None:
+    """Fold one upload into the user's daily and weekly rollups. Does not commit."""
+    if metrics is not None and _upsert_daily(db, [_daily_row(user_id, upload_id, day, metrics)]):
+        _refresh_week(db, user_id, week_start(day))
+
+
+def store_upload(db: Session, user_id: int, wearable_data: str, created_at: Optional[datetime] = None) -> bool:
+    """
+    Store one upload and fold it into the rollups, unless the user already uploaded
+    the same content. Returns whether it was stored. Does not commit or bump versions.
+    A repeat upload leaves the stored row, including its created_at, untouched: the
+    row records when the content first arrived (see app/utils/wearable_dedup.py).
+    """
+    created_at = created_at or datetime.utcnow()
+    day, metrics = parse_upload(wearable_data, created_at)
+    statement = insert(WearableData).values(
+        user_id=user_id,
+        wearable_data=wearable_data,
+        content_hash=canonical_hash(wearable_data),
+        day=day,
+        created_at=created_at
+    ).on_conflict_do_nothing(index_elements=[WearableData.user_id, WearableData.content_hash])\
+        .returning(WearableData.id)
+
+    upload_id = db.execute(statement).scalar()
+    if upload_id is None:
+        return False
+    rollup_upload(db, user_id, upload_id, day, metrics)
+    return True
+
+
+def rollup_pending_uploads(db: Session) -> int:
+    """Roll up uploads stored without a day, oldest first. Returns the number rolled up."""
+    total = 0
+    while True:
+        uploads = db.query(WearableData.id, WearableData.user_id, WearableData.wearable_data, WearableData.created_at)\
+            .filter(WearableData.day.is_(None))\
+            .order_by(WearableData.id)\
+            .limit(BATCH_SIZE)\
+            .all()
+        if not uploads:
+            return total
+
+        days, daily_rows = [], []
+        for upload in uploads:
+            day, metrics = parse_upload(upload.wearable_data, upload.created_at or datetime.utcnow())
+            days.append({"id": upload.id, "day": day})
+            if metrics is not None:
+                daily_rows.append(_daily_row(upload.user_id, upload.id, day, metrics))
+
+        # One statement for the batch's days, then each touched week once
+        if daily_rows:
+            _upsert_daily(db, daily_rows)
+        for user_id, start in {(row["user_id"], week_start(row["day"])) for row in daily_rows}:
+            _refresh_week(db, user_id, start)
+        db.bulk_update_mappings(WearableData, days)
+        db.commit()
+        total += len(uploads)
+
+
+def reparse_empty_rollups(db: Session) -> int:
+    """
+    Re-read the source upload of daily rollups without any metric, e.g. days
+    uploaded before their payload format was recognized. Returns the number of
+    days that now have metrics.
+    """
+    empty = and_(*(getattr(WearableDailyRollup, name).is_(None) for name in METRICS))
+    total = 0
+    last = (0, date.min)
+    while True:
+        rollups = db.query(WearableDailyRollup.user_id, WearableDailyRollup.day,
+                           WearableData.wearable_data, WearableData.created_at)\
+            .join(WearableData, WearableData.id == WearableDailyRollup.source_id)\
+            .filter(tuple_(WearableDailyRollup.user_id, WearableDailyRollup.day) > last, empty)\
+            .order_by(WearableDailyRollup.user_id, WearableDailyRollup.day)\
+            .limit(BATCH_SIZE)\
+            .all()
+        if not rollups:
+            return total
+
+        weeks = set()
+        for rollup in rollups:
+            _, metrics = parse_upload(rollup.wearable_data, rollup.created_at or datetime.utcnow())
+            if metrics is None or all(value is None for value in metrics.values()):
+                continue
+            # Same source upload, so _upsert_daily's newer-upload condition would skip it
+            db.query(WearableDailyRollup)\
+                .filter(WearableDailyRollup.user_id == rollup.user_id, WearableDailyRollup.day == rollup.day)\
+                .update({**metrics, "updated_at": datetime.utcnow()}, synchronize_session=False)
+            weeks.add((rollup.user_id, week_start(rollup.day)))
+            total += 1
+        for user_id, start in weeks:
+            _refresh_week(db, user_id, start)
+        for user_id in {user_id for user_id, _ in weeks}:
+            bump_version(db, user_id, WEARABLE)
+        db.commit()
+        last = (rollups[-1].user_id, rollups[-1].day)
+
+
+def trim_raw_uploads(stop_event: Optional[threading.Event] = None) -> int:
+    """
+    Apply the raw-data retention policy in batches, pausing between them like the
+    reaper. Only rolled-up uploads are trimmed. Returns the number of uploads deleted.
+    """
+    if config.WEARABLE_RAW_RETENTION_DAYS <= 0:
+        return 0
+    stop_event = stop_event or threading.Event()
+    cutoff = date.today() - timedelta(days=config.WEARABLE_RAW_RETENTION_DAYS)
+
+    expired = WearableData.day < cutoff
+    if config.WEARABLE_RAW_RETENTION_MODE == "downsample":
+        expired = and_(expired, ~exists().where(
+            WearableDailyRollup.user_id == WearableData.user_id,
+            WearableDailyRollup.day == WearableData.day,
+            WearableDailyRollup.source_id == WearableData.id
+        ))
+
+    total = 0
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            uploads = db.query(WearableData.id, WearableData.user_id).filter(expired).limit(BATCH_SIZE).all()
+            if not uploads:
+                break
+            db.query(WearableData)\
+                .filter(WearableData.id.in_([upload.id for upload in uploads]))\
+                .delete(synchronize_session=False)
+            # Dropping may remove a user's latest upload, which /user/wearable/check serves
+            for user_id in {upload.user_id for upload in uploads}:
+                bump_version(db, user_id, WEARABLE)
+            db.commit()
+            total += len(uploads)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        # Give request handlers a chance at the write lock between batches
+        stop_event.wait(config.ANON_REAPER_BATCH_PAUSE_SECONDS)
+    return total
+
+
+if __name__ == "__main__":
+    session = SessionLocal()
+    try:
+        rolled_up = rollup_pending_uploads(session)
+        reparsed = reparse_empty_rollups(session)
+    finally:
+        session.close()
+    print(f"✓ Rolled up {rolled_up} wearable uploads, re-read {reparsed} days without metrics")
@@ -0,0 +1,97 @@
+"""
+Benchmark: wiping a heavy user (100k wearable rows).
+
+Compares the previous ORM cascade (db.delete(user), which loads every child row
+and issues one DELETE per row) with the set-based delete used by
+/auth/account/wipe. Runs against a throwaway SQLite file, not app.db.
+
+    python benchmarks/bench_account_wipe.py
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Base, User, WearableData, JournalEntry, Conversation  # noqa: E402
+from app.utils.accounts import delete_users  # noqa: E402
+
+WEARABLE_ROWS = 100_000
+JOURNAL_ROWS = 1_000
+CONVERSATION_ROWS = 200
+
+WEARABLE_PAYLOAD = json.dumps({
+    "steps": 8500,
+    "heart_rate": {"average": 72, "resting": 65, "max": 145},
+    "sleep": {"total_hours": 7.5, "deep_sleep_hours": 2.0, "rem_sleep_hours": 1.5},
+    "active_minutes": 45,
+    "calories_burned": 2100
+})
+CONVERSATION_PAYLOAD = json.dumps([{"role": "user", "content": "How are you? " * 200}] * 10)
+
+
+def seed_heavy_user(Session):
+    db = Session()
+    user = User(device_id="bench", is_anonymous=True)
+    db.add(user)
+    db.commit()
+    user_id = user.id
+
+    start = datetime.utcnow() - timedelta(minutes=WEARABLE_ROWS)
+    db.execute(WearableData.__table__.insert(), [
+        {"user_id": user_id, "wearable_data": WEARABLE_PAYLOAD, "created_at": start + timedelta(minutes=i)}
+        for i in range(WEARABLE_ROWS)
+    ])
+    db.execute(JournalEntry.__table__.insert(), [
+        {"user_id": user_id, "journal_description": "A long day. " * 50,
+         "expiration_type": "delete_manually", "created_at": start}
+        for _ in range(JOURNAL_ROWS)
+    ])
+    db.execute(Conversation.__table__.insert(), [
+        {"user_id": user_id, "messages": CONVERSATION_PAYLOAD, "created_at": start, "updated_at": start}
+        for _ in range(CONVERSATION_ROWS)
+    ])
+    db.commit()
+    db.close()
+    return user_id
+
+
+def wipe_orm_cascade(Session, user_id):
+    db = Session()
+    db.delete(db.query(User).filter(User.id == user_id).first())
+    db.commit()
+    db.close()
+
+
+def wipe_set_based(Session, user_id):
+    db = Session()
+    delete_users(db, [user_id])
+    db.commit()
+    db.close()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+
+        print(f"Heavy user: {WEARABLE_ROWS} wearable rows, {JOURNAL_ROWS} journals, {CONVERSATION_ROWS} conversations")
+        for label, wipe in [("ORM cascade", wipe_orm_cascade), ("set-based", wipe_set_based)]:
+            user_id = seed_heavy_user(Session)
+            start = time.perf_counter()
+            wipe(Session, user_id)
+            elapsed = time.perf_counter() - start
+            remaining = Session().query(WearableData).filter(WearableData.user_id == user_id).count()
+            print(f"{label:<12} {elapsed * 1000:9.1f} ms  (remaining wearable rows: {remaining})")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
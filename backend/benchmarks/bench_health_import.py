@@ -0,0 +1,130 @@
+"""
+Benchmark: import of a large synthetic Apple Health export.
+
+Writes an export.xml of the requested size (heart rate every five minutes,
+hourly steps, a resting rate, exercise and sleep each day, going back from
+today), then runs the same job the upload endpoint queues, in this process,
+against a temporary database:
+
+    python benchmarks/bench_health_import.py                 # 500 MB
+    python benchmarks/bench_health_import.py --size-mb 50
+
+Reports import throughput and the growth of peak RSS over the import, which
+should stay flat whatever the export size.
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ELEMENT HealthData (ExportDate,Me,(Record|Workout)*)>
+]>
+<HealthData locale="en_US">
+ <ExportDate value="{now} -0800"/>
+ <Me HKCharacteristicTypeIdentifierDateOfBirth="1990-01-01"/>
+"""
+RECORD = (' <Record type="{type}" sourceName="Apple Watch" sourceVersion="10.1" unit="{unit}" '
+          'creationDate="{day} {time} -0800" startDate="{day} {time} -0800" endDate="{day} {end} -0800" value="{value}">\n'
+          '  <MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="0"/>\n'
+          ' </Record>\n')
+
+
+def _day_records(day: date, seed: int) -> str:
+    lines = []
+    for minute in range(0, 24 * 60, 5):
+        hh, mm = divmod(minute, 60)
+        lines.append(RECORD.format(type="HKQuantityTypeIdentifierHeartRate", unit="count/min", day=day,
+                                   time=f"{hh:02d}:{mm:02d}:00", end=f"{hh:02d}:{mm:02d}:00",
+                                   value=60 + (minute * 7 + seed) % 50))
+    for hour in range(7, 23):
+        lines.append(RECORD.format(type="HKQuantityTypeIdentifierStepCount", unit="count", day=day,
+                                   time=f"{hour:02d}:00:00", end=f"{hour:02d}:59:00", value=200 + (hour * seed) % 600))
+    lines.append(RECORD.format(type="HKQuantityTypeIdentifierRestingHeartRate", unit="count/min", day=day,
+                               time="09:00:00", end="09:00:00", value=55 + seed % 10))
+    lines.append(RECORD.format(type="HKQuantityTypeIdentifierAppleExerciseTime", unit="min", day=day,
+                               time="18:00:00", end="18:30:00", value=20 + seed % 40))
+    lines.append(RECORD.format(type="HKCategoryTypeIdentifierSleepAnalysis", unit="", day=day,
+                               time="00:30:00", end="07:{:02d}:00".format(seed % 60),
+                               value="HKCategoryValueSleepAnalysisAsleepCore"))
+    return "".join(lines)
+
+
+def write_export(path: str, size_bytes: int) -> int:
+    """Write an export of about `size_bytes`; returns the number of days in it."""
+    day = date.today()
+    days = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(HEADER.format(now=datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        while f.tell() < size_bytes:
+            f.write(_day_records(day, days))
+            day -= timedelta(days=1)
+            days += 1
+        f.write("</HealthData>\n")
+    return days
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=500, help="Export size in MB")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-import-") as data_dir:
+        os.environ["DATA_DIR"] = data_dir
+        os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+        # Imported after DATA_DIR is final: app.database reads it at import time
+        from app import config
+        from app.database import SessionLocal
+        from app.migrations import run_migrations
+        from app.models import User, WearableImportJob
+        from app.utils.health_import import create_job, run_import
+
+        config.WEARABLE_IMPORT_DIR = os.path.join(data_dir, "imports")
+        run_migrations()
+
+        export_path = os.path.join(data_dir, "export.xml")
+        start = time.perf_counter()
+        days = write_export(export_path, args.size_mb * 1024 * 1024)
+        size = os.path.getsize(export_path)
+        print(f"Wrote a {size / 1e6:.0f} MB export covering {days} days in {time.perf_counter() - start:.1f} s")
+
+        db = SessionLocal()
+        try:
+            user = User(device_id="bench-import")
+            db.add(user)
+            db.commit()
+            with open(export_path, "rb") as upload:
+                job_id = create_job(db, user.id, "apple_health", upload).id
+        finally:
+            db.close()
+        os.remove(export_path)
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        run_import(job_id)
+        elapsed = time.perf_counter() - start
+        rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+        db = SessionLocal()
+        try:
+            job = db.get(WearableImportJob, job_id)
+        finally:
+            db.close()
+        if job.status != "done":
+            sys.exit(f"Import {job.status}: {job.error}")
+        print(f"Imported {job.records_read:,} records into {job.days_imported} days in {elapsed:.1f} s "
+              f"({size / 1e6 / elapsed:.1f} MB/s, {job.records_read / elapsed:,.0f} records/s)")
+        # ru_maxrss is in KB on Linux
+        print(f"Peak RSS grew by {rss_growth / 1024:.1f} MB during the import")
+
+
+if __name__ == "__main__":
+    main()
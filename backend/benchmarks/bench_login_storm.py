@@ -0,0 +1,103 @@
+"""
+Benchmark: latency of other routes during a login storm.
+
+Measures GET /library/interventions latency while idle, then again while many
+clients hammer POST /auth/login with a real password. With bcrypt on the
+dedicated hashing pool the probe latency should stay flat; excess logins get
+503 instead of starving the request threadpool.
+
+Run against a live server:
+    uvicorn app.main:app --port 8000 --workers 2
+    python benchmarks/bench_login_storm.py
+"""
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_URL = "http://localhost:8000"
+PROBE_PATH = "/library/interventions"
+PROBE_REQUESTS = 50
+STORM_CLIENTS = 32
+PASSWORD = "storm-password"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def probe_latencies(count):
+    """Sequentially time `count` requests to the probe route (milliseconds)."""
+    latencies = []
+    with requests.Session() as session:
+        for _ in range(count):
+            start = time.perf_counter()
+            session.get(f"{BASE_URL}{PROBE_PATH}")
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    print(
+        f"{label:<14} p50={statistics.median(latencies):7.1f} ms  "
+        f"p95={percentile(latencies, 95):7.1f} ms  max={max(latencies):7.1f} ms"
+    )
+
+
+def login_storm(email, stop_event, status_counts, lock):
+    with requests.Session() as session:
+        while not stop_event.is_set():
+            response = session.post(
+                f"{BASE_URL}/auth/login",
+                json={"device_id": "bench", "email": email, "password": PASSWORD}
+            )
+            with lock:
+                status_counts[response.status_code] = status_counts.get(response.status_code, 0) + 1
+            if response.status_code == 503:
+                # Well-behaved clients back off as instructed
+                stop_event.wait(float(response.headers.get("Retry-After", "1")))
+
+
+def main():
+    email = f"storm-{uuid.uuid4().hex[:8]}@example.com"
+    response = requests.post(f"{BASE_URL}/auth/register", json={
+        "email": email,
+        "password": PASSWORD,
+        "repeat_password": PASSWORD,
+        "device_id": "bench"
+    })
+    response.raise_for_status()
+
+    # Warm up connections and the hashing pool
+    probe_latencies(5)
+    requests.post(f"{BASE_URL}/auth/login", json={"device_id": "bench", "email": email, "password": PASSWORD})
+
+    baseline = probe_latencies(PROBE_REQUESTS)
+
+    stop_event = threading.Event()
+    status_counts = {}
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=STORM_CLIENTS) as pool:
+        for _ in range(STORM_CLIENTS):
+            pool.submit(login_storm, email, stop_event, status_counts, lock)
+        time.sleep(1)
+        during_storm = probe_latencies(PROBE_REQUESTS)
+        stop_event.set()
+
+    print(f"Probe route: GET {PROBE_PATH} ({PROBE_REQUESTS} requests each)")
+    report("idle", baseline)
+    report("login storm", during_storm)
+    print(f"Login responses during storm: {dict(sorted(status_counts.items()))}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except requests.exceptions.ConnectionError:
+        print(f"Error: Could not connect to {BASE_URL}")
+        print("Make sure the server is running with: uvicorn app.main:app --workers 2")
@@ -0,0 +1,180 @@
+"""
+Benchmark: read routes and account wipe at production scale.
+
+Grows one synthetic database (see synthetic_population.py) through each
+population size and, at every size, starts a uvicorn worker against it and
+times every read route for random users and for the heaviest users, then
+wipes a few accounts:
+
+    python benchmarks/bench_scale.py                      # 10k, 100k, 1M users
+    python benchmarks/bench_scale.py --scales 10000 100000 --keep /tmp/scale
+
+Reports latency percentiles and the SQL statements per request taken from the
+Server-Timing header. Loading 1M users takes several minutes and a few GB.
+"""
+import argparse
+import os
+import random
+import re
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.utils.auth import create_access_token  # noqa: E402
+from benchmarks.synthetic_population import populate  # noqa: E402
+
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+
+# Users sampled per scale, and requests per route
+RANDOM_USERS = 50
+HEAVY_USERS = 5
+REQUESTS_PER_ROUTE = 200
+WIPES = 20
+
+READ_ROUTES = [
+    ("GET /journal/history", "/journal/history", {}),
+    ("GET /journal/history?limit=20", "/journal/history", {"limit": 20}),
+    ("GET /user/wearable/check", "/user/wearable/check", {}),
+    ("GET /library/interventions", "/library/interventions", {}),
+    ("GET /check-in/history", "/check-in/history", {}),
+    ("GET /counseling/conversations", "/counseling/conversations", {}),
+]
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(data_dir, port):
+    env = {**os.environ, "DATA_DIR": data_dir, "ANON_REAPER_ENABLED": "0",
+           "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-bench")}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    while True:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return server
+        except requests.ConnectionError:
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited before serving /health")
+            time.sleep(0.1)
+
+
+def count_users(database_path):
+    connection = sqlite3.connect(database_path)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def sample_users(database_path):
+    connection = sqlite3.connect(database_path)
+    try:
+        random_users = [row[0] for row in connection.execute(
+            "SELECT id FROM users ORDER BY RANDOM() LIMIT ?", (RANDOM_USERS,)
+        )]
+        heavy = [row[0] for row in connection.execute(
+            "SELECT user_id FROM journal_entries GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT ?", (HEAVY_USERS,)
+        )]
+    finally:
+        connection.close()
+    return random_users, heavy
+
+
+def summarize(label, timings, queries):
+    timings.sort()
+    p50 = statistics.median(timings) * 1000
+    p95 = timings[int(len(timings) * 0.95) - 1] * 1000
+    print(f"  {label:<40} p50 {p50:8.1f} ms  p95 {p95:8.1f} ms  max {timings[-1] * 1000:8.1f} ms  "
+          f"queries {max(queries) if queries else '-'}")
+
+
+def time_route(session, base_url, path, params, users):
+    timings, queries = [], []
+    for i in range(REQUESTS_PER_ROUTE):
+        user_id = users[i % len(users)]
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+        start = time.perf_counter()
+        response = session.get(base_url + path, params={"user_id": user_id, **params}, headers=headers)
+        timings.append(time.perf_counter() - start)
+        response.raise_for_status()
+        match = _QUERIES.search(response.headers.get("Server-Timing", ""))
+        if match:
+            queries.append(int(match.group(1)))
+    return timings, queries
+
+
+def time_wipes(session, base_url, users):
+    timings = []
+    for user_id in users:
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+        start = time.perf_counter()
+        response = session.delete(f"{base_url}/auth/account/wipe", json={"user_id": user_id}, headers=headers)
+        timings.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return timings
+
+
+def run_scale(data_dir, users):
+    database_path = os.path.join(data_dir, "app.db")
+    random_users, heavy_users = sample_users(database_path)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(data_dir, port)
+    try:
+        with requests.Session() as session:
+            print(f"\n{users:,} users ({os.path.getsize(database_path) / 1e6:,.0f} MB)")
+            for label, path, params in READ_ROUTES:
+                summarize(label, *time_route(session, base_url, path, params, random_users))
+                summarize(label + " [heavy]", *time_route(session, base_url, path, params, heavy_users))
+            wiped = random.sample([u for u in random_users if u not in heavy_users], WIPES)
+            summarize("DELETE /auth/account/wipe", time_wipes(session, base_url, wiped), [])
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="Population sizes")
+    parser.add_argument("--keep", help="Build the database in this directory and keep it")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.keep or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        subprocess.check_call([sys.executable, "-m", "app.migrations"], cwd=BACKEND_DIR,
+                              env={**os.environ, "DATA_DIR": data_dir}, stdout=subprocess.DEVNULL)
+        database_path = os.path.join(data_dir, "app.db")
+
+        loaded = count_users(database_path)
+        for users in sorted(args.scales):
+            start = time.perf_counter()
+            # Each scale grows the previous database instead of starting over
+            populate(database_path, max(users - loaded, 0), seed=users)
+            # The generator writes raw uploads only
+            subprocess.check_call([sys.executable, "-m", "app.utils.wearable_rollups"], cwd=BACKEND_DIR,
+                                  env={**os.environ, "DATA_DIR": data_dir}, stdout=subprocess.DEVNULL)
+            loaded = users
+            print(f"\nLoaded {users:,} users in {time.perf_counter() - start:.1f} s")
+            run_scale(data_dir, users)
+
+
+if __name__ == "__main__":
+    main()
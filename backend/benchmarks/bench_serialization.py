@@ -0,0 +1,77 @@
+"""
+Microbenchmark: JSON serialization of every response model.
+
+For each response model in app/schemas.py (plus the library listing) this
+times Pydantic's own model_dump_json, which FastAPI uses for routes with a
+response_model, and model_dump followed by each encoder available to
+FastJSONResponse (orjson, msgspec, stdlib json).
+
+    python benchmarks/bench_serialization.py
+"""
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import schemas  # noqa: E402
+from app.routers.library import InterventionsListResponse  # noqa: E402
+from app.utils.responses import JSON_BACKENDS  # noqa: E402
+
+NOW = datetime.utcnow()
+
+with open("interventions_library.json") as f:
+    INTERVENTIONS = json.load(f)
+
+with open("../frontend/public/wearable_example.json") as f:
+    WEARABLE_EXAMPLE = json.load(f)
+
+# Representative payload for each response model
+SAMPLES = {
+    "LoginResponse": schemas.LoginResponse(token="x" * 180, user_id=42, is_anonymous=True),
+    "RegisterResponse": schemas.RegisterResponse(token="x" * 180, user_id=42, is_anonymous=False),
+    "AccountWipeResponse": schemas.AccountWipeResponse(success=True, message="All data deleted"),
+    "CheckInResponse": schemas.CheckInResponse(
+        sanitized_text="Long shift, felt overwhelmed after a difficult case. " * 5,
+        recommended_intervention_ids="2,5,9",
+        ai_reasoning="Elevated stress with poor sleep; start with a physiological reset."
+    ),
+    "WearableDataResponse": schemas.WearableDataResponse(success=True),
+    "WearableDataSummary": schemas.WearableDataSummary(
+        date=NOW, wearable_data_summary="Activity was steady and sleep improved. " * 3
+    ),
+    "WearableCheckResponse": schemas.WearableCheckResponse(success=True, created_at=NOW, data=WEARABLE_EXAMPLE),
+    "JournalEntry": schemas.JournalEntry(id=1, date=NOW, journal="Today was a challenging day. " * 20, expires_at=NOW),
+    "SuccessResponse": schemas.SuccessResponse(success=True, message="Journal entry created successfully"),
+    "StartCounselingResponse": schemas.StartCounselingResponse(
+        conversation_id=7, counseling="It sounds like a heavy day.\n\nWhat helped you most today?"
+    ),
+    "FollowUpResponse": schemas.FollowUpResponse(counseling="That makes sense.\n\nWhat would help right now?"),
+    "InterventionsListResponse": InterventionsListResponse(count=len(INTERVENTIONS), interventions=INTERVENTIONS),
+}
+
+
+def time_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    backends = list(JSON_BACKENDS.items())
+    header = f"{'model':<27}{'bytes':>7}{'pydantic':>11}" + "".join(f"{name:>11}" for name, _ in backends)
+    print(header + "   (µs per call; encoders include model_dump)")
+    print("-" * len(header))
+
+    for name, model in SAMPLES.items():
+        number = 200 if name == "InterventionsListResponse" else 5000
+        size = len(model.model_dump_json())
+        row = f"{name:<27}{size:>7}{time_call(model.model_dump_json, number):>11.1f}"
+        for _, dumps in backends:
+            row += f"{time_call(lambda: dumps(model.model_dump(mode='json')), number):>11.1f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: import time and cold boot to first response.
+
+Measures, in fresh interpreters:
+  1. how long `import app.main` takes,
+  2. how long a uvicorn worker takes from process start to the first
+     successful GET /health.
+Runs against a throwaway DATA_DIR (migrated first, as in the Docker image)
+and exits non-zero when cold boot exceeds BOOT_BUDGET_SECONDS.
+
+    python benchmarks/bench_startup.py
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNS = 5
+BOOT_BUDGET_SECONDS = 2.0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_time(env):
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env)
+    return float(output)
+
+
+def boot_time(env):
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited before serving /health")
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = {**os.environ, "DATA_DIR": data_dir, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-bench")}
+        subprocess.check_call([sys.executable, "-m", "app.migrations"], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL)
+
+        imports = [import_time(env) for _ in range(RUNS)]
+        boots = [boot_time(env) for _ in range(RUNS)]
+
+    print(f"import app.main      median {statistics.median(imports) * 1000:7.1f} ms  (min {min(imports) * 1000:.1f})")
+    print(f"boot to first /health median {statistics.median(boots) * 1000:7.1f} ms  (min {min(boots) * 1000:.1f})")
+    print(f"budget               {BOOT_BUDGET_SECONDS * 1000:12.1f} ms")
+
+    if statistics.median(boots) > BOOT_BUDGET_SECONDS:
+        print("✗ Cold boot is over budget")
+        sys.exit(1)
+    print("✓ Cold boot is within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark: database size and read/write latency of compressed text columns.
+
+Loads a synthetic population (see synthetic_population.py) into a temporary
+database, stored as plain text like rows written before compression, then
+measures it in three states:
+
+    plain        as loaded
+    zstd         recompressed without dictionaries
+    zstd + dict  dictionaries trained, then recompressed
+
+For each state it reports the database file size after VACUUM, the stored
+bytes per column, and the latency of reading single rows by id and of
+inserting new rows through the ORM:
+
+    python benchmarks/bench_text_compression.py
+    python benchmarks/bench_text_compression.py --users 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Reads and writes timed per column and state
+SAMPLES = 500
+
+
+def stored_bytes(engine, text, table, column):
+    with engine.connect() as connection:
+        return connection.execute(text(f"SELECT COALESCE(SUM(LENGTH(CAST({column} AS BLOB))), 0) FROM {table}")).scalar()
+
+
+def vacuumed_size(engine, text, database_path):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM"))
+    return os.path.getsize(database_path)
+
+
+def time_reads(session_factory, model, column, ids):
+    timings = []
+    db = session_factory()
+    try:
+        for row_id in ids:
+            start = time.perf_counter()
+            db.query(getattr(model, column)).filter(model.id == row_id).scalar()
+            timings.append(time.perf_counter() - start)
+    finally:
+        db.close()
+    return timings
+
+
+def time_writes(session_factory, model, column, template_ids):
+    """Insert copies of existing rows one commit at a time, then delete them again."""
+    timings = []
+    db = session_factory()
+    try:
+        templates = db.query(model).filter(model.id.in_(template_ids)).all()
+        inserted = []
+        for template in templates:
+            values = {
+                c.name: getattr(template, c.name)
+                for c in model.__table__.columns if c.name not in ("id", "content_hash")
+            }
+            start = time.perf_counter()
+            row = model(**values)
+            db.add(row)
+            db.commit()
+            timings.append(time.perf_counter() - start)
+            inserted.append(row.id)
+        db.query(model).filter(model.id.in_(inserted)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    return timings
+
+
+def ms(timings):
+    ordered = sorted(timings)
+    return statistics.median(ordered) * 1000, ordered[int(len(ordered) * 0.95) - 1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000, help="Synthetic users to load")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="bench-compression-")
+    os.environ["DATA_DIR"] = data_dir
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+    # Imported after DATA_DIR is final: app.database reads it at import time
+    from sqlalchemy import text
+    from app import config, models
+    from app.database import SessionLocal, engine
+    from app.migrations import run_migrations
+    from app.utils import text_compression
+    from benchmarks.synthetic_population import populate
+
+    run_migrations()
+    database_path = os.path.join(data_dir, "app.db")
+    print(f"Loading {args.users} users into {database_path}...")
+    populate(database_path, args.users, seed=args.seed)
+
+    model_for_table = {mapper.class_.__tablename__: mapper.class_ for mapper in models.Base.registry.mappers}
+    columns = [(table, column, model_for_table[table]) for table, column, _ in text_compression.compressed_columns()]
+    rng = random.Random(args.seed)
+    ids = {}
+    for table, _, _ in columns:
+        with engine.connect() as connection:
+            all_ids = connection.execute(text(f"SELECT id FROM {table}")).scalars().all()
+        ids[table] = rng.sample(all_ids, min(SAMPLES, len(all_ids)))
+
+    def measure(state):
+        print(f"\n{state}: {vacuumed_size(engine, text, database_path) / 1e6:.1f} MB after VACUUM")
+        for table, column, model in columns:
+            if not ids[table]:
+                continue
+            read_p50, read_p95 = ms(time_reads(SessionLocal, model, column, ids[table]))
+            write_p50, write_p95 = ms(time_writes(SessionLocal, model, column, ids[table][:100]))
+            print(f"  {table + '.' + column:<38} {stored_bytes(engine, text, table, column) / 1e6:8.2f} MB  "
+                  f"read p50 {read_p50:6.3f} ms  p95 {read_p95:6.3f} ms  "
+                  f"write p50 {write_p50:6.3f} ms  p95 {write_p95:6.3f} ms")
+
+    # Raising the threshold out of reach makes new writes plain text as well
+    min_bytes = config.TEXT_COMPRESSION_MIN_BYTES
+    config.TEXT_COMPRESSION_MIN_BYTES = sys.maxsize
+    measure("plain")
+    config.TEXT_COMPRESSION_MIN_BYTES = min_bytes
+    text_compression.recompress(pause=0)
+    measure("zstd")
+    print()
+    for key, samples in text_compression.train_dictionaries().items():
+        print(f"Trained a dictionary for {key} from {samples} rows")
+    text_compression.recompress(pause=0)
+    measure("zstd + dict")
+
+
+if __name__ == "__main__":
+    main()
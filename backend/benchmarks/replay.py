@@ -0,0 +1,215 @@
+"""
+Replay captured request traces against one or two running builds.
+
+Traces come from TraceCaptureMiddleware (TRACE_CAPTURE_ENABLED, see
+app/utils/traces.py). Run each build locally with the fake LLM and limits
+raised so replay measures the app, not OpenAI or the rate limiter:
+
+    LLM_FAKE=1 LLM_FAKE_LATENCY_SECONDS=0.8 LLM_USER_BURST=1000 LLM_GLOBAL_BURST=100000 \\
+        uvicorn app.main:app --port 8001
+
+    python benchmarks/replay.py /app/data/traces --target http://localhost:8001
+    python benchmarks/replay.py traces-*.jsonl --target http://localhost:8001 --target http://localhost:8002 --speed 10
+
+Each recorded user pseudonym gets its own anonymous replay user per target.
+Requests keep their route, parameters and body sizes; text is replaced by
+filler of the same length. Inter-arrival times are preserved (--speed 1),
+compressed (--speed 10 replays ten times faster) or dropped (--speed 0).
+Pagination cursors are not replayed, and account wipes are skipped so replay
+users survive the run.
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.traces import SAFE_KEYS  # noqa: E402
+
+# Routes never replayed ("METHOD route")
+SKIPPED_ROUTES = {"DELETE /auth/account/wipe"}
+
+# Query parameters that cannot be synthesized
+SKIPPED_QUERY = {"cursor"}
+
+
+def load_traces(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "traces-*.jsonl*")))
+        else:
+            files.append(path)
+
+    traces = []
+    for name in files:
+        with open(name) as f:
+            for line in f:
+                trace = json.loads(line)
+                if trace["route"] and f"{trace['method']} {trace['route']}" not in SKIPPED_ROUTES:
+                    traces.append(trace)
+    traces.sort(key=lambda trace: trace["ts"])
+    return traces
+
+
+def synthesize(shape, user_id, key=None):
+    """Build a value with the recorded shape; user_id fields point at the replay user."""
+    if key in SAFE_KEYS and not isinstance(shape, (dict, list)):
+        return shape
+    if isinstance(shape, dict):
+        if "$json" in shape:
+            return json.dumps(synthesize(shape["$json"], user_id))
+        return {k: synthesize(v, user_id, k) for k, v in shape.items()}
+    if isinstance(shape, list):
+        length, item = shape
+        return [synthesize(item, user_id) for _ in range(length)]
+    if shape == "int":
+        return user_id if key == "user_id" else 1
+    if shape == "float":
+        return 1.0
+    if shape == "bool":
+        return False
+    if isinstance(shape, str) and shape.startswith("str:"):
+        return "x" * int(shape[4:])
+    return None
+
+
+def build_request(trace, user_id):
+    path = trace["route"]
+    for name, value in trace["path_params"].items():
+        path = path.replace("{" + name + "}", str(synthesize(value, user_id, name)))
+    # Every value of a repeated key (?ids=1&ids=2) is sent again
+    params = [
+        (name, synthesize(value, user_id, name))
+        for name, values in trace["query"].items() if name not in SKIPPED_QUERY
+        for value in values
+    ]
+
+    body = trace["body"]
+    kwargs = {"params": params}
+    if isinstance(body, str) and body.startswith("bytes:"):
+        kwargs["data"] = b"x" * int(body[6:])
+    elif body is not None:
+        kwargs["json"] = synthesize(body, user_id)
+    return trace["method"], path, kwargs
+
+
+def create_users(session, base_url, traces):
+    """Log in one anonymous replay user per recorded pseudonym."""
+    users = {}
+    for pseudonym in {trace["user"] for trace in traces if trace["user"]}:
+        response = session.post(f"{base_url}/auth/login", json={"device_id": f"replay-{pseudonym}"})
+        response.raise_for_status()
+        data = response.json()
+        users[pseudonym] = (data["user_id"], {"Authorization": f"Bearer {data['token']}"})
+    return users
+
+
+def replay(base_url, traces, speed, concurrency):
+    """Replay all traces against one target; returns (results, wall seconds)."""
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    users = create_users(session, base_url, traces)
+    results = []
+    results_lock = threading.Lock()
+
+    def send(trace):
+        user_id, headers = users.get(trace["user"], (0, {}))
+        method, path, kwargs = build_request(trace, user_id)
+        start = time.perf_counter()
+        try:
+            status = session.request(method, base_url + path, headers=headers, timeout=120, **kwargs).status_code
+        except requests.RequestException:
+            status = None
+        with results_lock:
+            results.append((f"{trace['method']} {trace['route']}", status, time.perf_counter() - start))
+
+    first_ts = traces[0]["ts"]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for trace in traces:
+            if speed > 0:
+                delay = (trace["ts"] - first_ts) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(send, trace)
+    return results, time.perf_counter() - start
+
+
+def summarize(results, wall):
+    """Per-route latency percentiles plus overall throughput and errors."""
+    routes = {}
+    for route, status, latency in results:
+        routes.setdefault(route, {"latencies": [], "errors": 0})
+        routes[route]["latencies"].append(latency)
+        if status is None or status >= 500:
+            routes[route]["errors"] += 1
+
+    summary = {}
+    for route, data in routes.items():
+        latencies = sorted(data["latencies"])
+        summary[route] = {
+            "count": len(latencies),
+            "p50": statistics.median(latencies) * 1000,
+            "p95": latencies[math.ceil(len(latencies) * 0.95) - 1] * 1000,
+            "errors": data["errors"],
+        }
+    return summary, len(results) / wall
+
+
+def report(target, summary, throughput, wall):
+    print(f"\n{target}: {sum(s['count'] for s in summary.values())} requests in {wall:.1f} s "
+          f"({throughput:.1f} req/s)")
+    for route, s in sorted(summary.items()):
+        print(f"  {route:<40} n {s['count']:>6}  p50 {s['p50']:8.1f} ms  p95 {s['p95']:8.1f} ms  errors {s['errors']}")
+
+
+def compare(baseline, candidate):
+    (base_summary, base_throughput), (cand_summary, cand_throughput) = baseline, candidate
+
+    def change(before, after):
+        return f"{(after - before) / before * 100:+6.1f}%" if before else "     -"
+
+    print(f"\nCandidate vs baseline: throughput {change(base_throughput, cand_throughput)}")
+    for route in sorted(set(base_summary) & set(cand_summary)):
+        before, after = base_summary[route], cand_summary[route]
+        print(f"  {route:<40} p50 {change(before['p50'], after['p50'])}  p95 {change(before['p95'], after['p95'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("traces", nargs="+", help="Trace files or capture directories")
+    parser.add_argument("--target", action="append", required=True,
+                        help="Base URL of a running build; give two to compare (baseline first)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed-up factor; 0 sends requests as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at most")
+    args = parser.parse_args()
+
+    traces = load_traces(args.traces)
+    if not traces:
+        sys.exit("No traces to replay")
+    print(f"Replaying {len(traces)} requests from {len({t['user'] for t in traces if t['user']})} users")
+
+    outcomes = []
+    for target in args.target[:2]:
+        results, wall = replay(target.rstrip("/"), traces, args.speed, args.concurrency)
+        summary, throughput = summarize(results, wall)
+        report(target, summary, throughput, wall)
+        outcomes.append((summary, throughput))
+
+    if len(outcomes) == 2:
+        compare(*outcomes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Synthetic population generator for scale testing.
+
+Bulk-loads users and their data straight into $DATA_DIR/app.db (migrating it
+first) with batched executemany inserts on a raw sqlite3 connection:
+
+    DATA_DIR=/tmp/scale python benchmarks/synthetic_population.py --users 100000
+
+Activity is heavy-tailed (Pareto): most users have a handful of rows and a few
+have hundreds. Per user:
+  - check-ins with recommended intervention ids,
+  - daily wearable payloads for a random 40% of users,
+  - journals with mixed expiration types, some already expired,
+  - intervention completions,
+  - multi-turn counseling conversations.
+
+Each column of a batch (signup times, engagement, timestamps, vitals, texts,
+expirations) is drawn as one NumPy array from a seeded Generator, and Python
+only zips the columns into rows for executemany. The same --seed and batch
+size always produce the same database. Add --users to an existing
+database to grow it; new ids continue after the current maximum.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Users generated and inserted per transaction
+BATCH_SIZE = 10_000
+
+# Share of users who are anonymous, and who ever uploaded wearable data
+ANONYMOUS_SHARE = 0.85
+WEARABLE_SHARE = 0.40
+
+# Pareto shape of per-user engagement (smaller is heavier-tailed)
+ENGAGEMENT_SHAPE = 1.3
+
+# Caps on rows per user, so one outlier cannot dominate a batch
+MAX_CHECK_INS = 365
+MAX_WEARABLE_DAYS = 365
+MAX_JOURNALS = 500
+MAX_CONVERSATIONS = 50
+
+# Users sign up over this many days before now
+SIGNUP_WINDOW_DAYS = 180
+
+DAY_US = 86400 * 10**6
+
+EXPIRATION_TYPES = ["7_days", "30_days", "delete_manually"]
+EXPIRATION_WEIGHTS = [0.3, 0.2, 0.5]
+EXPIRATION_DAYS = {"7_days": 7, "30_days": 30}
+
+INTERVENTION_IDS = [str(i) for i in range(1, 31)]
+
+CHECK_IN_TEXTS = [
+    "Feeling anxious about tomorrow's meeting.",
+    "Slept badly and I'm exhausted.",
+    "Pretty calm today, just a bit distracted.",
+    "Overwhelmed with work and can't switch off.",
+    "Had an argument with a friend and feel low.",
+    "Energetic after a run this morning.",
+]
+JOURNAL_SENTENCES = [
+    "Today was a challenging day.",
+    "I practiced my breathing exercises and felt more centered.",
+    "Work was stressful but I managed to take a walk.",
+    "I noticed I was more irritable in the afternoon.",
+    "Spent the evening with family, which helped.",
+    "I want to get to bed earlier this week.",
+]
+CHAT_TURNS = [
+    ("I've been struggling to focus lately.", "That sounds frustrating. What tends to pull your attention away?"),
+    ("Mostly my phone and worrying about deadlines.", "Deadlines can weigh heavily. Would a short breathing break help?"),
+    ("Maybe, I can try that.", "Let's try a two-minute box breathing exercise together."),
+    ("I feel a bit better now.", "I'm glad. Remember you can come back here any time."),
+]
+SYSTEM_MESSAGE = {"role": "system", "content": "You are a supportive, empathetic mental health companion."}
+
+
+def _wearable_payloads(rng: np.random.Generator, days: np.ndarray) -> List[str]:
+    """Daily payloads for `days` (YYYY-MM-DD strings), already in canonical JSON form."""
+    count = len(days)
+    steps = np.where(rng.random(count) > 0.05, rng.normal(7500, 2500, count).astype(np.int64), 0)
+    columns = [
+        np.maximum(rng.normal(40, 20, count).astype(np.int64), 0).tolist(),
+        rng.normal(2100, 300, count).astype(np.int64).tolist(),
+        days.tolist(),
+        np.round(rng.normal(72, 8, count)).astype(np.int64).tolist(),
+        np.round(rng.normal(150, 15, count)).astype(np.int64).tolist(),
+        np.round(rng.normal(62, 6, count)).astype(np.int64).tolist(),
+        np.round(np.maximum(rng.normal(1.6, 0.5, count), 0), 1).tolist(),
+        np.round(np.maximum(rng.normal(1.5, 0.4, count), 0), 1).tolist(),
+        np.round(np.maximum(rng.normal(7, 1.2, count), 2), 1).tolist(),
+        steps.tolist(),
+    ]
+    # Keys sorted and no whitespace, so canonical_hash() is the sha256 of the payload itself
+    return [
+        f'{{"active_minutes":{a},"calories_burned":{c},"date":"{d}",'
+        f'"heart_rate":{{"average":{avg},"max":{high},"resting":{rest}}},'
+        f'"sleep":{{"deep_sleep_hours":{deep},"rem_sleep_hours":{rem},"total_hours":{total}}},"steps":{st}}}'
+        for a, c, d, avg, high, rest, deep, rem, total, st in zip(*columns)
+    ]
+
+
+def _conversation(turns: int) -> str:
+    messages = [SYSTEM_MESSAGE]
+    for i in range(turns):
+        user_text, assistant_text = CHAT_TURNS[i % len(CHAT_TURNS)]
+        messages.append({"role": "user", "content": user_text})
+        messages.append({"role": "assistant", "content": assistant_text})
+    return json.dumps(messages)
+
+
+# Conversations by number of turns (1-10), built once
+CONVERSATIONS = [None] + [_conversation(turns) for turns in range(1, 11)]
+
+
+def _next_id(cursor: sqlite3.Cursor, table: str) -> int:
+    return (cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]) + 1
+
+
+def _timestamps(moments: np.ndarray) -> List[str]:
+    """datetime64[us] values as SQLAlchemy's SQLite DateTime type stores them."""
+    return np.char.replace(np.datetime_as_string(moments, unit="us"), "T", " ").tolist()
+
+
+def _ids(next_ids: dict, table: str, count: int) -> np.ndarray:
+    ids = np.arange(next_ids[table], next_ids[table] + count)
+    next_ids[table] += count
+    return ids
+
+
+def generate_batch(rng: np.random.Generator, first_user_id: int, count: int, now: np.datetime64, next_ids: dict) -> dict:
+    """
+    Build the rows of every table for `count` users starting at `first_user_id`.
+    Each column is drawn for the whole batch at once; Python only assembles the row tuples.
+    """
+    rows = {}
+    user_ids = np.arange(first_user_id, first_user_id + count)
+    signup_us = (rng.random(count) * SIGNUP_WINDOW_DAYS * DAY_US).astype(np.int64)
+    created_at = now - signup_us.astype("timedelta64[us]")
+    age_us = np.maximum(signup_us // DAY_US, 1) * DAY_US
+    anonymous = rng.random(count) < ANONYMOUS_SHARE
+    # numpy's pareto is the Lomax distribution, i.e. Pareto(shape) - 1
+    engagement = rng.pareto(ENGAGEMENT_SHAPE, count)
+
+    rows["users"] = list(zip(
+        user_ids.tolist(),
+        [f"synthetic-{user_id}" for user_id in user_ids.tolist()],
+        [None if anon else f"user{user_id}@example.com" for user_id, anon in zip(user_ids.tolist(), anonymous.tolist())],
+        [None] * count,
+        anonymous.tolist(),
+        _timestamps(created_at),
+    ))
+
+    def during_account(owners: np.ndarray) -> np.ndarray:
+        """A random moment between each owner's signup and signup plus their account age."""
+        offsets = (rng.random(len(owners)) * age_us[owners]).astype(np.int64)
+        return created_at[owners] + offsets.astype("timedelta64[us]")
+
+    # Check-ins, each with three distinct recommended interventions
+    owners = np.repeat(np.arange(count), np.minimum((engagement * 3).astype(np.int64), MAX_CHECK_INS))
+    total = len(owners)
+    check_in_ids = _ids(next_ids, "check_ins", total)
+    at = _timestamps(during_account(owners))
+    recommended = np.argpartition(rng.random((total, len(INTERVENTION_IDS))), 3, axis=1)[:, :3] + 1
+    texts = np.array(CHECK_IN_TEXTS, dtype=object)
+    rows["check_ins"] = list(zip(
+        check_in_ids.tolist(), user_ids[owners].tolist(),
+        texts[rng.integers(len(CHECK_IN_TEXTS), size=total)].tolist(),
+        texts[rng.integers(len(CHECK_IN_TEXTS), size=total)].tolist(),
+        [",".join(map(str, ids)) for ids in recommended.tolist()],
+        ["Selected for the reported stress and sleep pattern."] * total, at,
+    ))
+    rows["check_in_recommendations"] = list(zip(
+        np.repeat(check_in_ids, 3).tolist(), np.tile([1, 2, 3], total).tolist(),
+        recommended.astype(str).ravel().tolist(), np.repeat(user_ids[owners], 3).tolist(), np.repeat(at, 3).tolist(),
+    ))
+
+    # Daily wearable payloads, counting back from today
+    wearable_days = np.where(
+        rng.random(count) < WEARABLE_SHARE,
+        np.minimum.reduce([(engagement * 5).astype(np.int64) + 1, age_us // DAY_US, np.full(count, MAX_WEARABLE_DAYS)]),
+        0
+    )
+    owners = np.repeat(np.arange(count), wearable_days)
+    total = len(owners)
+    day_index = np.arange(total) - np.repeat(np.cumsum(wearable_days) - wearable_days, wearable_days)
+    # Uploaded at a time of day that has already passed today, so each lands on its own day
+    today = now.astype("datetime64[D]").astype("datetime64[us]")
+    since_midnight = (now - today).astype(np.int64)
+    moments = today - (day_index * DAY_US - (rng.random(total) * since_midnight).astype(np.int64)).astype("timedelta64[us]")
+    payloads = _wearable_payloads(rng, np.datetime_as_string(moments, unit="D"))
+    rows["wearable_data"] = list(zip(
+        _ids(next_ids, "wearable_data", total).tolist(), user_ids[owners].tolist(), payloads,
+        [hashlib.sha256(payload.encode("utf-8")).hexdigest() for payload in payloads], _timestamps(moments),
+    ))
+
+    # Journals of 1-8 sentences with mixed, partly expired expiration types
+    owners = np.repeat(np.arange(count), np.minimum((engagement * 4).astype(np.int64), MAX_JOURNALS))
+    total = len(owners)
+    moments = during_account(owners)
+    expiration = rng.choice(len(EXPIRATION_TYPES), size=total, p=EXPIRATION_WEIGHTS)
+    lifetime_us = np.array([EXPIRATION_DAYS.get(kind, 0) * DAY_US for kind in EXPIRATION_TYPES])[expiration]
+    expires_at = np.where(lifetime_us > 0, _timestamps(moments + lifetime_us.astype("timedelta64[us]")), None)
+    sentences = np.array(JOURNAL_SENTENCES, dtype=object)[rng.integers(len(JOURNAL_SENTENCES), size=(total, 8))].tolist()
+    lengths = rng.integers(1, 9, size=total).tolist()
+    rows["journal_entries"] = list(zip(
+        _ids(next_ids, "journal_entries", total).tolist(), user_ids[owners].tolist(),
+        [" ".join(chosen[:length]) for chosen, length in zip(sentences, lengths)],
+        np.array(EXPIRATION_TYPES, dtype=object)[expiration].tolist(), _timestamps(moments), expires_at.tolist(),
+    ))
+
+    # Completions of distinct interventions
+    completed = np.minimum((engagement * 2).astype(np.int64), len(INTERVENTION_IDS))
+    order = np.argsort(rng.random((count, len(INTERVENTION_IDS))), axis=1)
+    owners, positions = np.nonzero(np.arange(len(INTERVENTION_IDS)) < completed[:, None])
+    total = len(owners)
+    rows["user_interventions"] = list(zip(
+        _ids(next_ids, "user_interventions", total).tolist(), user_ids[owners].tolist(),
+        (order[owners, positions] + 1).astype(str).tolist(),
+        (1 + rng.exponential(2.0, total).astype(np.int64)).tolist(), _timestamps(during_account(owners)),
+    ))
+
+    # Conversations of 1-10 turns
+    owners = np.repeat(np.arange(count), np.minimum(engagement.astype(np.int64), MAX_CONVERSATIONS))
+    total = len(owners)
+    at = _timestamps(during_account(owners))
+    rows["conversations"] = list(zip(
+        _ids(next_ids, "conversations", total).tolist(), user_ids[owners].tolist(),
+        [CONVERSATIONS[turns] for turns in rng.integers(1, 11, size=total).tolist()], at, at,
+    ))
+    return rows
+
+
+INSERTS = {
+    "users": "INSERT INTO users (id, device_id, email, hashed_password, is_anonymous, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+    "check_ins": "INSERT INTO check_ins (id, user_id, check_in_data, sanitized_text, recommended_intervention_ids, "
+                 "ai_reasoning, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "check_in_recommendations": "INSERT INTO check_in_recommendations (check_in_id, rank, intervention_id, user_id, "
+                                "created_at) VALUES (?, ?, ?, ?, ?)",
+    "wearable_data": "INSERT INTO wearable_data (id, user_id, wearable_data, content_hash, created_at) "
+                     "VALUES (?, ?, ?, ?, ?)",
+    "journal_entries": "INSERT INTO journal_entries (id, user_id, journal_description, expiration_type, created_at, "
+                       "expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+    "user_interventions": "INSERT INTO user_interventions (id, user_id, intervention_id, times_completed, "
+                          "last_completed_at) VALUES (?, ?, ?, ?, ?)",
+    "conversations": "INSERT INTO conversations (id, user_id, messages, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+}
+
+
+def populate(database_path: str, users: int, seed: int = 1, batch_size: int = BATCH_SIZE) -> dict:
+    """Insert `users` synthetic users with their data; returns the rows inserted per table."""
+    rng = np.random.default_rng(seed)
+    now = np.datetime64("now", "us")
+    totals = {table: 0 for table in INSERTS}
+
+    # Imported here: app modules read DATA_DIR at import time, after main() has set it
+    from app.utils.text_compression import register_sql_functions
+
+    connection = sqlite3.connect(database_path)
+    # The journal search triggers read entries through decompress_text()
+    register_sql_functions(connection)
+    # Bulk load settings for this connection only; a crash mid-load may corrupt the file
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("PRAGMA journal_mode = MEMORY")
+    cursor = connection.cursor()
+    first_user_id = _next_id(cursor, "users")
+    # Recommendations are keyed by their check-in, not an id of their own
+    next_ids = {table: _next_id(cursor, table) for table in INSERTS
+                if table not in ("users", "check_in_recommendations")}
+
+    try:
+        for offset in range(0, users, batch_size):
+            count = min(batch_size, users - offset)
+            rows = generate_batch(rng, first_user_id + offset, count, now, next_ids)
+            with connection:
+                for table, statement in INSERTS.items():
+                    cursor.executemany(statement, rows[table])
+                    totals[table] += len(rows[table])
+    finally:
+        connection.close()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, required=True, help="Users to add")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--data-dir", help="Directory holding app.db (defaults to $DATA_DIR)")
+    args = parser.parse_args()
+
+    if args.data_dir:
+        os.environ["DATA_DIR"] = args.data_dir
+
+    # Imported after DATA_DIR is final: app.database reads it at import time
+    from app.database import DATA_DIR, SessionLocal
+    from app.migrations import run_migrations
+    from app.utils.wearable_rollups import rollup_pending_uploads
+
+    run_migrations()
+    database_path = os.path.join(DATA_DIR, "app.db")
+
+    print(f"Adding {args.users} users to {database_path}...")
+    start = time.perf_counter()
+    totals = populate(database_path, args.users, seed=args.seed)
+    # Wearable uploads are written raw; roll them up as ingest would have
+    db = SessionLocal()
+    try:
+        rollup_pending_uploads(db)
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - start
+
+    for table, count in totals.items():
+        print(f"  {table:<24} {count:>12,}")
+    print(f"✓ Loaded {sum(totals.values()):,} rows in {elapsed:.1f} s ({sum(totals.values()) / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
-from app.database import engine, SessionLocal
-from app.models import Base, User
+from app.database import SessionLocal
+from app.migrations import run_migrations
+from app.models import User
 
 # Create all tables
 print("Creating database tables...")
-Base.metadata.create_all(bind=engine)
+run_migrations()
 print("Tables created successfully!")
 
 # Insert test users
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Test script for authentication: tokens, password hashing and account deletion"""
+
+import requests
+import uuid
+from fastapi import HTTPException
+
+BASE_URL = "http://localhost:8000"
+
+
+def login():
+    """Create an anonymous session; returns (user_id, auth headers)."""
+    response = requests.post(f"{BASE_URL}/auth/login", json={"device_id": f"test_device_{uuid.uuid4().hex}"})
+    data = response.json()
+    return data["user_id"], {"Authorization": f"Bearer {data['token']}"}
+
+
+def wipe(user_id, headers):
+    return requests.delete(f"{BASE_URL}/auth/account/wipe", json={"user_id": user_id}, headers=headers)
+
+
+def test_password_register_and_login():
+    """Test that register and password login hash on the bcrypt process pool"""
+    print("Testing: Register and log in with a password")
+    email = f"test_{uuid.uuid4().hex[:12]}@example.com"
+    response = requests.post(f"{BASE_URL}/auth/register", json={
+        "email": email, "password": "correct horse", "repeat_password": "correct horse", "device_id": "test_device"
+    })
+    print(f"Register status: {response.status_code}")
+    assert response.status_code == 200, response.text
+
+    response = requests.post(f"{BASE_URL}/auth/login", json={"email": email, "password": "correct horse", "device_id": "test_device"})
+    assert response.status_code == 200, response.text
+    response = requests.post(f"{BASE_URL}/auth/login", json={"email": email, "password": "wrong horse", "device_id": "test_device"})
+    assert response.status_code == 401
+
+    # The same path in-process: PASSWORD_HASH_WORKERS > 0 hashes in a spawned process
+    from app import config
+    from app.utils import auth
+    assert config.PASSWORD_HASH_WORKERS > 0
+    hashed = auth.get_password_hash("correct horse")
+    assert auth._hash_pool is not None
+    assert auth.verify_password("correct horse", hashed)
+    assert not auth.verify_password("wrong horse", hashed)
+    print("✓ Passed\n")
+
+
+def test_hash_queue_full_sheds_with_retry_after():
+    """Test that hashing is rejected with 503 and Retry-After once the queue is full"""
+    print("Testing: Full hashing queue sheds load")
+    from app.utils import auth
+
+    # Occupy every running and queued slot
+    taken = 0
+    while auth._hash_slots.acquire(blocking=False):
+        taken += 1
+    try:
+        auth.get_password_hash("correct horse")
+        raise AssertionError("expected a 503")
+    except HTTPException as e:
+        print(f"Status: {e.status_code}, Retry-After: {e.headers.get('Retry-After')}")
+        assert e.status_code == 503
+        assert e.headers["Retry-After"] == str(auth.PASSWORD_HASH_RETRY_AFTER)
+    finally:
+        for _ in range(taken):
+            auth._hash_slots.release()
+    print("✓ Passed\n")
+
+
+def test_token_of_reused_user_id_is_rejected():
+    """Test that a deleted account's token does not authenticate a new account with the same id"""
+    print("Testing: Token of a deleted account whose id was reused")
+    old_user_id, old_headers = login()
+    assert wipe(old_user_id, old_headers).status_code == 200
+
+    # SQLite hands the newest row's id to the next account once that row is gone
+    new_user_id, new_headers = login()
+    print(f"Old user_id={old_user_id}, new user_id={new_user_id}")
+    assert new_user_id == old_user_id
+
+    response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": new_user_id}, headers=old_headers)
+    print(f"Old token status: {response.status_code}")
+    assert response.status_code == 401
+    response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": new_user_id}, headers=new_headers)
+    assert response.status_code == 200
+    print("✓ Passed\n")
+
+
+
+def test_deleted_user_token_rejected_in_every_worker():
+    """Test that a wiped account's token gets 401, also in a worker that had it cached"""
+    print("Testing: Token of a wiped account")
+    from fastapi.security import HTTPAuthorizationCredentials
+    from app.database import SessionLocal
+    from app.utils import auth
+
+    user_id, headers = login()
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=headers["Authorization"][7:])
+
+    # This process stands in for another uvicorn worker that has seen the token
+    db = SessionLocal()
+    try:
+        assert auth.get_current_user_id(credentials, db) == user_id
+
+        assert wipe(user_id, headers).status_code == 200
+        response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": user_id}, headers=headers)
+        print(f"Status in the wiping worker: {response.status_code}")
+        assert response.status_code == 401
+
+        try:
+            auth.get_current_user_id(credentials, db)
+            raise AssertionError("expected a 401")
+        except HTTPException as e:
+            print(f"Status in another worker: {e.status_code}")
+            assert e.status_code == 401
+    finally:
+        db.close()
+    print("✓ Passed\n")
+
+
+def test_wipe_deletes_rate_limit_bucket():
+    """Test that wiping an account deletes its LLM rate limit bucket"""
+    print("Testing: Wipe deletes the rate limit bucket")
+    from app.database import SessionLocal
+    from app.models import RateLimitBucket
+
+    user_id, headers = login()
+    response = requests.get(f"{BASE_URL}/user/wearable/view", params={"user_id": user_id}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    db = SessionLocal()
+    try:
+        key = f"user:{user_id}"
+        assert db.query(RateLimitBucket).filter(RateLimitBucket.key == key).count() == 1
+        assert wipe(user_id, headers).status_code == 200
+        remaining = db.query(RateLimitBucket).filter(RateLimitBucket.key == key).count()
+        print(f"Buckets left for {key}: {remaining}")
+        assert remaining == 0
+        assert db.query(RateLimitBucket).filter(RateLimitBucket.key == "global").count() == 1
+    finally:
+        db.close()
+    print("✓ Passed\n")
+
+
+def test_login_rehashes_outdated_cost():
+    """Test that logging in rehashes a password stored with another bcrypt cost"""
+    print("Testing: Login rehashes at the configured bcrypt cost")
+    from passlib.hash import bcrypt
+    from app import config
+    from app.database import SessionLocal
+    from app.models import User
+    email = f"test_{uuid.uuid4().hex[:12]}@example.com"
+    response = requests.post(f"{BASE_URL}/auth/register", json={
+        "email": email, "password": "correct horse", "repeat_password": "correct horse", "device_id": "test_device"
+    })
+    assert response.status_code == 200, response.text
+
+    db = SessionLocal()
+    try:
+        # As stored before BCRYPT_ROUNDS changed
+        outdated = bcrypt.using(rounds=4).hash("correct horse")
+        db.query(User).filter(User.email == email).update({"hashed_password": outdated})
+        db.commit()
+
+        response = requests.post(f"{BASE_URL}/auth/login", json={"email": email, "password": "correct horse", "device_id": "test_device"})
+        assert response.status_code == 200, response.text
+        db.expire_all()
+        stored = db.query(User.hashed_password).filter(User.email == email).scalar()
+        print(f"Cost before: 4, after: {bcrypt.from_string(stored).rounds}")
+        assert stored != outdated
+        assert bcrypt.from_string(stored).rounds == config.BCRYPT_ROUNDS
+        assert bcrypt.verify("correct horse", stored)
+    finally:
+        db.close()
+    print("✓ Passed\n")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("AUTHENTICATION TESTS")
+    print("=" * 60 + "\n")
+
+    test_password_register_and_login()
+    test_hash_queue_full_sheds_with_retry_after()
+    test_token_of_reused_user_id_is_rejected()
+    test_deleted_user_token_rejected_in_every_worker()
+    test_wipe_deletes_rate_limit_bucket()
+    test_login_rehashes_outdated_cost()
+
+    print("=" * 60)
+    print("ALL TESTS PASSED!")
+    print("=" * 60)
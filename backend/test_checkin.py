@@ -1,5 +1,6 @@
 import requests
 import json
+import os
 from datetime import datetime
 
 # API base URL
@@ -8,6 +9,9 @@ BASE_URL = "http://localhost:8000"
 # Test user (using anonymous user 1)
 TEST_DEVICE_ID = "test_device_anon"
 
+# Bearer token header, set by get_user_id()
+AUTH_HEADERS = {}
+
 def get_user_id():
     """Login to get user ID"""
     response = requests.post(
@@ -16,6 +20,7 @@ def get_user_id():
     )
     if response.status_code == 200:
         data = response.json()
+        AUTH_HEADERS["Authorization"] = f"Bearer {data['token']}"
         print(f"✓ Logged in as user_id: {data['user_id']}")
         return data['user_id']
     else:
@@ -96,7 +101,8 @@ def test_checkin_analyze(user_id, wearable_data_str):
     # Call the endpoint
     response = requests.post(
         f"{BASE_URL}/check-in/analyze",
-        json=payload
+        json=payload,
+        headers=AUTH_HEADERS
     )
     
     print(f"\n📡 Response Status: {response.status_code}")
@@ -121,6 +127,118 @@ def test_checkin_analyze(user_id, wearable_data_str):
         print(f"\n✗ FAILED!")
         print(f"Error: {response.text}")
 
+def test_checkin_fast_mode(user_id):
+    """Test /check-in/analyze?mode=fast, answered by the local recommender"""
+    
+    payload = {
+        "user_id": user_id,
+        "check_in_data": json.dumps({
+            "data": {
+                "stressLevel": {"value": 9, "scaleMax": 10, "label": "Very high"},
+                "userNotes": "Panic attack in the break room after a patient coded. Dr. Jane Roe was there."
+            }
+        })
+    }
+    
+    print(f"\n🔄 Calling POST /check-in/analyze?mode=fast...")
+    start = datetime.utcnow()
+    response = requests.post(f"{BASE_URL}/check-in/analyze", params={"mode": "fast"}, json=payload, headers=AUTH_HEADERS)
+    elapsed_ms = (datetime.utcnow() - start).total_seconds() * 1000
+    
+    print(f"\n📡 Response Status: {response.status_code} in {elapsed_ms:.0f} ms")
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["mode"] == "fast"
+    assert result["recommended_intervention_ids"]
+    assert "Jane Roe" not in result["sanitized_text"]
+    print(f"IDs: {result['recommended_intervention_ids']}")
+    print(f"Sanitized: {result['sanitized_text']}")
+    print(f"Reasoning: {result['ai_reasoning']}")
+
+def test_checkin_frontend_text(user_id):
+    """Test parsing and redaction of the app's plain-text check-in format in fast mode"""
+    from app.utils.fast_recommender import parse_check_in
+    
+    # Exactly as frontend/src/pages/CheckIn.tsx builds it
+    check_in_data = ("Stress: 7/10, Capacity: 2/10, Sleep Debt: 8/10, Illness: 6/10. "
+                     "Notes: Covered for Dr. Jane Roe at Memorial Hospital again on 3/14/2026.")
+    signals = parse_check_in(check_in_data)
+    assert (signals["stress"], signals["capacity"], signals["sleep_debt"], signals["illness"]) == (7, 2, 8, 6)
+    
+    response = requests.post(f"{BASE_URL}/check-in/analyze", params={"mode": "fast"},
+                             json={"user_id": user_id, "check_in_data": check_in_data}, headers=AUTH_HEADERS)
+    assert response.status_code == 200, response.text
+    sanitized = response.json()["sanitized_text"]
+    print(f"\nSanitized: {sanitized}")
+    # Scores and labels survive; names, places and dates do not
+    assert sanitized.startswith("Stress: 7/10, Capacity: 2/10, Sleep Debt: 8/10, Illness: 6/10. Notes: ")
+    for detail in ["Jane Roe", "Memorial Hospital", "3/14/2026"]:
+        assert detail not in sanitized
+    
+    # A check-in without notes gets a generated note, which keeps its scores too
+    response = requests.post(f"{BASE_URL}/check-in/analyze", params={"mode": "fast"},
+                             json={"user_id": user_id, "check_in_data": "Stress: 5/10, Capacity: 6/10, Sleep Debt: 1/10, Illness: 0/10. Notes: "},
+                             headers=AUTH_HEADERS)
+    assert response.json()["sanitized_text"] == "Check-in: stress 5/10, capacity 6/10, sleep debt 1/10, illness 0/10."
+
+def test_recommendation_conversion(user_id):
+    """Test the /check-in/recommendations endpoint after a check-in"""
+    
+    print(f"\n🔄 Calling GET /check-in/recommendations...")
+    response = requests.get(
+        f"{BASE_URL}/check-in/recommendations",
+        params={"user_id": user_id},
+        headers=AUTH_HEADERS
+    )
+    
+    print(f"\n📡 Response Status: {response.status_code}")
+    assert response.status_code == 200, response.text
+    for row in response.json():
+        print(f"  {row['intervention_id']:>4} {row['name']}: recommended {row['recommendations']}x, "
+              f"completed: {'yes' if row['users_completed'] else 'no'}")
+
+def test_wearable_prompt_signals():
+    """Test that the check-in prompt carries wearable signals for the app's own sync format"""
+    from app.database import SessionLocal
+    from app.routers import llm
+    from app.utils.wearable_features import get_wearable_features
+    
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "public",
+                           "wearable_example.json")) as f:
+        frontend_payload = f.read()
+    # A payload the rollups read no metric from still reaches the prompt, trimmed
+    unrecognized_payload = json.dumps({"date": "2026-01-08", "biometrics": {"hrv_avg_ms": 42},
+                                       "trends": {"hrv_5min_samples": list(range(50))}})
+    
+    prompts = []
+    def capture(messages, schema, schema_name):
+        prompts.append(messages[1]["content"])
+        return {"sanitized_text": "", "recommended_intervention_ids": [], "ai_reasoning": ""}
+    original = llm.structured_response
+    llm.structured_response = capture
+    
+    try:
+        for payload, expected in [(frontend_payload, '"resting_hr":{"latest":54.0'),
+                                  (unrecognized_payload, '"latest_upload":{"date":"2026-01-08","biometrics":{"hrv_avg_ms":42}')]:
+            response = requests.post(f"{BASE_URL}/auth/login", json={"device_id": f"test_device_{datetime.utcnow().timestamp()}"})
+            user_id = response.json()["user_id"]
+            headers = {"Authorization": f"Bearer {response.json()['token']}"}
+            response = requests.post(f"{BASE_URL}/user/wearable", json={"user_id": user_id, "wearable_data": payload},
+                                     headers=headers)
+            assert response.status_code == 200, response.text
+            
+            db = SessionLocal()
+            try:
+                features = get_wearable_features(db, user_id)
+            finally:
+                db.close()
+            llm._llm_analysis("Stress: 6/10", features)
+            print(f"\n📈 Prompt signals: {prompts[-1].split('Wearable signals')[1].splitlines()[0]}")
+            assert expected in prompts[-1], prompts[-1]
+            assert "hrv_5min_samples" not in prompts[-1]
+    finally:
+        llm.structured_response = original
+
 def insert_wearable_data_db(user_id, wearable_data_str):
     """Insert wearable data directly into database using SQLAlchemy"""
     import sys
@@ -164,6 +282,17 @@ if __name__ == "__main__":
     # Step 3: Test check-in analyze
     test_checkin_analyze(user_id, wearable_data_str)
     
+    # Step 4: Fast mode
+    test_checkin_fast_mode(user_id)
+    
+    test_checkin_frontend_text(user_id)
+    
+    # Step 5: Recommendation conversion for the user
+    test_recommendation_conversion(user_id)
+    
+    # Step 6: Wearable signals in the LLM prompt
+    test_wearable_prompt_signals()
+    
     print("\n" + "=" * 60)
     print("TEST COMPLETE")
     print("=" * 60)
@@ -1,13 +1,23 @@
 """
 Test script for the journaling counseling endpoints.
 """
+import json
+import time
 import requests
+from fastapi import HTTPException
 
 BASE_URL = "http://localhost:8000"
 
+
+def login():
+    """Create an anonymous session; returns (user_id, auth headers)."""
+    response = requests.post(f"{BASE_URL}/auth/login", json={"device_id": "test_device_anon"})
+    data = response.json()
+    return data["user_id"], {"Authorization": f"Bearer {data['token']}"}
+
 def test_counseling():
-    # First, let's use an existing user (user_id=1 from previous tests)
-    user_id = 1
+    # Start a fresh anonymous session
+    user_id, headers = login()
     
     # Test 1: Start counseling
     print("=" * 50)
@@ -16,7 +26,8 @@ def test_counseling():
     
     response = requests.post(
         f"{BASE_URL}/counseling/start",
-        json={"user_id": user_id}
+        json={"user_id": user_id},
+        headers=headers
     )
     
     if response.status_code == 200:
@@ -35,7 +46,8 @@ def test_counseling():
             json={
                 "conversation_id": conversation_id,
                 "message": "I've been feeling anxious lately about work. Can you help me understand why?"
-            }
+            },
+            headers=headers
         )
         
         if follow_response.status_code == 200:
@@ -52,5 +64,178 @@ def test_counseling():
         print(f"✗ Error: {response.status_code}")
         print(response.json())
 
+def test_counseling_with_long_journals():
+    # A long entry is sent condensed and a short one in full; both must work
+    user_id, headers = login()
+    long_text = "Today started calm but the meeting went badly and I kept replaying it. " * 40
+    for text in [long_text, "Felt a little better after a walk."]:
+        response = requests.post(
+            f"{BASE_URL}/journal/create",
+            json={"user_id": user_id, "journal_description": text, "expiration_type": "delete_manually"},
+            headers=headers
+        )
+        assert response.status_code == 200
+    
+    entries = requests.get(f"{BASE_URL}/journal/history", params={"user_id": user_id}, headers=headers).json()
+    response = requests.post(
+        f"{BASE_URL}/counseling/start",
+        json={"user_id": user_id, "journal_entry_ids": [entry["id"] for entry in entries]},
+        headers=headers
+    )
+    assert response.status_code == 200, response.text
+    print(f"✓ Counseling over condensed journals:\n{response.json()['counseling'][:500]}...")
+
+def stored_tokens(key):
+    """Tokens stored in a rate limit bucket, before any refill since its last update."""
+    from sqlalchemy import text
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        return db.execute(text("SELECT tokens FROM rate_limit_buckets WHERE key = :key"), {"key": key}).scalar()
+    finally:
+        db.close()
+
+def test_counseling_rate_limited():
+    # Past the user's burst, LLM routes answer 429 with Retry-After
+    from app import config
+    user_id, headers = login()
+    statuses = []
+    for _ in range(int(config.LLM_USER_BURST) + 1):
+        response = requests.post(f"{BASE_URL}/counseling/start", json={"user_id": user_id}, headers=headers)
+        statuses.append(response.status_code)
+    print(f"Statuses: {statuses}")
+    assert statuses[0] == 200
+    assert statuses[-1] == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    print("✓ Rate limited with Retry-After")
+
+def test_counseling_forbidden_refunds_tokens():
+    # A request for another user's id is rejected by the route and costs no tokens
+    user_id, headers = login()
+    response = requests.post(f"{BASE_URL}/counseling/start", json={"user_id": user_id}, headers=headers)
+    assert response.status_code == 200, response.text
+    before = stored_tokens(f"user:{user_id}")
+    for _ in range(3):
+        response = requests.post(f"{BASE_URL}/counseling/start", json={"user_id": user_id + 100000}, headers=headers)
+        assert response.status_code == 403
+    after = stored_tokens(f"user:{user_id}")
+    print(f"User tokens before: {before:.2f}, after: {after:.2f}")
+    assert after >= before
+    print("✓ Forbidden requests refunded")
+
+def test_shed_spends_no_tokens():
+    # Beyond the in-flight limit the worker sheds with 503 before touching the buckets
+    from app import config
+    from app.database import SessionLocal
+    from app.utils import admission
+    user_id, _ = login()
+    key = f"user:{user_id}"
+    db = SessionLocal()
+    saved = admission._in_flight
+    admission._in_flight = config.LLM_MAX_IN_FLIGHT
+    try:
+        admission._admit(db, user_id)
+        raise AssertionError("expected a 503")
+    except HTTPException as e:
+        print(f"Status: {e.status_code}, Retry-After: {e.headers.get('Retry-After')}")
+        assert e.status_code == 503
+        assert e.headers["Retry-After"] == str(admission.SHED_RETRY_AFTER)
+    finally:
+        admission._in_flight = saved
+        db.close()
+    assert stored_tokens(key) is None
+    assert admission.get_admission_stats()["in_flight"] == saved
+    print("✓ Shed without spending tokens")
+
+def test_pending_llm_call_holds_slot():
+    # A check-in answered without waiting for the LLM still counts the call until it finishes
+    from concurrent.futures import Future
+    from app.utils import admission
+    before = admission.get_admission_stats()["in_flight"]
+    future = Future()
+    admission.hold_until_done(future)
+    held = admission.get_admission_stats()["in_flight"]
+    future.set_result({})
+    after = admission.get_admission_stats()["in_flight"]
+    print(f"In flight: {before} -> {held} -> {after}")
+    assert held == before + 1 and after == before
+    print("✓ Pending LLM call held its slot")
+
+def test_llm_call_coalescing():
+    # Identical concurrent calls share one upstream call, within and across workers
+    import threading
+    import uuid
+    from datetime import datetime, timedelta
+    from app import config
+    from app.database import SessionLocal
+    from app.models import LLMCallLock
+    from app.utils import llm_utils
+    
+    saved = (config.LLM_FAKE, config.LLM_FAKE_LATENCY_SECONDS, config.LLM_COALESCE_CROSS_WORKER)
+    config.LLM_FAKE, config.LLM_FAKE_LATENCY_SECONDS, config.LLM_COALESCE_CROSS_WORKER = True, 0.3, True
+    schema = {"type": "object", "properties": {"reply": {"type": "string"}}}
+    
+    def call(messages, results):
+        results.append(llm_utils.structured_response(messages, schema, "coalesce_test"))
+    
+    # Within this worker: four callers, one upstream call
+    messages = [{"role": "user", "content": f"coalesce {uuid.uuid4().hex}"}]
+    before = llm_utils.get_coalesce_stats()
+    results = []
+    threads = [threading.Thread(target=call, args=(messages, results)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    after = llm_utils.get_coalesce_stats()
+    print(f"Upstream calls: {after['upstream_calls'] - before['upstream_calls']}, coalesced: {after['coalesced'] - before['coalesced']}")
+    assert len(results) == 4
+    assert after["upstream_calls"] - before["upstream_calls"] == 1
+    assert after["coalesced"] - before["coalesced"] == 3
+    
+    db = SessionLocal()
+    try:
+        # Another worker is calling upstream: wait for the result it publishes
+        messages = [{"role": "user", "content": f"coalesce {uuid.uuid4().hex}"}]
+        key = llm_utils.request_key(messages, "coalesce_test", "gpt-5-mini")
+        db.add(LLMCallLock(key=key, owner="other-worker", created_at=datetime.utcnow()))
+        db.commit()
+        results = []
+        thread = threading.Thread(target=call, args=(messages, results))
+        thread.start()
+        time.sleep(0.5)
+        db.query(LLMCallLock).filter(LLMCallLock.key == key).update(
+            {"result": '{"reply": "from the other worker"}', "completed_at": datetime.utcnow()})
+        db.commit()
+        thread.join()
+        assert results == [{"reply": "from the other worker"}]
+        
+        # A dead worker's lock is taken over, and its late release leaves the new owner's row alone
+        messages = [{"role": "user", "content": f"coalesce {uuid.uuid4().hex}"}]
+        key = llm_utils.request_key(messages, "coalesce_test", "gpt-5-mini")
+        long_ago = datetime.utcnow() - timedelta(seconds=config.LLM_COALESCE_WAIT_SECONDS + 1)
+        db.add(LLMCallLock(key=key, owner="dead-worker", created_at=long_ago))
+        db.commit()
+        before = llm_utils.get_coalesce_stats()
+        results = []
+        call(messages, results)
+        assert llm_utils.get_coalesce_stats()["upstream_calls"] - before["upstream_calls"] == 1
+        llm_utils._release_cross_worker_lock(key, "dead-worker", None)
+        db.expire_all()
+        lock = db.query(LLMCallLock).filter(LLMCallLock.key == key).first()
+        print(f"Lock owner after takeover: {lock.owner}")
+        assert lock.owner != "dead-worker"
+        assert json.loads(lock.result) == results[0]
+    finally:
+        config.LLM_FAKE, config.LLM_FAKE_LATENCY_SECONDS, config.LLM_COALESCE_CROSS_WORKER = saved
+        db.close()
+    print("✓ LLM calls coalesced")
+
 if __name__ == "__main__":
     test_counseling()
+    test_counseling_with_long_journals()
+    test_counseling_rate_limited()
+    test_counseling_forbidden_refunds_tokens()
+    test_shed_spends_no_tokens()
+    test_pending_llm_call_holds_slot()
+    test_llm_call_coalescing()
@@ -1,43 +1,58 @@
 import requests
 import json
+import re
 from datetime import datetime
 
 BASE_URL = "http://localhost:8000"
 
+# Anonymous session shared by all tests, created on first use
+SESSION = {}
+
+
+def login():
+    """Return (user_id, auth headers) for the shared anonymous session."""
+    if not SESSION:
+        response = requests.post(f"{BASE_URL}/auth/login", json={"device_id": "test_device_anon"})
+        data = response.json()
+        SESSION["user_id"] = data["user_id"]
+        SESSION["headers"] = {"Authorization": f"Bearer {data['token']}"}
+    return SESSION["user_id"], SESSION["headers"]
+
 def test_journal_create():
     """Test creating journal entries"""
     print("\n=== Testing Journal Creation ===")
+    user_id, headers = login()
     
     # Test with 7_days expiration
     payload = {
-        "user_id": 1,
+        "user_id": user_id,
         "journal_description": "Today was a challenging day. I practiced my breathing exercises and felt more centered.",
         "expiration_type": "7_days"
     }
     
-    response = requests.post(f"{BASE_URL}/journal/create", json=payload)
+    response = requests.post(f"{BASE_URL}/journal/create", json=payload, headers=headers)
     print(f"Status Code: {response.status_code}")
     print(f"Response: {json.dumps(response.json(), indent=2)}")
     
     # Test with 30_days expiration
     payload2 = {
-        "user_id": 1,
+        "user_id": user_id,
         "journal_description": "Feeling grateful for the progress I've made. The grounding techniques are really helping.",
         "expiration_type": "30_days"
     }
     
-    response2 = requests.post(f"{BASE_URL}/journal/create", json=payload2)
+    response2 = requests.post(f"{BASE_URL}/journal/create", json=payload2, headers=headers)
     print(f"\nStatus Code: {response2.status_code}")
     print(f"Response: {json.dumps(response2.json(), indent=2)}")
     
     # Test with delete_manually
     payload3 = {
-        "user_id": 1,
+        "user_id": user_id,
         "journal_description": "Important milestone: completed my first week of interventions consistently.",
         "expiration_type": "delete_manually"
     }
     
-    response3 = requests.post(f"{BASE_URL}/journal/create", json=payload3)
+    response3 = requests.post(f"{BASE_URL}/journal/create", json=payload3, headers=headers)
     print(f"\nStatus Code: {response3.status_code}")
     print(f"Response: {json.dumps(response3.json(), indent=2)}")
 
@@ -45,8 +60,9 @@ def test_journal_create():
 def test_journal_history():
     """Test retrieving journal history"""
     print("\n=== Testing Journal History ===")
+    user_id, headers = login()
     
-    response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": 1})
+    response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": user_id}, headers=headers)
     print(f"Status Code: {response.status_code}")
     
     if response.status_code == 200:
@@ -61,24 +77,112 @@ def test_journal_history():
         print(f"Error: {response.json()}")
 
 
+def test_journal_history_pagination():
+    """Test paging through journal history with limit/cursor"""
+    print("\n=== Testing Journal History Pagination ===")
+    user_id, headers = login()
+    
+    params = {"user_id": user_id, "limit": 2}
+    seen_ids = []
+    while True:
+        response = requests.get(f"{BASE_URL}/journal/history", params=params, headers=headers)
+        print(f"Status Code: {response.status_code}, page size: {len(response.json())}")
+        seen_ids.extend(entry["id"] for entry in response.json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            break
+        params["cursor"] = next_cursor
+    
+    all_entries = requests.get(f"{BASE_URL}/journal/history", params={"user_id": user_id}, headers=headers).json()
+    print(f"Paged through {len(seen_ids)} entries, full history has {len(all_entries)}")
+    assert seen_ids == [entry["id"] for entry in all_entries]
+
+
+def test_journal_history_conditional_get():
+    """Test that an unchanged history is answered with 304 Not Modified"""
+    print("\n=== Testing Journal History Conditional GET ===")
+    user_id, headers = login()
+    
+    response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": user_id}, headers=headers)
+    etag = response.headers.get("ETag")
+    print(f"ETag: {etag}")
+    
+    cached = requests.get(
+        f"{BASE_URL}/journal/history",
+        params={"user_id": user_id},
+        headers={**headers, "If-None-Match": etag}
+    )
+    print(f"Status Code with If-None-Match: {cached.status_code}")
+    assert cached.status_code == 304
+
+
+def test_journal_history_query_count():
+    """Test that reading the history runs a bounded number of SQL statements"""
+    print("\n=== Testing Journal History Query Count ===")
+    user_id, headers = login()
+    
+    response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": user_id}, headers=headers)
+    server_timing = response.headers.get("Server-Timing", "")
+    print(f"Server-Timing: {server_timing}")
+    
+    # Version lookup, expiry sweep and the page itself, however many entries exist
+    queries = int(re.search(r'desc="(\d+) queries"', server_timing).group(1))
+    assert queries <= 3
+
+
+def test_journal_search():
+    """Test full-text search with highlighted snippets, and that deleted entries drop out"""
+    print("\n=== Testing Journal Search ===")
+    user_id, headers = login()
+    
+    payload = {
+        "user_id": user_id,
+        "journal_description": "Walked along the lighthouse pier at dawn and the panic finally eased.",
+        "expiration_type": "delete_manually"
+    }
+    requests.post(f"{BASE_URL}/journal/create", json=payload, headers=headers)
+    
+    # Stemmed and prefix matches ("walking" -> walk, "lightho" -> lighthouse)
+    response = requests.get(
+        f"{BASE_URL}/journal/search",
+        params={"user_id": user_id, "q": "walking lightho"},
+        headers=headers
+    )
+    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    assert response.status_code == 200
+    results = response.json()
+    assert len(results) >= 1
+    assert "<mark>lighthouse</mark>" in results[0]["snippet"]
+    
+    delete_response = requests.delete(f"{BASE_URL}/journal/entry/{results[0]['id']}", headers=headers)
+    assert delete_response.status_code == 200
+    response = requests.get(
+        f"{BASE_URL}/journal/search",
+        params={"user_id": user_id, "q": "lighthouse"},
+        headers=headers
+    )
+    assert all(result["id"] != results[0]["id"] for result in response.json())
+
+
 def test_journal_delete():
     """Test deleting a journal entry"""
     print("\n=== Testing Journal Deletion ===")
+    user_id, headers = login()
     
     # First, get all entries
-    response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": 1})
+    response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": user_id}, headers=headers)
     
     if response.status_code == 200 and len(response.json()) > 0:
         entry_id = response.json()[0]['id']
         print(f"Deleting entry with ID: {entry_id}")
         
-        delete_response = requests.delete(f"{BASE_URL}/journal/entry/{entry_id}")
+        delete_response = requests.delete(f"{BASE_URL}/journal/entry/{entry_id}", headers=headers)
         print(f"Status Code: {delete_response.status_code}")
         print(f"Response: {json.dumps(delete_response.json(), indent=2)}")
         
         # Verify it's deleted
         print("\nVerifying deletion...")
-        verify_response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": 1})
+        verify_response = requests.get(f"{BASE_URL}/journal/history", params={"user_id": user_id}, headers=headers)
         print(f"Remaining entries: {len(verify_response.json())}")
     else:
         print("No entries found to delete")
@@ -87,21 +191,23 @@ def test_journal_delete():
 def test_invalid_expiration_type():
     """Test with invalid expiration type"""
     print("\n=== Testing Invalid Expiration Type ===")
+    user_id, headers = login()
     
     payload = {
-        "user_id": 1,
+        "user_id": user_id,
         "journal_description": "This should fail",
         "expiration_type": "invalid_type"
     }
     
-    response = requests.post(f"{BASE_URL}/journal/create", json=payload)
+    response = requests.post(f"{BASE_URL}/journal/create", json=payload, headers=headers)
     print(f"Status Code: {response.status_code}")
     print(f"Response: {json.dumps(response.json(), indent=2)}")
 
 
 def test_nonexistent_user():
-    """Test with non-existent user"""
+    """Test with another user's id (should be rejected with 403)"""
     print("\n=== Testing Non-Existent User ===")
+    user_id, headers = login()
     
     payload = {
         "user_id": 99999,
@@ -109,11 +215,126 @@ def test_nonexistent_user():
         "expiration_type": "7_days"
     }
     
-    response = requests.post(f"{BASE_URL}/journal/create", json=payload)
+    response = requests.post(f"{BASE_URL}/journal/create", json=payload, headers=headers)
     print(f"Status Code: {response.status_code}")
     print(f"Response: {json.dumps(response.json(), indent=2)}")
 
 
+
+def test_manual_journal_reader_not_reaped():
+    """Test that reading kept journal entries counts as activity for the anonymous user reaper"""
+    print("\n=== Testing Reaper Activity From Reads ===")
+    from datetime import timedelta
+    from fastapi.security import HTTPAuthorizationCredentials
+    from app import config
+    from app.database import SessionLocal
+    from app.models import JournalEntry, User
+    from app.utils.auth import account_stamp, create_access_token, get_current_user_id
+    from app.utils.reaper import find_abandoned_users
+    
+    response = requests.post(f"{BASE_URL}/auth/login", json={"device_id": f"test_device_reader_{datetime.utcnow().timestamp()}"})
+    user_id = response.json()["user_id"]
+    token = response.json()["token"]
+    response = requests.post(f"{BASE_URL}/journal/create", json={
+        "user_id": user_id, "journal_description": "Keep this one.", "expiration_type": "delete_manually"
+    }, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    
+    db = SessionLocal()
+    try:
+        # Everything the user wrote, and their last request, is past retention
+        long_ago = datetime.utcnow() - timedelta(days=config.ANON_USER_RETENTION_DAYS + 10)
+        db.query(User).filter(User.id == user_id).update({"created_at": long_ago, "last_seen_at": long_ago})
+        db.query(JournalEntry).filter(JournalEntry.user_id == user_id).update({"created_at": long_ago})
+        db.commit()
+        cutoff = datetime.utcnow() - timedelta(days=config.ANON_USER_RETENTION_DAYS)
+        assert user_id in find_abandoned_users(db, cutoff, 100000)
+        
+        # A token for the backdated account, as if issued at login
+        user = db.query(User).filter(User.id == user_id).first()
+        token = create_access_token(data={"sub": str(user_id), "acct": account_stamp(user.created_at)})
+        
+        # An authenticated read, e.g. GET /journal/history, marks the user as active again
+        get_current_user_id(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), db)
+        print(f"Abandoned after the read: {user_id in find_abandoned_users(db, cutoff, 100000)}")
+        assert user_id not in find_abandoned_users(db, cutoff, 100000)
+    finally:
+        db.close()
+
+
+def test_text_compression_formats():
+    """Test that every storage format of compressed text round-trips, in Python and in SQL"""
+    print("\n=== Testing Text Compression Formats ===")
+    from sqlalchemy import text
+    from app.database import engine
+    from app.utils import text_compression
+    
+    value = "Slept badly again, the deadline keeps circling in my head. " * 20
+    key = "journal_entries.journal_description"
+    zstd_value = text_compression.compress(value, key)
+    
+    # Without the zstandard package values fall back to zlib
+    zstandard = text_compression.zstandard
+    text_compression.zstandard = None
+    try:
+        zlib_value = text_compression.compress(value, key)
+    finally:
+        text_compression.zstandard = zstandard
+    print(f"{len(value)} chars -> zstd {len(zstd_value)} bytes, zlib {len(zlib_value)} bytes")
+    assert zstd_value[:1] == text_compression.ZSTD
+    assert zlib_value[:1] == text_compression.ZLIB
+    
+    # Every format reads back; only zstd is current with zstandard installed
+    for stored in [zstd_value, zlib_value, value]:
+        assert text_compression.decompress(stored) == value
+    assert text_compression.is_current(zstd_value, key)
+    assert not text_compression.is_current(zlib_value, key)
+    assert not text_compression.is_current(value, key)
+    assert text_compression.compress("short", key) == "short"
+    
+    # The function the journal search triggers read through
+    with engine.connect() as connection:
+        for stored in [zstd_value, zlib_value, value, None]:
+            result = connection.execute(text("SELECT decompress_text(:stored)"), {"stored": stored}).scalar()
+            assert result == (value if stored is not None else None)
+
+
+def test_journal_written_before_compression():
+    """Test that entries stored as plain text before compression read, search and recompress"""
+    print("\n=== Testing Journal Entries Written Before Compression ===")
+    from sqlalchemy import text
+    from app.database import engine
+    from app.utils.text_compression import ZSTD, is_current, recompress
+    user_id, headers = login()
+    
+    description = "Before the upgrade I wrote about the orchard walk and the quiet afterwards. " * 5
+    response = requests.post(f"{BASE_URL}/journal/create", json={
+        "user_id": user_id, "journal_description": "placeholder", "expiration_type": "delete_manually"
+    }, headers=headers)
+    assert response.status_code == 200
+    entry_id = requests.get(f"{BASE_URL}/journal/history", params={"user_id": user_id}, headers=headers).json()[0]["id"]
+    
+    # The row as the old schema stored it: plain text, whatever its length
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE journal_entries SET journal_description = :value WHERE id = :id"),
+                           {"value": description, "id": entry_id})
+    
+    def check():
+        entries = requests.get(f"{BASE_URL}/journal/history", params={"user_id": user_id}, headers=headers).json()
+        assert next(entry for entry in entries if entry["id"] == entry_id)["journal"] == description
+        response = requests.get(f"{BASE_URL}/journal/search", params={"user_id": user_id, "q": "orchard"}, headers=headers)
+        assert [result["id"] for result in response.json()] == [entry_id]
+    
+    check()
+    # The recompression job rewrites it in the current format, and it still reads the same
+    recompress(pause=0)
+    with engine.connect() as connection:
+        stored = connection.execute(text("SELECT journal_description FROM journal_entries WHERE id = :id"),
+                                    {"id": entry_id}).scalar()
+    print(f"Stored after recompression: {type(stored).__name__} with marker {bytes(stored[:1])!r}")
+    assert bytes(stored[:1]) == ZSTD and is_current(stored, "journal_entries.journal_description")
+    check()
+
 if __name__ == "__main__":
     try:
         print("Starting Journal API Tests...")
@@ -122,9 +343,16 @@ if __name__ == "__main__":
         # Run tests
         test_journal_create()
         test_journal_history()
+        test_journal_history_pagination()
+        test_journal_history_conditional_get()
+        test_journal_history_query_count()
+        test_journal_search()
         test_journal_delete()
         test_invalid_expiration_type()
         test_nonexistent_user()
+        test_manual_journal_reader_not_reaped()
+        test_text_compression_formats()
+        test_journal_written_before_compression()
         
         print("\n=== All Tests Complete ===")
         
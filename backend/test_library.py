@@ -2,10 +2,19 @@
 """Test script for the interventions library endpoint"""
 
 import requests
+import gzip
 import json
+import uuid
 
 BASE_URL = "http://localhost:8000"
 
+
+def login():
+    """Create an anonymous session; returns (user_id, auth headers)."""
+    response = requests.post(f"{BASE_URL}/auth/login", json={"device_id": "test_device_anon"})
+    data = response.json()
+    return data["user_id"], {"Authorization": f"Bearer {data['token']}"}
+
 def test_get_all_interventions():
     """Test getting all interventions"""
     print("Testing: Get all interventions")
@@ -41,8 +50,9 @@ def test_get_multiple_interventions():
 
 def test_get_user_interventions():
     """Test getting interventions filtered by user_id"""
-    print("Testing: Get interventions for user_id=1")
-    response = requests.get(f"{BASE_URL}/library/interventions?user_id=1")
+    user_id, headers = login()
+    print(f"Testing: Get interventions for user_id={user_id}")
+    response = requests.get(f"{BASE_URL}/library/interventions?user_id={user_id}", headers=headers)
     print(f"Status: {response.status_code}")
     data = response.json()
     print(f"Count: {data['count']}")
@@ -55,8 +65,9 @@ def test_get_user_interventions():
 
 def test_user_with_specific_ids():
     """Test getting specific interventions for a user"""
-    print("Testing: Get interventions for user_id=1 with IDs=1,2")
-    response = requests.get(f"{BASE_URL}/library/interventions?user_id=1&intervention_ids=1&intervention_ids=2")
+    user_id, headers = login()
+    print(f"Testing: Get interventions for user_id={user_id} with IDs=1,2")
+    response = requests.get(f"{BASE_URL}/library/interventions?user_id={user_id}&intervention_ids=1&intervention_ids=2", headers=headers)
     print(f"Status: {response.status_code}")
     data = response.json()
     print(f"Count: {data['count']}")
@@ -67,6 +78,62 @@ def test_user_with_specific_ids():
     print("✓ Passed\n")
 
 
+def test_personalized_order():
+    """Test ordering interventions by the user's completion history"""
+    response = requests.post(f"{BASE_URL}/auth/login", json={"device_id": f"test_device_affinity_{uuid.uuid4().hex}"})
+    user_id = response.json()["user_id"]
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+    print(f"Testing: Personalized order for user_id={user_id}")
+    
+    for intervention_id in ["1", "1", "30"]:
+        response = requests.post(f"{BASE_URL}/library/interventions/complete",
+                                 json={"user_id": user_id, "intervention_id": intervention_id}, headers=headers)
+        assert response.status_code == 200
+    
+    response = requests.get(f"{BASE_URL}/library/interventions?user_id={user_id}&order=personalized", headers=headers)
+    print(f"Status: {response.status_code}")
+    ids = [i["id"] for i in response.json()["interventions"]]
+    print(f"Order: {ids[:5]}...")
+    # The most completed intervention leads; one completed once moves ahead of untouched ones
+    assert ids[0] == 1
+    assert ids.index(30) < len(ids) - 1
+    
+    response = requests.get(f"{BASE_URL}/library/interventions?user_id={user_id}", headers=headers)
+    assert [i["id"] for i in response.json()["interventions"]][-1] == 30
+    
+    response = requests.get(f"{BASE_URL}/library/interventions?order=personalized")
+    assert response.status_code == 400
+    print("✓ Passed\n")
+
+
+
+def test_compression_negotiation():
+    """Test that large responses use the client's preferred encoding and small ones are sent as is"""
+    import brotli
+    from app import config
+    print("Testing: Response compression negotiation")
+    decoders = {"br": brotli.decompress, "gzip": gzip.decompress}
+    expected = requests.get(f"{BASE_URL}/library/interventions", headers={"Accept-Encoding": "identity"}).json()
+    for accept_encoding, encoding in [("br", "br"), ("gzip", "gzip"), ("gzip, br", "br"),
+                                      ("gzip;q=1.0, br;q=0.5", "gzip"), ("br;q=0, gzip", "gzip"), ("identity", None)]:
+        response = requests.get(f"{BASE_URL}/library/interventions", headers={"Accept-Encoding": accept_encoding}, stream=True)
+        body = response.raw.read(decode_content=False)
+        print(f"Accept-Encoding: {accept_encoding!r} -> {response.headers.get('Content-Encoding')}, {len(body)} bytes")
+        assert response.headers.get("Content-Encoding") == encoding
+        if encoding:
+            assert "Accept-Encoding" in response.headers["Vary"]
+            assert int(response.headers["Content-Length"]) == len(body)
+            body = decoders[encoding](body)
+        assert json.loads(body) == expected
+    
+    # Below the minimum size responses are never compressed
+    response = requests.get(f"{BASE_URL}/health", headers={"Accept-Encoding": "br, gzip"}, stream=True)
+    body = response.raw.read(decode_content=False)
+    assert len(body) < config.COMPRESSION_MINIMUM_SIZE
+    assert "Content-Encoding" not in response.headers
+    assert json.loads(body) == {"status": "healthy"}
+    print("✓ Passed\n")
+
 if __name__ == "__main__":
     print("=" * 60)
     print("INTERVENTIONS LIBRARY ENDPOINT TESTS")
@@ -78,6 +145,8 @@ if __name__ == "__main__":
         test_get_multiple_interventions()
         test_get_user_interventions()
         test_user_with_specific_ids()
+        test_personalized_order()
+        test_compression_negotiation()
         
         print("=" * 60)
         print("ALL TESTS PASSED!")
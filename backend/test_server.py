@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Test script for server startup and the opt-in server features, each on its own server"""
+
+import glob
+import json
+import marshal
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Port of the servers these tests start, away from the shared server on 8000
+PORT = 8010
+
+
+def server_env(data_dir, **settings):
+    """Environment for a process of the app using `data_dir`, with the fake LLM and `settings`."""
+    env = {**os.environ, "DATA_DIR": data_dir, "LLM_FAKE": "1", "OPENAI_API_KEY": "sk-test"}
+    env.update({key: str(value) for key, value in settings.items()})
+    return env
+
+
+def migrate(data_dir):
+    subprocess.run([sys.executable, "-m", "app.migrations"], cwd=BACKEND_DIR, env=server_env(data_dir),
+                   check=True, capture_output=True)
+
+
+def start_server(data_dir, **settings):
+    """Start uvicorn on PORT with `settings` and wait for /health; returns (process, base URL)."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT)],
+        cwd=BACKEND_DIR, env=server_env(data_dir, **settings),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{PORT}"
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/health").status_code == 200:
+                return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise AssertionError("server did not start")
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait(timeout=10)
+
+
+def test_import_does_not_load_openai():
+    """Test that importing the app neither imports openai nor builds the LLM client"""
+    print("Testing: Lazy LLM client")
+    with tempfile.TemporaryDirectory() as data_dir:
+        result = subprocess.run(
+            [sys.executable, "-c",
+             "import sys, app.main; from app.utils import llm_utils; "
+             "print('openai' in sys.modules, llm_utils._client is None)"],
+            cwd=BACKEND_DIR, env=server_env(data_dir), check=True, capture_output=True, text=True
+        )
+    print(f"openai imported, client unset: {result.stdout.strip()}")
+    assert result.stdout.split() == ["False", "True"]
+    print("✓ Passed\n")
+
+
+def test_migrations_upgrade_database():
+    """Test that the migration step creates and upgrades the schema the server runs on"""
+    print("Testing: Migration step")
+    with tempfile.TemporaryDirectory() as data_dir:
+        migrate(data_dir)
+
+        # A database from before a column was added
+        connection = sqlite3.connect(os.path.join(data_dir, "app.db"))
+        connection.execute("ALTER TABLE users DROP COLUMN last_seen_at")
+        connection.commit()
+        migrate(data_dir)
+        migrate(data_dir)
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(users)")]
+        auto_vacuum = connection.execute("PRAGMA auto_vacuum").fetchone()[0]
+        connection.close()
+        print(f"users columns: {columns}, auto_vacuum: {auto_vacuum}")
+        assert "last_seen_at" in columns
+        assert auto_vacuum == 2
+
+        process, base_url = start_server(data_dir)
+        try:
+            response = requests.post(f"{base_url}/auth/login", json={"device_id": "test_device_anon"})
+            assert response.status_code == 200, response.text
+            headers = {"Authorization": f"Bearer {response.json()['token']}"}
+            response = requests.get(f"{base_url}/journal/history", params={"user_id": response.json()["user_id"]},
+                                    headers=headers)
+            assert response.status_code == 200, response.text
+        finally:
+            stop_server(process)
+    print("✓ Passed\n")
+
+
+def test_profiler():
+    """Test that the profiler records requests carrying the profile token, and only those"""
+    print("Testing: Sampling profiler")
+    admin = {"X-Admin-Token": "test-admin"}
+    with tempfile.TemporaryDirectory() as data_dir:
+        migrate(data_dir)
+        process, base_url = start_server(data_dir, PROFILER_ENABLED=1, PROFILER_TOKEN="test-profile",
+                                         PROFILER_MAX_PROFILES=2, ADMIN_TOKEN="test-admin")
+        try:
+            for token in [None, "wrong"]:
+                headers = {"X-Profile-Token": token} if token else {}
+                response = requests.get(f"{base_url}/library/interventions", headers=headers)
+                assert response.status_code == 200
+                assert "X-Profile-Id" not in response.headers
+
+            profile_ids = []
+            for _ in range(3):
+                response = requests.get(f"{base_url}/library/interventions", headers={"X-Profile-Token": "test-profile"})
+                assert response.status_code == 200
+                profile_ids.append(response.headers["X-Profile-Id"])
+
+            # Profiles are stored once the response is sent; the ring buffer keeps the newest two
+            deadline = time.monotonic() + 5
+            while True:
+                profiles = requests.get(f"{base_url}/admin/profiles", headers=admin).json()
+                if [profile["id"] for profile in profiles] == profile_ids[:0:-1] or time.monotonic() > deadline:
+                    break
+                time.sleep(0.1)
+            print(f"Profiles: {[(profile['id'], profile['samples']) for profile in profiles]}")
+            assert [profile["id"] for profile in profiles] == profile_ids[:0:-1]
+            assert profiles[0]["path"] == "/library/interventions" and profiles[0]["status"] == 200
+
+            response = requests.get(f"{base_url}/admin/profiles/{profile_ids[-1]}/speedscope", headers=admin)
+            assert response.status_code == 200
+            assert response.json()["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+            response = requests.get(f"{base_url}/admin/profiles/{profile_ids[-1]}/pstats", headers=admin)
+            assert response.status_code == 200
+            # What pstats.Stats loads: {(file, line, function): (calls, calls, total, cumulative, callers)}
+            stats = marshal.loads(response.content)
+            assert isinstance(stats, dict)
+            assert all(len(key) == 3 and len(value) == 5 for key, value in stats.items())
+            response = requests.get(f"{base_url}/admin/profiles/{profile_ids[0]}/pstats", headers=admin)
+            assert response.status_code == 404
+            assert requests.get(f"{base_url}/admin/profiles").status_code == 403
+        finally:
+            stop_server(process)
+    print("✓ Passed\n")
+
+
+def test_trace_capture_and_replay():
+    """Test that captured traces hold no user content and replay against another build"""
+    print("Testing: Trace capture and replay")
+    secret = "Told Dr. Alvarez about the panic attacks"
+    with tempfile.TemporaryDirectory() as capture_dir, tempfile.TemporaryDirectory() as replay_dir:
+        migrate(capture_dir)
+        process, base_url = start_server(capture_dir, TRACE_CAPTURE_ENABLED=1)
+        try:
+            response = requests.post(f"{base_url}/auth/login", json={"device_id": "test_device_trace"})
+            user_id = response.json()["user_id"]
+            headers = {"Authorization": f"Bearer {response.json()['token']}"}
+            response = requests.post(f"{base_url}/journal/create", json={
+                "user_id": user_id, "journal_description": secret, "expiration_type": "delete_manually"
+            }, headers=headers)
+            assert response.status_code == 200, response.text
+            response = requests.get(f"{base_url}/journal/history", params={"user_id": user_id}, headers=headers)
+            assert response.status_code == 200
+            response = requests.get(f"{base_url}/library/interventions", params={"intervention_ids": [1, 2]})
+            assert response.status_code == 200
+        finally:
+            stop_server(process)
+
+        files = glob.glob(os.path.join(capture_dir, "traces", "traces-*.jsonl"))
+        captured = ""
+        for name in files:
+            with open(name) as f:
+                captured += f.read()
+        traces = {trace["route"]: trace for trace in map(json.loads, captured.splitlines())}
+        print(f"Captured routes: {sorted(traces)}")
+        assert sorted(traces) == ["/auth/login", "/journal/create", "/journal/history", "/library/interventions"]
+        assert secret not in captured and "test_device_trace" not in captured
+        create = traces["/journal/create"]
+        assert create["body"] == {"user_id": "int", "journal_description": f"str:{len(secret)}",
+                                  "expiration_type": "delete_manually"}
+        assert create["status"] == 200 and create["request_bytes"] > len(secret)
+        assert create["user"] == traces["/journal/history"]["user"] != str(user_id)
+        assert traces["/journal/history"]["query"] == {"user_id": ["int"]}
+        assert traces["/library/interventions"]["query"] == {"intervention_ids": ["int", "int"]}
+        sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+        from replay import build_request
+        _, _, kwargs = build_request(traces["/library/interventions"], user_id)
+        assert kwargs["params"] == [("intervention_ids", 1), ("intervention_ids", 1)]
+
+        # Replay the capture against a fresh build
+        migrate(replay_dir)
+        process, base_url = start_server(replay_dir)
+        try:
+            result = subprocess.run(
+                [sys.executable, os.path.join("benchmarks", "replay.py"), *files, "--target", base_url, "--speed", "0"],
+                cwd=BACKEND_DIR, check=True, capture_output=True, text=True
+            )
+        finally:
+            stop_server(process)
+        print(result.stdout)
+        assert "4 requests" in result.stdout
+        assert all(line.endswith("errors 0") for line in result.stdout.splitlines() if line.startswith("  "))
+        connection = sqlite3.connect(os.path.join(replay_dir, "app.db"))
+        replayed = connection.execute("SELECT journal_description, expiration_type FROM journal_entries").fetchall()
+        connection.close()
+        # Text replays as filler of the same length
+        assert replayed == [("x" * len(secret), "delete_manually")]
+    print("✓ Passed\n")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("SERVER TESTS")
+    print("=" * 60 + "\n")
+
+    test_import_does_not_load_openai()
+    test_migrations_upgrade_database()
+    test_profiler()
+    test_trace_capture_and_replay()
+
+    print("=" * 60)
+    print("ALL TESTS PASSED!")
+    print("=" * 60)
@@ -3,17 +3,29 @@ Test script for wearable endpoints
 """
 import requests
 import json
+import os
+import time
 
 BASE_URL = "http://127.0.0.1:8000"
 
+# The payload the app itself syncs
+FRONTEND_PAYLOAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "public",
+                                "wearable_example.json")
+
+
+def login():
+    """Create an anonymous session; returns (user_id, auth headers)."""
+    response = requests.post(f"{BASE_URL}/auth/login", json={"device_id": "test_device_anon"})
+    data = response.json()
+    return data["user_id"], {"Authorization": f"Bearer {data['token']}"}
+
 def test_wearable_endpoints():
     print("=" * 60)
     print("Testing Wearable Endpoints")
     print("=" * 60)
     
-    # First, let's create a test user (or use existing)
-    # Assuming user_id 1 exists from previous tests
-    test_user_id = 1
+    # Start a fresh anonymous session
+    test_user_id, headers = login()
     
     # Test 1: POST /user/wearable - Save wearable data
     print("\n1. Testing POST /user/wearable")
@@ -42,7 +54,8 @@ def test_wearable_endpoints():
     try:
         response = requests.post(
             f"{BASE_URL}/user/wearable",
-            json=wearable_payload
+            json=wearable_payload,
+            headers=headers
         )
         print(f"Status Code: {response.status_code}")
         print(f"Response: {json.dumps(response.json(), indent=2)}")
@@ -81,7 +94,8 @@ def test_wearable_endpoints():
     try:
         response = requests.post(
             f"{BASE_URL}/user/wearable",
-            json=wearable_payload_2
+            json=wearable_payload_2,
+            headers=headers
         )
         print(f"Status Code: {response.status_code}")
         print(f"Response: {json.dumps(response.json(), indent=2)}")
@@ -98,7 +112,8 @@ def test_wearable_endpoints():
     try:
         response = requests.get(
             f"{BASE_URL}/user/wearable/view",
-            params={"user_id": test_user_id}
+            params={"user_id": test_user_id},
+            headers=headers
         )
         print(f"Status Code: {response.status_code}")
         print(f"Response: {json.dumps(response.json(), indent=2)}")
@@ -110,22 +125,23 @@ def test_wearable_endpoints():
     except Exception as e:
         print(f"❌ Error: {str(e)}")
     
-    # Test 3: Test with non-existent user
-    print("\n4. Testing with non-existent user (should fail)")
+    # Test 3: Test with another user's id
+    print("\n4. Testing with another user's id (should fail)")
     print("-" * 60)
     
     try:
         response = requests.get(
             f"{BASE_URL}/user/wearable/view",
-            params={"user_id": 99999}
+            params={"user_id": 99999},
+            headers=headers
         )
         print(f"Status Code: {response.status_code}")
         print(f"Response: {json.dumps(response.json(), indent=2)}")
         
-        if response.status_code == 404:
-            print("✅ Correctly returned 404 for non-existent user")
+        if response.status_code == 403:
+            print("✅ Correctly returned 403 for another user's id")
         else:
-            print("❌ Unexpected response for non-existent user")
+            print("❌ Unexpected response for another user's id")
     except Exception as e:
         print(f"❌ Error: {str(e)}")
     
@@ -134,5 +150,309 @@ def test_wearable_endpoints():
     print("=" * 60)
 
 
+
+def test_wearable_trends():
+    """Uploads are rolled up per day and week; a re-sync of a day replaces it"""
+    print("\n=== Testing Wearable Trends ===")
+    user_id, headers = login()
+    
+    # 2026-02-02 is a Monday; the second upload for that day is a later sync
+    for day, steps in [("2026-02-02", 4000), ("2026-02-03", 6000), ("2026-02-02", 5000)]:
+        payload = json.dumps({
+            "date": day,
+            "steps": steps,
+            "heart_rate": {"average": 70, "resting": 60, "max": 140 + steps // 1000},
+            "sleep": {"total_hours": 7.0},
+            "active_minutes": 30
+        })
+        response = requests.post(
+            f"{BASE_URL}/user/wearable",
+            json={"user_id": user_id, "wearable_data": payload},
+            headers=headers
+        )
+        assert response.status_code == 200
+    
+    response = requests.get(f"{BASE_URL}/user/wearable/trends", params={"user_id": user_id}, headers=headers)
+    print(f"Daily: {json.dumps(response.json(), indent=2)}")
+    assert response.status_code == 200
+    daily = {point["period_start"]: point for point in response.json()}
+    assert daily["2026-02-02"]["steps"] == 5000
+    assert daily["2026-02-03"]["steps"] == 6000
+    
+    response = requests.get(
+        f"{BASE_URL}/user/wearable/trends",
+        params={"user_id": user_id, "period": "weekly"},
+        headers=headers
+    )
+    print(f"Weekly: {json.dumps(response.json(), indent=2)}")
+    week = {point["period_start"]: point for point in response.json()}["2026-02-02"]
+    assert week["days"] == 2
+    assert week["steps"] == 11000
+    assert week["hr_max"] == 146
+
+
+
+def test_wearable_series():
+    """A metric series is downsampled to the requested number of points"""
+    print("\n=== Testing Wearable Series ===")
+    user_id, headers = login()
+    
+    for day in range(1, 29):
+        payload = json.dumps({"date": f"2025-02-{day:02d}", "steps": 1000 * day, "heart_rate": {"resting": 60}})
+        requests.post(
+            f"{BASE_URL}/user/wearable",
+            json={"user_id": user_id, "wearable_data": payload},
+            headers=headers
+        )
+    
+    response = requests.get(
+        f"{BASE_URL}/user/wearable/series",
+        params={"user_id": user_id, "metric": "steps", "from": "2025-02-01", "to": "2025-02-28", "points": 10},
+        headers=headers
+    )
+    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    assert response.status_code == 200
+    series = response.json()
+    assert series["total_points"] == 28
+    assert len(series["timestamps"]) == len(series["values"]) == 10
+    # The first and last points are always kept
+    assert series["timestamps"][0] == "2025-02-01" and series["values"][-1] == 28000
+
+
+def test_wearable_series_intraday():
+    """Intraday heart rate comes from each day's newest upload, 5 minutes apart"""
+    print("\n=== Testing Wearable Intraday Series ===")
+    user_id, headers = login()
+    
+    # A later upload of the same day replaces the earlier one
+    uploads = [("2025-03-01", [50] * 100), ("2025-03-01", [60] * 288), ("2025-03-02", [70] * 143 + [150] + [70] * 144)]
+    for day, samples in uploads:
+        payload = json.dumps({"date": day, "steps": 1000, "trends": {"hr_5min_samples": samples}})
+        requests.post(
+            f"{BASE_URL}/user/wearable",
+            json={"user_id": user_id, "wearable_data": payload},
+            headers=headers
+        )
+    
+    response = requests.get(
+        f"{BASE_URL}/user/wearable/series",
+        params={"user_id": user_id, "metric": "hr_5min", "from": "2025-03-01", "to": "2025-03-02", "points": 20},
+        headers=headers
+    )
+    print(f"Response: {json.dumps(response.json())[:300]}")
+    assert response.status_code == 200
+    series = response.json()
+    assert series["total_points"] == 576
+    assert len(series["timestamps"]) == len(series["values"]) == 20
+    assert series["timestamps"][0] == "2025-03-01T00:00:00" and series["timestamps"][-1] == "2025-03-02T23:55:00"
+    assert 50 not in series["values"]
+    # The spike is what LTTB keeps
+    assert series["values"][series["timestamps"].index("2025-03-02T11:55:00")] == 150
+
+
+
+def test_wearable_import_csv():
+    """A CSV export is imported in the background and rolled up per day"""
+    print("\n=== Testing Wearable CSV Import ===")
+    user_id, headers = login()
+    
+    export = "date,steps,heart_rate\n2024-05-01T08:00:00,3000,60\n2024-05-01T18:00:00,4000,80\n2024-05-02,5000,70\n"
+    response = requests.post(
+        f"{BASE_URL}/user/wearable/import",
+        params={"user_id": user_id},
+        files={"file": ("export.csv", export, "text/csv")},
+        headers=headers
+    )
+    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    
+    for _ in range(50):
+        job = requests.get(f"{BASE_URL}/user/wearable/import/{job_id}", headers=headers).json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.1)
+    print(f"Job: {json.dumps(job, indent=2)}")
+    assert job["status"] == "done"
+    assert job["records_read"] == 6 and job["days_imported"] == 2
+    
+    response = requests.get(
+        f"{BASE_URL}/user/wearable/trends",
+        params={"user_id": user_id, "limit": 2},
+        headers=headers
+    )
+    daily = {point["period_start"]: point for point in response.json()}
+    assert daily["2024-05-01"]["steps"] == 7000
+    assert daily["2024-05-01"]["hr_min"] == 60 and daily["2024-05-01"]["hr_max"] == 80
+
+
+
+def test_wearable_import_apple_health_sources():
+    """Steps and sleep recorded by both an iPhone and a Watch count once, and old days stay behind newer data"""
+    print("\n=== Testing Apple Health Import With Two Sources ===")
+    user_id, headers = login()
+    
+    # A recent sync from the app, made before the import
+    response = requests.post(
+        f"{BASE_URL}/user/wearable",
+        json={"user_id": user_id, "wearable_data": json.dumps({"date": "2026-01-08", "steps": 1234})},
+        headers=headers
+    )
+    assert response.status_code == 200
+    
+    def record(kind, source, start, end, value):
+        return (f'<Record type="{kind}" sourceName="{source}" unit="count" '
+                f'startDate="{start} +0000" endDate="{end} +0000" value="{value}"/>')
+    steps, sleep = "HKQuantityTypeIdentifierStepCount", "HKCategoryTypeIdentifierSleepAnalysis"
+    asleep = "HKCategoryValueSleepAnalysisAsleepCore"
+    export = "\n".join([
+        '<?xml version="1.0" encoding="UTF-8"?>', "<HealthData>",
+        # The same walks counted by both devices
+        record(steps, "iPhone", "2024-06-01 09:00:00", "2024-06-01 09:30:00", 4000),
+        record(steps, "iPhone", "2024-06-01 17:00:00", "2024-06-01 17:20:00", 3000),
+        record(steps, "Apple Watch", "2024-06-01 09:00:00", "2024-06-01 09:30:00", 4200),
+        record(steps, "Apple Watch", "2024-06-01 17:00:00", "2024-06-01 17:20:00", 3100),
+        # The same night, tracked by both
+        record(sleep, "Apple Watch", "2024-06-01 23:00:00", "2024-06-02 06:00:00", asleep),
+        record(sleep, "iPhone", "2024-06-01 23:30:00", "2024-06-02 06:00:00", asleep),
+        record(steps, "iPhone", "2024-06-02 10:00:00", "2024-06-02 10:30:00", 2500),
+        "</HealthData>",
+    ])
+    response = requests.post(
+        f"{BASE_URL}/user/wearable/import",
+        params={"user_id": user_id},
+        files={"file": ("export.xml", export, "text/xml")},
+        headers=headers
+    )
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    for _ in range(50):
+        job = requests.get(f"{BASE_URL}/user/wearable/import/{job_id}", headers=headers).json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.1)
+    assert job["status"] == "done", job
+    
+    response = requests.get(f"{BASE_URL}/user/wearable/trends", params={"user_id": user_id}, headers=headers)
+    daily = {point["period_start"]: point for point in response.json()}
+    print(f"2024-06-01: {daily['2024-06-01']}, 2024-06-02: {daily['2024-06-02']}")
+    assert daily["2024-06-01"]["steps"] == 7300
+    assert daily["2024-06-02"]["steps"] == 2500
+    assert daily["2024-06-02"]["sleep_hours"] == 7
+    
+    # The imported history is older than the app's own sync, which stays the latest upload
+    response = requests.get(f"{BASE_URL}/user/wearable/check", params={"user_id": user_id}, headers=headers)
+    print(f"Latest: {response.json()}")
+    assert response.json()["data"]["date"] == "2026-01-08"
+
+
+def test_wearable_frontend_payload():
+    """The app's own sync format is rolled up into every metric it carries"""
+    print("\n=== Testing Wearable Frontend Payload ===")
+    user_id, headers = login()
+    
+    with open(FRONTEND_PAYLOAD) as f:
+        payload = f.read()
+    response = requests.post(
+        f"{BASE_URL}/user/wearable",
+        json={"user_id": user_id, "wearable_data": payload},
+        headers=headers
+    )
+    assert response.status_code == 200
+    
+    response = requests.get(f"{BASE_URL}/user/wearable/trends", params={"user_id": user_id}, headers=headers)
+    print(f"Daily: {json.dumps(response.json(), indent=2)}")
+    assert response.status_code == 200
+    day = {point["period_start"]: point for point in response.json()}["2026-01-08"]
+    assert day["hr_min"] == 54
+    assert day["steps"] == 10452
+    assert day["sleep_hours"] == 7.25
+    
+    response = requests.get(
+        f"{BASE_URL}/user/wearable/series",
+        params={"user_id": user_id, "metric": "sleep_hours", "from": "2026-01-01", "to": "2026-01-31"},
+        headers=headers
+    )
+    print(f"Series: {json.dumps(response.json(), indent=2)}")
+    assert response.json()["values"] == [7.25]
+
+
+
+def test_wearable_duplicate_upload():
+    """Re-posting the same content is stored once and keeps the first upload time"""
+    print("\n=== Testing Wearable Duplicate Upload ===")
+    from app.database import SessionLocal
+    from app.models import WearableData
+    user_id, headers = login()
+    
+    payload = {"date": "2026-02-03", "heart_rate": {"min": 50, "max": 120}, "steps": 8000}
+    checks = []
+    # The same content again, with other key order and whitespace
+    for wearable_data in [json.dumps(payload), json.dumps(payload, indent=2, sort_keys=True)]:
+        response = requests.post(
+            f"{BASE_URL}/user/wearable",
+            json={"user_id": user_id, "wearable_data": wearable_data},
+            headers=headers
+        )
+        assert response.status_code == 200
+        response = requests.get(f"{BASE_URL}/user/wearable/check", params={"user_id": user_id}, headers=headers)
+        checks.append(response.json()["created_at"])
+        time.sleep(0.1)
+    
+    print(f"Latest upload after each post: {checks}")
+    assert checks[0] is not None and checks[1] == checks[0]
+    db = SessionLocal()
+    try:
+        assert db.query(WearableData).filter(WearableData.user_id == user_id).count() == 1
+    finally:
+        db.close()
+
+
+def test_compact_wearable_duplicates():
+    """Rows stored before content hashes existed are hashed and collapsed to the first upload"""
+    print("\n=== Testing Wearable Duplicate Compaction ===")
+    import tempfile
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+    from app.database import Base
+    from app.models import User, WearableData
+    from app.utils.wearable_dedup import compact_wearable_duplicates
+    
+    with tempfile.TemporaryDirectory() as directory:
+        # A database as it was before the unique index was built
+        engine = create_engine(f"sqlite:///{directory}/legacy.db")
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(text("DROP INDEX ux_wearable_data_user_hash"))
+        db = sessionmaker(bind=engine)()
+        try:
+            db.add_all([User(id=1, device_id="legacy_1"), User(id=2, device_id="legacy_2")])
+            db.add_all([
+                WearableData(user_id=1, wearable_data='{"steps": 1, "date": "2026-02-03"}'),
+                WearableData(user_id=1, wearable_data='{"date": "2026-02-03", "steps": 1}'),
+                WearableData(user_id=1, wearable_data='{"date": "2026-02-04", "steps": 2}'),
+                WearableData(user_id=2, wearable_data='{"date": "2026-02-03", "steps": 1}'),
+                WearableData(user_id=2, wearable_data='{"date": "2026-02-03", "steps": 1}'),
+            ])
+            db.commit()
+            
+            hashed, deleted = compact_wearable_duplicates(db)
+            print(f"Hashed: {hashed}, deleted: {deleted}")
+            assert (hashed, deleted) == (5, 2)
+            kept = db.query(WearableData.id, WearableData.user_id).order_by(WearableData.id).all()
+            assert [(row.id, row.user_id) for row in kept] == [(1, 1), (3, 1), (4, 2)]
+            assert compact_wearable_duplicates(db) == (0, 0)
+        finally:
+            db.close()
+            engine.dispose()
+
 if __name__ == "__main__":
     test_wearable_endpoints()
+    test_wearable_trends()
+    test_wearable_series()
+    test_wearable_series_intraday()
+    test_wearable_import_csv()
+    test_wearable_import_apple_health_sources()
+    test_wearable_frontend_payload()
+    test_wearable_duplicate_upload()
+    test_compact_wearable_duplicates()